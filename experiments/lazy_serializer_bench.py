@@ -0,0 +1,107 @@
+from __future__ import print_function
+
+"""
+This script compares `MsgpackSerializer.loads` with
+`MsgpackLazySerializer.loads` on wide records.
+
+Each record is a dict with `FIELDS` fields, a third of which are datetimes,
+dates or Decimals (which are `ExtType`s in msgpack), plus a few nested dicts.
+For each serializer it times:
+
+* loading the records only
+* loading the records and reading `TOUCHED` fields of each
+* loading the records and reading every field
+
+    python lazy_serializer_bench.py
+"""
+
+from dogpile_backend_redis_advanced.cache.serializers import MsgpackLazySerializer
+from dogpile_backend_redis_advanced.cache.serializers import MsgpackSerializer
+
+import datetime
+import decimal
+import timeit
+
+
+# ==============================================================================
+
+
+RECORDS = 1000
+FIELDS = 200
+TOUCHED = 5
+REPEAT = 5
+
+# ==============================================================================
+
+
+def make_record(i):
+    record = {}
+    for f in range(FIELDS):
+        kind = f % 6
+        if kind == 0:
+            record["f%s" % f] = datetime.datetime(2020, 1, 1) + datetime.timedelta(
+                seconds=i * f
+            )
+        elif kind == 1:
+            record["f%s" % f] = datetime.date(2020, 1, 1) + datetime.timedelta(days=f)
+        elif kind == 2:
+            record["f%s" % f] = decimal.Decimal("%s.%02d" % (i, f % 100))
+        elif kind == 3:
+            record["f%s" % f] = {"id": f, "updated": datetime.datetime(2021, 1, 1)}
+        else:
+            record["f%s" % f] = "value %s %s" % (i, f)
+    return record
+
+
+def run():
+    eager = MsgpackSerializer()
+    lazy = MsgpackLazySerializer()
+    encoded = [eager.dumps(make_record(i)) for i in range(RECORDS)]
+    assert lazy.loads(encoded[0]) == eager.loads(encoded[0])
+    touched = ["f%s" % f for f in range(0, FIELDS, FIELDS // TOUCHED)][:TOUCHED]
+    fields = ["f%s" % f for f in range(FIELDS)]
+
+    def loads_only(loads):
+        for data in encoded:
+            loads(data)
+
+    def loads_touched(loads):
+        for data in encoded:
+            record = loads(data)
+            for f in touched:
+                record[f]
+
+    def loads_all(loads):
+        for data in encoded:
+            record = loads(data)
+            for f in fields:
+                record[f]
+
+    results = []
+    for name, fn in (
+        ("loads", loads_only),
+        ("loads + %s fields" % TOUCHED, loads_touched),
+        ("loads + all fields", loads_all),
+    ):
+        _eager = min(timeit.repeat(lambda: fn(eager.loads), number=1, repeat=REPEAT))
+        _lazy = min(timeit.repeat(lambda: fn(lazy.loads), number=1, repeat=REPEAT))
+        results.append((name, _eager, _lazy))
+    return results
+
+
+if __name__ == "__main__":
+    print(
+        "%s records of %s fields; best of %s, in ms per record"
+        % (RECORDS, FIELDS, REPEAT)
+    )
+    print("    %-22s %10s %10s %8s" % ("", "eager", "lazy", "speedup"))
+    for name, _eager, _lazy in run():
+        print(
+            "    %-22s %10.4f %10.4f %7.2fx"
+            % (
+                name,
+                _eager * 1000 / RECORDS,
+                _lazy * 1000 / RECORDS,
+                _eager / _lazy,
+            )
+        )
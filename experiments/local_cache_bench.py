@@ -0,0 +1,150 @@
+from __future__ import print_function
+
+"""
+This script compares `dogpile_backend_redis_advanced` with
+`dogpile_backend_redis_advanced_local` on a read-heavy workload.
+
+It will spin-up a throwaway Redis instance, prime and warm it, and then have
+several threads read hot keys through a region while a writer thread updates a
+few of them (so the local cache must be invalidated).
+
+For each backend the per-read latency percentiles and the number of commands
+Redis processed per second are printed.
+
+    REDIS_BIN=/path/to/redis-server python local_cache_bench.py
+"""
+
+from dogpile.cache import make_region
+import dogpile_backend_redis_advanced  # noqa
+
+import redis
+
+import os
+import random
+import subprocess
+import threading
+import time
+
+
+# ==============================================================================
+
+
+REDIS_HOST = "127.0.0.1"
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6390"))
+REDIS_BIN = os.getenv("REDIS_BIN", "redis-server")
+
+KEYS = 5000
+HOT_KEYS = 500
+READERS = 8
+READS_PER_READER = 20000
+WRITES_PER_SECOND = 200
+
+# ==============================================================================
+
+
+def make_bench_region(backend):
+    return make_region().configure(
+        backend,
+        expiration_time=3600,
+        arguments={
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "redis_expiration_time": 3600,
+            "local_cache_max_entries": KEYS,
+            "local_cache_prefixes": ["bench-"],
+        },
+    )
+
+
+def percentile(values, pct):
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def run(backend):
+    region = make_bench_region(backend)
+    region.set_multi(
+        {"bench-%s" % i: {"id": i, "name": "user %s" % i} for i in range(KEYS)}
+    )
+    if backend == "dogpile_backend_redis_advanced_local":
+        # the listener starts on first use
+        region.get("bench-0")
+        while not region.backend.local_cache.enabled:
+            time.sleep(0.01)
+    # warm-up, untimed
+    region.get_multi(["bench-%s" % i for i in range(KEYS)])
+    if backend == "dogpile_backend_redis_advanced_local":
+        # only count the timed reads
+        region.backend.local_cache.hits = region.backend.local_cache.misses = 0
+
+    client = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=0)
+    latencies = []
+    _lock = threading.Lock()
+    _done = threading.Event()
+
+    def reader():
+        _rand = random.Random()
+        _latencies = []
+        for _ in range(READS_PER_READER):
+            # 90% of reads go to the hot keys
+            if _rand.random() < 0.9:
+                key = "bench-%s" % _rand.randrange(HOT_KEYS)
+            else:
+                key = "bench-%s" % _rand.randrange(KEYS)
+            _start = time.perf_counter()
+            region.get(key)
+            _latencies.append(time.perf_counter() - _start)
+        with _lock:
+            latencies.extend(_latencies)
+
+    def writer():
+        _rand = random.Random()
+        while not _done.wait(1.0 / WRITES_PER_SECOND):
+            i = _rand.randrange(HOT_KEYS)
+            region.set("bench-%s" % i, {"id": i, "name": "renamed %s" % i})
+
+    commands_start = client.info("stats")["total_commands_processed"]
+    time_start = time.time()
+    _writer = threading.Thread(target=writer)
+    _writer.start()
+    readers = [threading.Thread(target=reader) for i in range(READERS)]
+    for t in readers:
+        t.start()
+    for t in readers:
+        t.join()
+    _done.set()
+    _writer.join()
+    elapsed = time.time() - time_start
+    commands = client.info("stats")["total_commands_processed"] - commands_start
+
+    latencies.sort()
+    result = {
+        "reads/sec": len(latencies) / elapsed,
+        "redis ops/sec": commands / elapsed,
+        "p50 ms": percentile(latencies, 50) * 1000,
+        "p99 ms": percentile(latencies, 99) * 1000,
+        "p99.9 ms": percentile(latencies, 99.9) * 1000,
+    }
+    if backend == "dogpile_backend_redis_advanced_local":
+        result["local hits"] = region.backend.local_cache.hits
+        result["local misses"] = region.backend.local_cache.misses
+    client.flushdb()
+    return result
+
+
+if __name__ == "__main__":
+    redis_server = subprocess.Popen(
+        [REDIS_BIN, "--port", str(REDIS_PORT), "--save", "", "--appendonly", "no"],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        time.sleep(0.5)
+        for backend in (
+            "dogpile_backend_redis_advanced",
+            "dogpile_backend_redis_advanced_local",
+        ):
+            print(backend)
+            for k, v in sorted(run(backend).items()):
+                print("    %-14s %12.3f" % (k, v))
+    finally:
+        redis_server.kill()
@@ -0,0 +1,100 @@
+from __future__ import print_function
+
+"""
+This script looks for the batch size at which `ParallelLoader` starts to beat
+loading a `get_multi` batch in the calling thread.
+
+For each codec, batches of increasing size are loaded serially, on a thread
+pool and on a process pool, and the time per batch is printed.  The first
+size at which a pool wins is the crossover; use it for
+`parallel_loads_threshold`.
+
+    WORKERS=8 python parallel_loads_bench.py
+
+A pool can not win with fewer CPUs than workers; on a single CPU this only
+measures the overhead of the pools.
+"""
+
+from dogpile_backend_redis_advanced.cache.compression import Compressor
+from dogpile_backend_redis_advanced.cache.parallel import ParallelLoader
+from dogpile_backend_redis_advanced.cache.parallel import shutdown_pools
+from dogpile_backend_redis_advanced.cache.serializers import get_serializer
+
+import datetime
+import os
+import pickle
+import timeit
+
+
+# ==============================================================================
+
+
+SIZES = (1000, 2500, 5000, 10000, 25000, 50000)
+WORKERS = int(os.getenv("WORKERS", "0")) or max(2, os.cpu_count() or 1)
+REPEAT = 3
+
+# ==============================================================================
+
+
+def make_value(i):
+    return {
+        "id": i,
+        "email": "user-%s@example.com" % i,
+        "created": datetime.datetime(2020, 1, 1) + datetime.timedelta(seconds=i),
+        "bio": "lorem ipsum dolor sit amet " * 40,
+        "roles": ["reader", "writer"],
+    }
+
+
+def codecs():
+    msgpack_loads, msgpack_dumps = get_serializer("msgpack")
+    zlib = Compressor("zlib", threshold=0)
+    lzma = Compressor("lzma", threshold=0)
+    return (
+        ("pickle", pickle.loads, pickle.dumps),
+        ("msgpack", msgpack_loads, msgpack_dumps),
+        ("zlib+pickle", zlib.wrap_loads(pickle.loads), zlib.wrap_dumps(pickle.dumps)),
+        ("lzma+pickle", lzma.wrap_loads(pickle.loads), lzma.wrap_dumps(pickle.dumps)),
+    )
+
+
+def run():
+    serial = ParallelLoader("thread", threshold=max(SIZES) + 1)
+    thread = ParallelLoader("thread", threshold=0, workers=WORKERS)
+    process = ParallelLoader("process", threshold=0, workers=WORKERS)
+    values = [make_value(i) for i in range(max(SIZES))]
+    results = []
+    for name, loads, dumps in codecs():
+        data = [dumps(v) for v in values]
+        # warm up the pools
+        thread.map(loads, data[:100])
+        process.map(loads, data[:100])
+        for size in SIZES:
+            batch = data[:size]
+            timings = [
+                min(
+                    timeit.repeat(
+                        lambda: loader.map(loads, batch), number=1, repeat=REPEAT
+                    )
+                )
+                for loader in (serial, thread, process)
+            ]
+            results.append((name, size, timings))
+    shutdown_pools()
+    return results
+
+
+if __name__ == "__main__":
+    print(
+        "%s CPUs, %s workers; best of %s, in ms per batch"
+        % (os.cpu_count(), WORKERS, REPEAT)
+    )
+    print(
+        "    %-12s %7s %10s %10s %10s"
+        % ("codec", "values", "serial", "thread", "process")
+    )
+    for name, size, timings in run():
+        print(
+            "    %-12s %7s %10.1f %10.1f %10.1f"
+            % ((name, size) + tuple(t * 1000 for t in timings))
+        )
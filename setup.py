@@ -89,6 +89,7 @@ setup(
     install_requires=install_requires,
     tests_require=tests_require,
     extras_require={
+        "msgpack": ["msgpack>=1.0"],
         "testing": testing_extras,
     },
     cmdclass={"test": PyTest},
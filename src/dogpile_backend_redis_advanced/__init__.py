@@ -13,3 +13,23 @@ register_backend(
     "dogpile_backend_redis_advanced.cache.backends.redis_advanced",
     "RedisAdvancedHstoreBackend",
 )
+register_backend(
+    "dogpile_backend_redis_advanced_local",
+    "dogpile_backend_redis_advanced.cache.backends.redis_advanced",
+    "RedisAdvancedLocalCacheBackend",
+)
+register_backend(
+    "dogpile_backend_redis_advanced_cluster",
+    "dogpile_backend_redis_advanced.cache.backends.redis_advanced",
+    "RedisAdvancedClusterBackend",
+)
+register_backend(
+    "dogpile_backend_redis_advanced_asyncio",
+    "dogpile_backend_redis_advanced.cache.backends.redis_advanced",
+    "RedisAdvancedAsyncBackend",
+)
+register_backend(
+    "dogpile_backend_redis_advanced_hstore_asyncio",
+    "dogpile_backend_redis_advanced.cache.backends.redis_advanced",
+    "RedisAdvancedHstoreAsyncBackend",
+)
@@ -0,0 +1,125 @@
+"""
+Auto-Pipelining
+---------------
+
+Merges single-key reads made by different threads into one multi-key fetch.
+
+The first thread to read starts a batch.  If other reads are in progress it
+waits up to ``max_wait`` seconds, or until the batch holds ``max_batch`` keys,
+for more threads to add their keys; then it fetches the whole batch at once --
+with one ``MGET``, or the backend's pipelined `get_multi` -- and hands every
+thread its own value.  A read made while no other read is in progress is sent
+at once, so a lightly loaded process pays no extra latency.
+"""
+# stdlib
+import functools
+import threading
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+__all__ = ("AutoPipeline",)
+
+
+class _Batch(object):
+    """the keys of a batch, and once it is fetched, their values"""
+
+    __slots__ = ("keys", "full", "done", "values", "error")
+
+    def __init__(self):
+        self.keys: List[Any] = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.values: List[Any] = []
+        self.error: Optional[BaseException] = None
+
+
+class AutoPipeline(object):
+    """Batches concurrent calls of `get` into calls of ``fetch``, which takes a
+    list of keys and returns their values in order.
+
+    The counters are updated under the lock:
+
+    * ``batches`` - calls of ``fetch``
+    * ``reads`` - calls of `get`; ``reads / batches`` is the mean batch size
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[List[Any]], List[Any]],
+        max_wait: float = 0.0005,
+        max_batch: int = 100,
+    ):
+        if max_batch < 1:
+            raise ValueError("`max_batch` must be at least 1")
+        self.fetch = fetch
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._batch: Optional[_Batch] = None
+        # the threads in `get`
+        self._active = 0
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.batches = 0
+        self.reads = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"batches": self.batches, "reads": self.reads}
+
+    def get(self, key: Any) -> Any:
+        """returns the value of `key`, fetched in a batch"""
+        _wait = False
+        with self._lock:
+            self._active += 1
+            batch = self._batch
+            _leader = batch is None
+            if batch is None:
+                batch = self._batch = _Batch()
+                # alone, there is nobody to wait for
+                _wait = self._active > 1
+            index = len(batch.keys)
+            batch.keys.append(key)
+            if len(batch.keys) >= self.max_batch:
+                self._batch = None
+                batch.full.set()
+        try:
+            if _leader:
+                if _wait:
+                    batch.full.wait(self.max_wait)
+                with self._lock:
+                    if self._batch is batch:
+                        self._batch = None
+                    self.batches += 1
+                    self.reads += len(batch.keys)
+                try:
+                    batch.values = self.fetch(batch.keys)
+                except BaseException as exc:
+                    batch.error = exc
+                finally:
+                    batch.done.set()
+            else:
+                batch.done.wait()
+        finally:
+            with self._lock:
+                self._active -= 1
+        if batch.error is not None:
+            raise batch.error
+        return batch.values[index]
+
+    def wrap_get(self, get: Callable) -> Callable:
+        """a replacement for a backend's `get`, with the same signature"""
+        _get = self.get
+
+        @functools.wraps(get)
+        def auto_pipeline_get(key):
+            return _get(key)
+
+        return auto_pipeline_get
@@ -9,26 +9,68 @@ from __future__ import absolute_import
 
 # stdlib
 from collections import defaultdict
+import functools
+import inspect
+import os
 import pickle
+import threading
+import time
+from types import MappingProxyType
 from typing import Any
 from typing import Callable
 from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import Mapping
 from typing import Optional
 from typing import Tuple
+from typing import TYPE_CHECKING
+import uuid
+import zlib
 
 # pypi
+from dogpile.cache.api import CachedValue
 from dogpile.cache.api import NO_VALUE
 from dogpile.cache.backends.redis import RedisBackend
-
-# only needed for testing
-# import redis
+from dogpile.cache.region import value_version
+
+# local
+from ..auto_pipeline import AutoPipeline
+from ..compression import Compressor
+from ..local_cache import InvalidationListener
+from ..local_cache import LocalCache
+from ..parallel import ParallelLoader
+from ..serializers import get_serializer
+from ..serializers import LazyCachedValue
+from ..single_flight import SingleFlight
+from ..xfetch import XFetch
+
+if TYPE_CHECKING:  # imported at runtime by the backends' `_imports`
+    import redis
+    import redis.asyncio as redis_asyncio
+
+    from ..locks import AsyncMultiLock
+    from ..locks import fence_key
+    from ..locks import held_fence
+    from ..locks import LeaseLock
+    from ..locks import MultiLock
+    from ..locks import NotifyLock
+    from ..locks import Semaphore
+    from ..locks import SemaphoreMutex
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 
-__all__ = ("RedisAdvancedBackend", "RedisAdvancedHstoreBackend")
+__all__ = (
+    "RedisAdvancedBackend",
+    "RedisAdvancedHstoreBackend",
+    "RedisAdvancedLocalCacheBackend",
+    "RedisAdvancedClusterBackend",
+    "RedisAdvancedAsyncBackend",
+    "RedisAdvancedHstoreAsyncBackend",
+)
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -68,6 +110,260 @@ def default_dumps_factory() -> Callable:
 default_dumps = default_dumps_factory()
 
 
+def hash_bucket_factory(buckets: int, prefix: str) -> Callable:
+    """
+    returns a function that maps a plain key onto a `(bucket, field)` tuple,
+    Instagram-style.  the bucket is chosen with a stable hash (crc32), so every
+    process maps a key to the same bucket.  tuple keys are returned as-is.
+    """
+    _crc32 = zlib.crc32
+
+    def hash_bucket(key):
+        if isinstance(key, tuple):
+            return key
+        return (
+            "%s%s" % (prefix, _crc32(str(key).encode("utf-8")) % buckets),
+            key,
+        )
+
+    return hash_bucket
+
+
+def raw_metadata() -> Mapping:
+    """
+    the metadata of values loaded in `raw_mode`: stamped now, and read-only, as
+    a single instance is shared by every value in a batch.
+    """
+    return MappingProxyType({"ct": time.time(), "v": value_version})
+
+
+# `CachedValue.__new__` only adds a Python-level call around this
+_new_cached_value = tuple.__new__
+
+
+def raw_dumps_factory(dumps: Callable) -> Callable:
+    """
+    wraps `dumps` to only serialize the payload of a `CachedValue`, leaving
+    expiry to Redis.
+    """
+
+    def raw_dumps(value):
+        if isinstance(value, CachedValue):
+            value = value.payload
+        return dumps(value)
+
+    return raw_dumps
+
+
+def raw_dumps_multi_factory(dumps_multi: Callable) -> Callable:
+    """
+    wraps `dumps_multi` to only serialize the payloads, like `raw_dumps_factory`
+    """
+
+    def raw_dumps_multi(values):
+        return dumps_multi(
+            [v.payload if isinstance(v, CachedValue) else v for v in values]
+        )
+
+    return raw_dumps_multi
+
+
+def raw_loads_factory(loads: Callable) -> Callable:
+    """
+    wraps `loads` to rebuild the `CachedValue` of a payload written by
+    `raw_dumps_factory`, as if it was created now.
+    """
+
+    def raw_loads(value):
+        return _new_cached_value(CachedValue, (loads(value), raw_metadata()))
+
+    return raw_loads
+
+
+def _chunks(items: List, size: Optional[int]) -> List[List]:
+    """
+    splits `items` into lists of at most `size` items; a `size` of `None`
+    does not split at all.
+    """
+    if not size or len(items) <= size:
+        return [items]
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def batched_get_multi(get_multi: Callable) -> Callable:
+    """
+    wraps a backend's `get_multi` so each distinct key is only fetched once,
+    and the keys are fetched in chunks of at most `multi_batch_size`, one after
+    another.  the values are returned for `keys`, in order.
+    works on both regular and `async` methods.
+    """
+
+    def _prepare(keys):
+        _unique = list(dict.fromkeys(keys))
+        if len(_unique) == len(keys):
+            _unique = keys
+        return _unique
+
+    def _restore(keys, _unique, values):
+        if _unique is keys:
+            return values
+        _values = dict(zip(_unique, values))
+        return [_values[k] for k in keys]
+
+    if inspect.iscoroutinefunction(get_multi):
+
+        @functools.wraps(get_multi)
+        async def wrapped_async(self, keys):
+            if not keys:
+                return []
+            _unique = _prepare(keys)
+            values: List = []
+            for _chunk in _chunks(_unique, self.multi_batch_size):
+                values.extend(await get_multi(self, _chunk))
+            return _restore(keys, _unique, values)
+
+        return wrapped_async
+
+    @functools.wraps(get_multi)
+    def wrapped(self, keys):
+        if not keys:
+            return []
+        _unique = _prepare(keys)
+        values: List = []
+        for _chunk in _chunks(_unique, self.multi_batch_size):
+            values.extend(get_multi(self, _chunk))
+        return _restore(keys, _unique, values)
+
+    return wrapped
+
+
+def batched_set_multi(set_multi: Callable) -> Callable:
+    """
+    wraps a backend's `set_multi` so the mapping is written in chunks of at
+    most `multi_batch_size` keys, one after another.
+    works on both regular and `async` methods.
+    """
+
+    if inspect.iscoroutinefunction(set_multi):
+
+        @functools.wraps(set_multi)
+        async def wrapped_async(self, mapping):
+            size = self.multi_batch_size
+            if not size or len(mapping) <= size:
+                return await set_multi(self, mapping)
+            _items = list(mapping.items())
+            for _chunk in _chunks(_items, size):
+                await set_multi(self, dict(_chunk))
+
+        return wrapped_async
+
+    @functools.wraps(set_multi)
+    def wrapped(self, mapping):
+        size = self.multi_batch_size
+        if not size or len(mapping) <= size:
+            return set_multi(self, mapping)
+        _items = list(mapping.items())
+        for _chunk in _chunks(_items, size):
+            set_multi(self, dict(_chunk))
+
+    return wrapped
+
+
+# KEYS: the hash names
+# ARGV: the expiry, then for each hash: a field count and the field/value pairs
+# each hash is written, and the expiry is only set if the hash is new.
+LUA_HSET_EXPIRE_NEW = """
+local ttl = tonumber(ARGV[1])
+local idx = 2
+for _, name in ipairs(KEYS) do
+    local n = tonumber(ARGV[idx])
+    local created = redis.call('EXISTS', name) == 0
+    for j = idx + 1, idx + n * 2, 2 do
+        redis.call('HSET', name, ARGV[j], ARGV[j + 1])
+    end
+    if created and ttl > 0 then
+        redis.call('EXPIRE', name, ttl)
+    end
+    idx = idx + 1 + n * 2
+end
+return #KEYS
+"""
+
+
+# KEYS[1]: the value, a string or a hash; KEYS[2]: its lock
+# ARGV[1]: the hash field, if ARGV[2] is '1'; ARGV[3]: the lock token;
+# ARGV[4]: the lock timeout in milliseconds, or 0
+# returns {1, value} if the value exists, or else {0, 1} if the lock was
+# acquired and {0, 0} if it is held elsewhere.
+LUA_GET_OR_LOCK = """
+local value
+if ARGV[2] == '1' then
+    value = redis.call('HGET', KEYS[1], ARGV[1])
+else
+    value = redis.call('GET', KEYS[1])
+end
+if value then
+    return {1, value}
+end
+local acquired
+if ARGV[4] ~= '0' then
+    acquired = redis.call('SET', KEYS[2], ARGV[3], 'NX', 'PX', ARGV[4])
+else
+    acquired = redis.call('SET', KEYS[2], ARGV[3], 'NX')
+end
+if acquired then
+    return {0, 1}
+end
+return {0, 0}
+"""
+
+
+# KEYS[1]: the value, a string or a hash; KEYS[2]: the fencing counter of its
+# lock
+# ARGV[1]: the writer's fencing token; ARGV[2]: the hash field, if ARGV[3] is
+# '1'; ARGV[4]: the value; ARGV[5]: the expiry in seconds, or 0; ARGV[6]: when
+# to set the expiry of a hash: 'always', 'new' or 'never'
+# returns 0 if the lock has been acquired since the token was drawn, or else
+# writes the value and returns 1
+LUA_FENCED_SET = """
+local latest = tonumber(redis.call('GET', KEYS[2]) or '0')
+if latest > tonumber(ARGV[1]) then
+    return 0
+end
+local ttl = tonumber(ARGV[5])
+if ARGV[3] == '1' then
+    local created = redis.call('EXISTS', KEYS[1]) == 0
+    redis.call('HSET', KEYS[1], ARGV[2], ARGV[4])
+    if ttl > 0 and (ARGV[6] == 'always' or (ARGV[6] == 'new' and created)) then
+        redis.call('EXPIRE', KEYS[1], ttl)
+    end
+elseif ttl > 0 then
+    redis.call('SET', KEYS[1], ARGV[4], 'EX', ttl)
+else
+    redis.call('SET', KEYS[1], ARGV[4])
+end
+return 1
+"""
+
+
+def hash_script_args(
+    buckets: Dict[str, Dict], expiration_time: Optional[int]
+) -> Tuple[List, List]:
+    """
+    flattens a mapping of `{name: {field: value}}` into the KEYS and ARGV
+    expected by `LUA_HSET_EXPIRE_NEW`
+    """
+    names = []
+    args: List = [expiration_time or 0]
+    for name, fields in buckets.items():
+        names.append(name)
+        args.append(len(fields))
+        for field, value in fields.items():
+            args.append(field)
+            args.append(value)
+    return names, args
+
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 
@@ -127,6 +423,13 @@ class RedisAdvancedBackend(RedisBackend):
      Defaults to ``lambda v: pickle.dumps(v, picke.HIGHEST_PROTOCOL)``
      .. versionadded:: 0.0.1
 
+    :param serializer: string, default `None`.  Selects the ``loads`` and
+     ``dumps`` by name instead: ``"pickle"``, ``"msgpack"`` (keeps the
+     `CachedValue` envelope) or ``"msgpack_raw"`` (stores only the payload;
+     see ``serializers.MsgpackRawSerializer``).  Can not be combined with
+     ``loads`` or ``dumps``.
+     .. versionadded:: 0.5.0
+
     :param lock_class: class, class to wrap a lock mutex in.  A variety of
      factors can cause the distributed lock to disappear or become invalidated
      after a PUT and before a RELEASE.  By wrapping a mutex in a custom proxy
@@ -163,48 +466,670 @@ class RedisAdvancedBackend(RedisBackend):
      the backend uses `_lock`.
      .. versionadded:: 0.1.0
 
+    :param lock_notify: boolean, default `False`.  If `True`, the distributed
+     lock is a `locks.NotifyLock`: instead of retrying every ``lock_sleep``
+     seconds, a waiter blocks with ``BLPOP`` until the holder releases the
+     lock, or until the lock would expire.  Each blocked waiter holds a
+     connection from the pool.  Requires Redis 6.0 or later.  Not supported
+     by the asyncio backends.
+     .. versionadded:: 0.5.0
+
+    :param lock_lease: boolean, default `False`.  If `True`, the distributed
+     lock is a `locks.LeaseLock`: while it is held, a watchdog thread resets
+     its ttl to ``lock_timeout`` every ``lock_lease_interval`` seconds, so a
+     creator that runs longer than ``lock_timeout`` keeps the lock.  Each
+     acquisition draws a fencing token, and a `set` -- or a value of a
+     `set_multi` -- made while holding the lock is dropped, and counted in
+     ``lease_rejected``, if the lock has been acquired by someone else since.  Requires ``lock_timeout``; can not
+     be used with ``lock_notify``, or by the asyncio backends.
+     .. versionadded:: 0.5.0
+
+    :param lock_lease_interval: float, default `None`.  How often a lease is
+     extended, in seconds; by default a third of ``lock_timeout``.
+     .. versionadded:: 0.5.0
+
+    :param lock_semaphore: int, default `None`.  If set, the mutex of
+     `get_mutex` also takes one of this many slots of a `locks.Semaphore`
+     shared by every process that uses ``lock_semaphore_name``, so at most
+     this many regenerations run at once.  A waiter that finds no free slot
+     is served the stale value when dogpile has one, and otherwise waits for
+     a slot.  A slot is freed on release, or after ``lock_timeout`` seconds.
+     Requires ``distributed_lock`` and ``lock_timeout``; can not be used with
+     ``lock_lease``, or by the asyncio backends.
+     .. versionadded:: 0.5.0
+
+    :param lock_semaphore_name: string, default `_lock_semaphore`.  The
+     sorted set holding the semaphore's slots.  Regions that should share a
+     limit use the same name.
+     .. versionadded:: 0.5.0
+
+    :param multi_batch_size: int, default `None`.  If set, `get_multi` and
+     `set_multi` are split into chunks of at most this many keys, which are
+     sent one after another.  A large warm-up then no longer blocks the server
+     with a single huge `MGET` or pipeline, or builds up huge buffers on the
+     client and the server.  Keys that appear more than once in a `get_multi`
+     are only fetched once, whether or not this is set.
+     .. versionadded:: 0.5.0
+
+    :param compression: string, default `None`.  If set to ``"zlib"``,
+     ``"lzma"`` or ``"zdict"``, values are compressed after `dumps` and
+     decompressed before `loads`.  Each value gets a two-byte header starting
+     with ``\xc1``, so compressed, uncompressed, and previously written values
+     can be read side by side; a `dumps` whose values can start with that byte
+     raises a `ValueError`.  Counters for tuning are available through
+     ``backend.compressor.stats()``.
+     .. versionadded:: 0.5.0
+
+    :param compression_threshold: int, default `None`.  Serialized values
+     shorter than this are not compressed.  `None` uses 1024 bytes, or 64 bytes
+     for ``"zdict"``.
+     .. versionadded:: 0.5.0
+
+    :param compression_level: int, default `None`.  The zlib level or lzma
+     preset; `None` uses the codec's default.
+     .. versionadded:: 0.5.0
+
+    :param compression_dictionaries: dict, default `None`.  zlib preset
+     dictionaries by id (0-255), required for ``"zdict"``.  Values record the
+     id of the dictionary they were written with, so dictionaries can be
+     rotated without a flush by adding a new id.  See
+     `compression.dictionary_from_scan` to build one.
+     .. versionadded:: 0.5.0
+
+    :param compression_dictionary_id: int, default `None`.  The dictionary new
+     values are written with; `None` uses the highest id.
+     .. versionadded:: 0.5.0
+
+    :param raw_mode: boolean, default `False`.  If `True`, only the payload of
+     dogpile's `CachedValue` is passed to ``dumps``, and Redis's TTL is the
+     only expiry, so ``redis_expiration_time`` is required.  When loading, the
+     `CachedValue` is rebuilt as if it was just created; every value of a
+     `get_multi` shares a single timestamp and a single read-only metadata
+     mapping.  Can not be combined with the ``msgpack_raw`` or ``envelope``
+     serializers, which handle the `CachedValue` themselves.
+     .. versionadded:: 0.5.0
+
+    :param lazy_loads: boolean, default `False`.  If `True`, `get_multi`
+     returns `serializers.LazyCachedValue` proxies, which only deserialize
+     their payload on first access.  Their metadata is read without touching
+     the payload, so values that dogpile discards as expired are never
+     deserialized.  Requires ``raw_mode``, or a serializer that can read the
+     metadata on its own -- the ``envelope`` serializers, or any ``loads``
+     bound to an object with a ``loads_lazy`` method.  With an ``envelope``
+     serializer, compressed values are still decompressed up front.  Note that
+     `CacheRegion.get_multi` reads the payload of every value it returns, so
+     through a region the savings are on the values it discards.
+     .. versionadded:: 0.5.0
+
+    :param loads_multi: function, default `None`.  Deserializes a batch:
+     takes a list of serialized values, and returns the list of loaded values.
+     If set, the multi-key fetches use it instead of calling ``loads`` once per
+     value, so a codec can amortize its setup across the batch.  If not set,
+     it is taken from the object ``loads`` is bound to, if that has a
+     ``loads_multi`` method (like `serializers.MsgpackRawSerializer`).  It is
+     wrapped like ``loads`` for ``compression`` and ``raw_mode``, and is not
+     used with ``lazy_loads``.
+     .. versionadded:: 0.5.0
+
+    :param dumps_multi: function, default `None`.  Serializes a batch for
+     `set_multi`, in all backends; the counterpart of ``loads_multi``, and
+     likewise taken from the object ``dumps`` is bound to if not set (like
+     the msgpack serializers, which then look up their `Packer` once).
+     .. versionadded:: 0.5.0
+
+    :param parallel_loads: string, default `None`.  If set to ``"thread"`` or
+     ``"process"``, `get_multi` batches of at least
+     ``parallel_loads_threshold`` values are split into slices that are
+     deserialized on a shared pool, and joined back in order.  A thread pool
+     helps when most of the time is spent in code that releases the GIL --
+     e.g. decompressing large ``compression`` values; a process pool also
+     helps pure-Python serializers, but requires a picklable ``loads``, and
+     was 2-4x slower than serial loading in the only benchmark so far, which
+     ran on one CPU; treat it as experimental.  Can not be combined with
+     ``lazy_loads``, or used by the asyncio backends.  See
+     `parallel.ParallelLoader`.
+     .. versionadded:: 0.5.0
+
+    :param parallel_loads_threshold: int, default `10000`.  Smaller batches are
+     deserialized in the calling thread.  The default has not been measured
+     on a multi-core host; find the crossover with
+     ``experiments/parallel_loads_bench.py``.
+     .. versionadded:: 0.5.0
+
+    :param parallel_loads_workers: int, default `None`.  The size of the pool;
+     `None` uses the number of CPUs.
+     .. versionadded:: 0.5.0
+
+    :param auto_pipeline: boolean, default `False`.  If `True`, `get` calls
+     made by different threads at the same time are merged into one
+     `get_multi` -- a single ``MGET``, or one pipeline for the hstore
+     backends -- and each caller gets its own value back.  The first read of
+     a batch waits up to ``auto_pipeline_max_wait`` for others to join it, but
+     only if other reads are in progress.  The counters are available through
+     ``backend.auto_pipeline.stats()``.  Not supported by the local cache and
+     asyncio backends.  See `auto_pipeline.AutoPipeline`.
+     .. versionadded:: 0.5.0
+
+    :param auto_pipeline_max_wait: float, default `0.0005`.  The longest, in
+     seconds, a batch waits for more reads.
+     .. versionadded:: 0.5.0
+
+    :param auto_pipeline_max_batch: int, default `100`.  A batch is fetched as
+     soon as it holds this many keys.
+     .. versionadded:: 0.5.0
+
+    :param single_flight: boolean, default `False`.  If `True`, concurrent
+     `get` and `get_multi` calls for the same key in one process share a
+     single request to Redis, and a single loaded value; see
+     `single_flight.SingleFlight`.  Writes through the backend detach the
+     requests in flight for their keys, so a read that follows a write never
+     joins a request that started before it.  The counters are available
+     through ``backend.single_flight.stats()``.  Not supported by the asyncio
+     backends.
+     .. versionadded:: 0.5.0
+
+    :param xfetch_expiration_time: int, default `None`.  The region's
+     ``expiration_time``; if set, values are expired early with the XFetch
+     algorithm: writes record in the metadata how long the creator took, and
+     `get` and `get_multi` report a value as expired with a probability that
+     rises as its expiry nears, faster for values that took longer to create.
+     dogpile then has one caller regenerate it while the others are served
+     the current value; see `xfetch.XFetch`.  The counter is available through
+     ``backend.xfetch.stats()``.  Can not be used with ``raw_mode`` or the
+     ``msgpack_raw`` serializer, or by the asyncio backends.
+     .. versionadded:: 0.5.0
+
+    :param xfetch_beta: float, default `1.0`.  Values above 1 expire values
+     earlier, and values below 1 later.
+     .. versionadded:: 0.5.0
+
     """
 
     def __init__(self, arguments: Dict):
         arguments = arguments.copy()
         super(RedisAdvancedBackend, self).__init__(arguments)
-        self.loads = arguments.pop("loads", default_loads)
-        self.dumps = arguments.pop("dumps", default_dumps)
+        serializer = arguments.pop("serializer", None)
+        if serializer is not None:
+            if "loads" in arguments or "dumps" in arguments:
+                raise ValueError("`serializer` can not be used with `loads` or `dumps`")
+            self.loads, self.dumps = get_serializer(serializer)
+        else:
+            self.loads = arguments.pop("loads", default_loads)
+            self.dumps = arguments.pop("dumps", default_dumps)
+        _serializer_loads = self.loads
+        # e.g. `MsgpackSerializer.dumps_multi`
+        self._loads_multi: Optional[Callable] = arguments.pop(
+            "loads_multi", None
+        ) or getattr(getattr(self.loads, "__self__", None), "loads_multi", None)
+        self._dumps_multi: Optional[Callable] = arguments.pop(
+            "dumps_multi", None
+        ) or getattr(getattr(self.dumps, "__self__", None), "dumps_multi", None)
         self.lock_class = arguments.pop("lock_class", None)
         self.lock_prefix = "%s{0}" % arguments.pop("lock_prefix", "_lock")
+        self.lock_notify = arguments.pop("lock_notify", False)
+        self.lock_lease = arguments.pop("lock_lease", False)
+        self.lock_lease_interval = arguments.pop("lock_lease_interval", None)
+        # writes rejected for holding a lease that was lost
+        self.lease_rejected = 0
+        self.multi_batch_size = arguments.pop("multi_batch_size", None)
+        compression = arguments.pop("compression", None)
+        compression_threshold = arguments.pop("compression_threshold", None)
+        compression_level = arguments.pop("compression_level", None)
+        compression_dictionaries = arguments.pop("compression_dictionaries", None)
+        compression_dictionary_id = arguments.pop("compression_dictionary_id", None)
+        self.compressor: Optional[Compressor] = None
+        if compression:
+            self.compressor = Compressor(
+                compression,
+                compression_threshold,
+                compression_level,
+                compression_dictionaries,
+                compression_dictionary_id,
+            )
+            _probes: List[Any] = [None, 0, "", b""]
+            if not arguments.get("raw_mode"):
+                _probes = [
+                    CachedValue(p, {"ct": 0, "v": value_version}) for p in _probes
+                ]
+            self.compressor.check_dumps(self.dumps, _probes)
+            self.dumps = self.compressor.wrap_dumps(self.dumps)
+            self.loads = self.compressor.wrap_loads(self.loads)
+            if self._loads_multi is not None:
+                self._loads_multi = self.compressor.wrap_loads_multi(self._loads_multi)
+            if self._dumps_multi is not None:
+                self._dumps_multi = self.compressor.wrap_dumps_multi(self._dumps_multi)
+        self.raw_mode = arguments.pop("raw_mode", False)
+        if self.raw_mode:
+            if not self.redis_expiration_time:
+                raise ValueError("`raw_mode` requires a `redis_expiration_time`")
+            if serializer in (
+                "msgpack_raw",
+                "envelope",
+                "envelope_msgpack",
+                "envelope_msgpack_lazy",
+            ):
+                raise ValueError(
+                    "`raw_mode` can not be used with the %r serializer" % serializer
+                )
+            # `loads` and `dumps` now only see the payload
+            self._payload_loads = self.loads
+            self.dumps = raw_dumps_factory(self.dumps)
+            self.loads = raw_loads_factory(self.loads)
+            # `_loads_multi` is left to load payloads; see `_loads_values`
+            if self._dumps_multi is not None:
+                self._dumps_multi = raw_dumps_multi_factory(self._dumps_multi)
+        self.lazy_loads = arguments.pop("lazy_loads", False)
+        self._loads_lazy: Optional[Callable] = None
+        if self.lazy_loads and not self.raw_mode:
+            # e.g. `EnvelopeSerializer.loads_lazy`
+            self._loads_lazy = getattr(
+                getattr(_serializer_loads, "__self__", None), "loads_lazy", None
+            )
+            if self._loads_lazy is None:
+                raise ValueError(
+                    "`lazy_loads` requires `raw_mode`, or a serializer that "
+                    "provides `loads_lazy`, like the `envelope` serializers"
+                )
+            if self.compressor is not None:
+                self._loads_lazy = self.compressor.wrap_loads(self._loads_lazy)
+        parallel_loads = arguments.pop("parallel_loads", None)
+        parallel_loads_threshold = arguments.pop("parallel_loads_threshold", 10000)
+        parallel_loads_workers = arguments.pop("parallel_loads_workers", None)
+        self.parallel_loader: Optional[ParallelLoader] = None
+        if parallel_loads:
+            if inspect.iscoroutinefunction(self.get):
+                # waiting on the pool would block the event loop
+                raise ValueError(
+                    "`parallel_loads` is not supported by the asyncio backends"
+                )
+            if self.lazy_loads:
+                raise ValueError("`parallel_loads` can not be used with `lazy_loads`")
+            self.parallel_loader = ParallelLoader(
+                parallel_loads, parallel_loads_threshold, parallel_loads_workers
+            )
+            self.parallel_loader.check_loads(
+                self._loads_multi
+                or (self._payload_loads if self.raw_mode else self.loads)
+            )
+
+        if self.lock_notify and inspect.iscoroutinefunction(self.get):
+            raise ValueError("`lock_notify` is not supported by the asyncio backends")
+        self._fenced_set_script: Optional[Callable] = None
+        if self.lock_lease:
+            if inspect.iscoroutinefunction(self.get):
+                raise ValueError(
+                    "`lock_lease` is not supported by the asyncio backends"
+                )
+            if self.lock_notify:
+                raise ValueError("`lock_lease` can not be used with `lock_notify`")
+            if not self.lock_timeout:
+                raise ValueError("`lock_lease` requires a `lock_timeout`")
+            # redis.py command: `register_script(script)`
+            self._fenced_set_script = self.client.register_script(LUA_FENCED_SET)
+        lock_semaphore = arguments.pop("lock_semaphore", None)
+        lock_semaphore_name = arguments.pop("lock_semaphore_name", "_lock_semaphore")
+        self.semaphore: Optional[Any] = None
+        if lock_semaphore:
+            if inspect.iscoroutinefunction(self.get):
+                raise ValueError(
+                    "`lock_semaphore` is not supported by the asyncio backends"
+                )
+            if not self.distributed_lock:
+                raise ValueError("`lock_semaphore` requires `distributed_lock`")
+            if not self.lock_timeout:
+                raise ValueError("`lock_semaphore` requires a `lock_timeout`")
+            if self.lock_lease:
+                raise ValueError("`lock_semaphore` can not be used with `lock_lease`")
+            self.semaphore = Semaphore(
+                self.client,
+                lock_semaphore_name,
+                lock_semaphore,
+                self.lock_timeout,
+                self.lock_sleep,
+            )
+        self._get_or_lock_script: Optional[Callable] = None
+        if self.distributed_lock:
+            # redis.py command: `register_script(script)`
+            self._get_or_lock_script = self.client.register_script(LUA_GET_OR_LOCK)
+        auto_pipeline = arguments.pop("auto_pipeline", False)
+        auto_pipeline_max_wait = arguments.pop("auto_pipeline_max_wait", 0.0005)
+        auto_pipeline_max_batch = arguments.pop("auto_pipeline_max_batch", 100)
+        self.auto_pipeline: Optional[AutoPipeline] = None
+        if auto_pipeline:
+            if inspect.iscoroutinefunction(self.get):
+                raise ValueError(
+                    "`auto_pipeline` is not supported by the asyncio backends"
+                )
+            self.auto_pipeline = AutoPipeline(
+                self.get_multi, auto_pipeline_max_wait, auto_pipeline_max_batch
+            )
+            self.get = self.auto_pipeline.wrap_get(self.get)  # type: ignore
+        # after `auto_pipeline`, so coalesced reads are batched once
+        self.single_flight: Optional[SingleFlight] = None
+        if arguments.pop("single_flight", False):
+            if inspect.iscoroutinefunction(self.get):
+                raise ValueError(
+                    "`single_flight` is not supported by the asyncio backends"
+                )
+            self.single_flight = SingleFlight()
+            # on the instance, so every subclass's methods are covered
+            self.get = self.single_flight.wrap_get(self.get)  # type: ignore
+            self.get_multi = self.single_flight.wrap_get_multi(  # type: ignore
+                self.get_multi
+            )
+            for _name, _single in (
+                ("set", True),
+                ("set_multi", False),
+                ("delete", True),
+                ("delete_multi", False),
+            ):
+                setattr(
+                    self,
+                    _name,
+                    self.single_flight.wrap_write(getattr(self, _name), _single),
+                )
+        # last, so every caller draws its own early expiry
+        xfetch_expiration_time = arguments.pop("xfetch_expiration_time", None)
+        xfetch_beta = arguments.pop("xfetch_beta", 1.0)
+        self.xfetch: Optional[XFetch] = None
+        if xfetch_expiration_time:
+            if inspect.iscoroutinefunction(self.get):
+                raise ValueError(
+                    "`xfetch_expiration_time` is not supported by the asyncio backends"
+                )
+            if self.raw_mode or serializer == "msgpack_raw":
+                raise ValueError(
+                    "`xfetch_expiration_time` requires values with metadata, "
+                    "so can not be used with `raw_mode` or `msgpack_raw`"
+                )
+            self.xfetch = XFetch(xfetch_expiration_time, xfetch_beta)
+            self.get = self.xfetch.wrap_get(self.get)  # type: ignore
+            self.get_multi = self.xfetch.wrap_get_multi(self.get_multi)  # type: ignore
+            self.set = self.xfetch.wrap_set(self.set)  # type: ignore
+            self.set_multi = self.xfetch.wrap_set_multi(self.set_multi)  # type: ignore
+
+    def _loads_values(self, values: Iterable[Optional[bytes]]) -> List[Any]:
+        """
+        loads the values of a multi-key fetch; `None` is a miss.
+        in `raw_mode`, the whole batch shares a single metadata instance.
+        with `lazy_loads`, payloads are deserialized on first access.
+        with `loads_multi`, the hits are deserialized in a single call.
+        with `parallel_loads`, large batches are deserialized on a pool.
+        """
+        if self.parallel_loader is not None:
+            values = list(values)
+            if len(values) >= self.parallel_loader.threshold:
+                return self._loads_hits(values, self._loads_parallel)
+        if self._loads_multi is not None and not self.lazy_loads:
+            return self._loads_hits(list(values), self._loads_multi)
+        if self.raw_mode:
+            loads = self._payload_loads
+            metadata = raw_metadata()
+            if self.lazy_loads:
+                return [
+                    LazyCachedValue(v, metadata, loads) if v is not None else NO_VALUE
+                    for v in values
+                ]
+            return [
+                _new_cached_value(CachedValue, (loads(v), metadata))
+                if v is not None
+                else NO_VALUE
+                for v in values
+            ]
+        # potentially faster on large lists
+        loads = self._loads_lazy or self.loads
+        return [loads(v) if v is not None else NO_VALUE for v in values]
+
+    def _loads_hits(
+        self, values: List[Optional[bytes]], loads_multi: Callable
+    ) -> List[Any]:
+        """
+        loads the hits of `values` with a single call of `loads_multi`; in
+        `raw_mode`, it loads the payloads.
+        """
+        # `NO_VALUE` is compared by identity, so the misses are not passed on;
+        # e.g. it would not survive a process pool
+        _hits = [v for v in values if v is not None]
+        _loaded = iter(loads_multi(_hits))
+        if self.raw_mode:
+            metadata = raw_metadata()
+            return [
+                _new_cached_value(CachedValue, (next(_loaded), metadata))
+                if v is not None
+                else NO_VALUE
+                for v in values
+            ]
+        return [next(_loaded) if v is not None else NO_VALUE for v in values]
+
+    def _loads_parallel(self, values: List[bytes]) -> List[Any]:
+        loader: ParallelLoader = self.parallel_loader  # type: ignore[assignment]
+        if self._loads_multi is not None:
+            return loader.map_multi(self._loads_multi, values)
+        return loader.map(self._payload_loads if self.raw_mode else self.loads, values)
+
+    def _dumps_mapping(self, mapping: Mapping) -> Dict:
+        """serializes the values of `mapping`, with `dumps_multi` if set"""
+        if self._dumps_multi is not None:
+            return dict(zip(mapping.keys(), self._dumps_multi(list(mapping.values()))))
+        dumps = self.dumps  # potentially faster on large lists
+        return {k: dumps(v) for k, v in mapping.items()}
+
+    def _imports(self):
+        # defer imports until backend is used
+        super(RedisAdvancedBackend, self)._imports()
+        global redis, fence_key, held_fence, LeaseLock, MultiLock, NotifyLock
+        global Semaphore, SemaphoreMutex
+        import redis  # noqa
+        from ..locks import fence_key  # noqa
+        from ..locks import held_fence  # noqa
+        from ..locks import LeaseLock  # noqa
+        from ..locks import MultiLock  # noqa
+        from ..locks import NotifyLock  # noqa
+        from ..locks import Semaphore  # noqa
+        from ..locks import SemaphoreMutex  # noqa
+
+    def _lock_name(self, key: str) -> str:
+        return self.lock_prefix.format(key)
+
+    def _redis_lock(self, key: str) -> Any:
+        lock_class: Optional[Callable] = None
+        if self.lock_notify:
+            lock_class = NotifyLock
+        elif self.lock_lease:
+            lock_class = functools.partial(LeaseLock, interval=self.lock_lease_interval)
+        # redis.py command: `lock(name, timeout=None, sleep=0.1)`
+        return self.client.lock(
+            self._lock_name(key),
+            self.lock_timeout,
+            self.lock_sleep,
+            lock_class=lock_class,
+            thread_local=self.thread_local_lock,
+        )
 
     def get_mutex(self, key: str) -> Optional[Any]:
         if self.distributed_lock:
-            _key = self.lock_prefix.format(key)
-            _mutex = self.client.lock(_key, self.lock_timeout, self.lock_sleep)
+            _mutex = self._redis_lock(key)
+            if self.semaphore is not None:
+                _mutex = SemaphoreMutex(_mutex, self.semaphore)
+            if self.lock_class:
+                return self.lock_class(_mutex)
+            return _mutex
+        else:
+            return None
+
+    def _multi_lock(self, keys: Iterable) -> Any:
+        keys = list(keys)
+        return MultiLock(
+            self.client,
+            keys,
+            [self._lock_name(key) for key in keys],
+            self.lock_timeout,
+            notify=self.lock_notify,
+        )
+
+    def get_mutex_multi(self, keys: Iterable) -> Optional[Any]:
+        """
+        returns a `locks.MultiLock` for the `get_mutex` locks of `keys`, or
+        `None` without ``distributed_lock``.  Its ``acquire()`` takes every
+        lock that is free in one call, and returns the keys it now owns; its
+        ``release()`` frees them in one call.  It is wrapped in
+        ``lock_class``, if set.  Can not be used with ``lock_lease`` or
+        ``lock_semaphore``.
+        """
+        if self.lock_lease or self.semaphore is not None:
+            # a `MultiLock` neither extends a lease nor takes a semaphore slot
+            raise ValueError(
+                "`get_mutex_multi` can not be used with `lock_lease` or "
+                "`lock_semaphore`"
+            )
+        if self.distributed_lock:
+            _mutex = self._multi_lock(keys)
             if self.lock_class:
                 return self.lock_class(_mutex)
             return _mutex
         else:
             return None
 
+    def _value_location(self, key: str) -> Tuple[str, Optional[str]]:
+        """the name of the redis key holding `key`, and its hash field"""
+        return key, None
+
+    def _get_or_lock_args(self, key: str) -> Tuple[Callable, List, List]:
+        """`LUA_GET_OR_LOCK`, and its keys and arguments for `key`"""
+        script = self._get_or_lock_script
+        if script is None:
+            # only registered with `distributed_lock`
+            raise ValueError("`get_or_lock` requires `distributed_lock`")
+        if self.lock_lease or self.semaphore is not None:
+            # the script neither fences a lease nor takes a semaphore slot
+            raise ValueError(
+                "`get_or_lock` can not be used with `lock_lease` or `lock_semaphore`"
+            )
+        name, field = self._value_location(key)
+        token = uuid.uuid1().hex.encode()
+        _timeout = int(self.lock_timeout * 1000) if self.lock_timeout else 0
+        return (
+            script,
+            [name, self._lock_name(key)],
+            [
+                field if field is not None else "",
+                "1" if field is not None else "0",
+                token,
+                _timeout,
+            ],
+        )
+
+    def _get_or_lock_result(self, key: str, token: bytes, result: List) -> Tuple:
+        found, value = result
+        if found:
+            return self.loads(value), None
+        if not value:
+            return NO_VALUE, None
+        _mutex = self._redis_lock(key)
+        # the script acquired it with this token, so it can be released
+        _mutex.local.token = token
+        if self.lock_class:
+            return NO_VALUE, self.lock_class(_mutex)
+        return NO_VALUE, _mutex
+
+    def get_or_lock(self, key: str) -> Tuple[Any, Optional[Any]]:
+        """
+        returns ``(value, mutex)`` for `key`, in a single call to Redis.
+
+        * ``(value, None)`` - the key has a value
+        * ``(NO_VALUE, mutex)`` - the key has no value, and the caller now
+          holds its `get_mutex` lock, which it must release
+        * ``(NO_VALUE, None)`` - the key has no value, and its lock is held
+          elsewhere
+
+        This replaces the `get`, ``get_mutex(key).acquire()`` and `get` round
+        trips of a miss.  The mutex is wrapped in ``lock_class``, if set.
+        Requires ``distributed_lock``, and can not be used with ``lock_lease``
+        or ``lock_semaphore``.
+        """
+        script, keys, args = self._get_or_lock_args(key)
+        result = script(keys=keys, args=args)
+        return self._get_or_lock_result(key, args[2], result)
+
     def get(self, key: str) -> Any:
         value = self.client.get(key)
         if value is None:
             return NO_VALUE
         return self.loads(value)
 
+    @batched_get_multi
     def get_multi(self, keys: Tuple[str]) -> List[Any]:
         if not keys:
             return []
         values = self.client.mget(keys)
-        loads = self.loads  # potentially faster on large lists
-        return [loads(v) if v is not None else NO_VALUE for v in values]
+        return self._loads_values(values)
+
+    def _lease_fence(self, key: str) -> Optional[int]:
+        """the fencing token of this thread's lease on `key`, if it holds one"""
+        if not self.lock_lease:
+            return None
+        return held_fence(self._lock_name(key))
+
+    def _hash_expiry(self) -> str:
+        """when `LUA_FENCED_SET` sets the expiry of a hash"""
+        return "new"
+
+    def _fenced_set(self, key: str, value: Any, fence: int) -> bool:
+        """
+        writes `value` unless the lease on `key` has been acquired by someone
+        else since it was acquired with `fence`.  returns `False` if the
+        caller must write it instead.
+        """
+        script = self._fenced_set_script
+        if script is None:
+            # without `lock_lease`, writes are not fenced
+            return False
+        name, field = self._value_location(key)
+        written = script(
+            keys=[name, fence_key(self._lock_name(key))],
+            args=[
+                fence,
+                field if field is not None else "",
+                "1" if field is not None else "0",
+                self.dumps(value),
+                self.redis_expiration_time or 0,
+                self._hash_expiry(),
+            ],
+        )
+        if not written:
+            self.lease_rejected += 1
+        return True
+
+    def _fenced_set_multi(self, mapping: Dict) -> Dict:
+        """
+        writes the values of `mapping` whose keys this thread holds a lease
+        on, one `_fenced_set` each, and returns the others for the caller to
+        write.
+        """
+        if not self.lock_lease:
+            return mapping
+        _unfenced = {}
+        for key, value in mapping.items():
+            fence = self._lease_fence(key)
+            if fence is None or not self._fenced_set(key, value, fence):
+                _unfenced[key] = value
+        return _unfenced
 
     def set(self, key: str, value: Any) -> None:
+        fence = self._lease_fence(key)
+        if fence is not None and self._fenced_set(key, value, fence):
+            return
         if self.redis_expiration_time:
             self.client.setex(key, self.redis_expiration_time, self.dumps(value))
         else:
             self.client.set(key, self.dumps(value))
 
+    @batched_set_multi
     def set_multi(self, mapping: Dict) -> None:
-        dumps = self.dumps  # potentially faster on large lists
-        mapping = dict((k, dumps(v)) for k, v in mapping.items())
+        mapping = self._fenced_set_multi(mapping)
+        if not mapping:
+            return
+        mapping = self._dumps_mapping(mapping)
         if not self.redis_expiration_time:
             self.client.mset(mapping)
         else:
@@ -214,7 +1139,213 @@ class RedisAdvancedBackend(RedisBackend):
             pipe.execute()
 
 
-class RedisAdvancedHstoreBackend(RedisAdvancedBackend):
+class _HstoreMixin(object):
+    """
+    The key handling of the hstore backends, shared by the sync and asyncio
+    variants: tuple keys are fields of a hash, and ``hash_buckets`` maps
+    plain keys into hashes.  It sorts keys into string keys and hash fields,
+    and queues the commands for them on a pipeline; the backends run the
+    pipeline, and any command that can not be pipelined.
+    """
+
+    client: Any
+    lock_prefix: str
+    redis_expiration_time: Optional[int]
+
+    def __init__(self, arguments: Dict):
+        arguments = arguments.copy()
+        super(_HstoreMixin, self).__init__(arguments)  # type: ignore[call-arg]
+        self.redis_expiration_time_hash = arguments.pop(
+            "redis_expiration_time_hash", None
+        )  # noqa
+        self.redis_expiration_time_hash_script = arguments.pop(
+            "redis_expiration_time_hash_script", False
+        )
+        self._hash_script: Optional[Any] = None
+        if (
+            self.redis_expiration_time_hash_script
+            and self.redis_expiration_time_hash is None
+        ):
+            # redis.py command: `register_script(script)`
+            self._hash_script = self.client.register_script(LUA_HSET_EXPIRE_NEW)
+        self.hash_buckets = arguments.pop("hash_buckets", None)
+        self.hash_buckets_prefix = arguments.pop("hash_buckets_prefix", "_hb:")
+        self._hash_bucket: Optional[Callable] = None
+        if self.hash_buckets:
+            self._hash_bucket = hash_bucket_factory(
+                self.hash_buckets, self.hash_buckets_prefix
+            )
+
+    def _lock_name(self, key: str) -> str:
+        if isinstance(key, tuple):
+            # key can be a tuple
+            key = ",".join(key)
+        return self.lock_prefix.format(key)
+
+    def _value_location(self, key: str) -> Tuple[str, Optional[str]]:
+        if self._hash_bucket is not None:
+            key = self._hash_bucket(key)
+        if isinstance(key, tuple):
+            return key[0], key[1]
+        return key, None
+
+    def _pipe_get_multi(self, pipe: Any, keys: Tuple) -> List[List[int]]:
+        """
+        * figure out which are string keys vs hashes, process 2 queues
+        * for hashes, bucket into multiple requests
+        * queue the `mget` and every `hmget` on `pipe`
+        returns the positions in `keys` of each command's values.  this is
+        sadly complex as we may have duplicate keys - so can't stash
+        position in a dict.
+        """
+        # scoping
+        _keys_str: List[str] = []
+        _keys_str_idx: List[int] = []
+        _hashed: Dict[str, Dict[str, List]] = {}
+
+        for _idx, _k in enumerate(keys):
+            if isinstance(_k, tuple):
+                # k[0] is our bucket
+                if _k[0] not in _hashed:
+                    _hashed[_k[0]] = {"keys": [], "idx": []}
+                _hashed[_k[0]]["keys"].append(_k[1])
+                _hashed[_k[0]]["idx"].append(_idx)
+            else:
+                _keys_str.append(_k)
+                _keys_str_idx.append(_idx)
+
+        # the order of the pipeline's commands is the order of the results;
+        # `_positions` tracks where each command's values belong
+        _positions: List[List[int]] = []
+
+        # batch the keys at once
+        if _keys_str:
+            # redis.py command: `mget(keys, *args)`
+            pipe.mget(_keys_str)
+            _positions.append(_keys_str_idx)
+
+        # group and batch the hashed as needed
+        for name in _hashed:
+            # redis.py command: `hmget(name, keys, *args)`
+            pipe.hmget(name, _hashed[name]["keys"])
+            _positions.append(_hashed[name]["idx"])
+        return _positions
+
+    def _merge_get_multi(
+        self, count: int, positions: List[List[int]], results: List
+    ) -> List[Optional[bytes]]:
+        """builds the results of `_pipe_get_multi` back in the right order"""
+        values: List[Optional[bytes]] = [None] * count
+        for _idxs, _values in zip(positions, results):
+            for _idx, _v in zip(_idxs, _values):
+                values[_idx] = _v
+        return values
+
+    def _split_mapping(self, mapping: Mapping) -> Tuple[Dict, Dict[str, Dict]]:
+        """
+        splits a `set_multi` mapping into the values of string keys, and the
+        fields of each hash
+        """
+        _mapping_str = {}
+        _hashed: Dict[str, Dict] = defaultdict(dict)
+        for _k, _v in mapping.items():
+            if isinstance(_k, tuple):
+                _hashed[_k[0]][_k[1]] = _v
+            else:
+                _mapping_str[_k] = _v
+        return _mapping_str, _hashed
+
+    def _pipe_hash_script(
+        self, pipe: Any, hashed: Dict[str, Dict]
+    ) -> Dict[int, Tuple[List, List]]:
+        """
+        queues the hash script, writing every bucket of `hashed` in one atomic
+        call.  returns the script's position in the pipeline and its arguments,
+        for `_rerun_script_calls`.
+        """
+        assert self._hash_script is not None
+        _script_args = hash_script_args(hashed, self.redis_expiration_time)
+        _script_calls = {len(pipe): _script_args}
+        # redis.py command: `evalsha(sha, numkeys, *keys_and_args)`
+        pipe.evalsha(
+            self._hash_script.sha,
+            len(_script_args[0]),
+            *_script_args[0],
+            *_script_args[1],
+        )
+        return _script_calls
+
+    def _pipe_hmset(
+        self, pipe: Any, name: str, fields: Dict, exists: Optional[bool]
+    ) -> None:
+        """
+        queues the write of the `fields` of hash `name`, and of its expiry.
+        `exists` tells if the hash already exists, and is only needed when
+        ``redis_expiration_time_hash`` is `None`.
+        """
+        _set_expiry = None
+        if self.redis_expiration_time_hash is True:
+            # unconditionally set
+            _set_expiry = True
+        elif self.redis_expiration_time_hash is None:
+            # conditionally set
+            _set_expiry = not exists
+
+        # redis.py command: `hset(name, mapping=mapping)`; `hmset` is
+        # deprecated
+        pipe.hset(name, mapping=fields)
+
+        if _set_expiry and self.redis_expiration_time:
+            # redis.py command: `expire(name, time)`
+            pipe.expire(name, self.redis_expiration_time)
+
+    def _pipe_set_str(self, pipe: Any, mapping: Dict) -> None:
+        """queues the write of the string keys of `mapping`"""
+        if not mapping:
+            return
+        if not self.redis_expiration_time:
+            # redis.py command: `mset(mapping)`
+            pipe.mset(mapping)
+        else:
+            for key, value in mapping.items():
+                # redis.py command: `setex(name, time, value)`
+                pipe.setex(key, self.redis_expiration_time, value)
+
+    def _rerun_script_calls(
+        self, results: List, script_calls: Dict[int, Tuple[List, List]]
+    ) -> Iterator[Tuple[List, List]]:
+        """
+        inspects the results of a `set_multi` pipeline that ran the hash
+        script.  `script_calls` maps the script's positions in the pipeline to
+        their arguments.  if the server did not have the script cached, this
+        yields the arguments, and the backend runs the script again through
+        `register_script`, which will load it; any other error is raised.
+        """
+        for _idx, _result in enumerate(results):
+            if not isinstance(_result, Exception):
+                continue
+            if (
+                _idx in script_calls
+                and self._hash_script is not None
+                and isinstance(_result, redis.exceptions.NoScriptError)
+            ):
+                yield script_calls[_idx]
+                continue
+            raise _result
+
+    def _split_keys(self, keys: Tuple) -> Tuple[List, Dict[str, List]]:
+        """splits `delete_multi` keys into string keys, and each hash's fields"""
+        _keys: List = []
+        _hashed: Dict[str, List] = defaultdict(list)
+        for k in keys:
+            if isinstance(k, tuple):
+                _hashed[k[0]].append(k[1])
+            else:
+                _keys.append(k)
+        return _keys, _hashed
+
+
+class RedisAdvancedHstoreBackend(_HstoreMixin, RedisAdvancedBackend):
     """A `Redis <http://redis.io/>`_ backend, using the
     `redis-py <http://pypi.python.org/pypi/redis/>`_ backend.
 
@@ -257,30 +1388,34 @@ class RedisAdvancedHstoreBackend(RedisAdvancedBackend):
     if `redis_expiration_time_hash` is set to `False`, then dogpile will not set
     expiry times on hashes.
 
-    """
+    :param redis_expiration_time_hash_script: boolean, default `False`.  Only
+    used when `redis_expiration_time_hash` is `None`.  If `True`, hash writes
+    are made through a Lua script -- invoked via `EVALSHA` with a cached SHA --
+    which writes the fields and sets `redis_expiration_time` only if the hash
+    is new.  This replaces the `exists`/`hset`/`expire` round trips with a
+    single atomic call for `set`, and a single call per batch for `set_multi`.
+    It also removes the race between `exists` and `hset`.
+     .. versionadded:: 0.5.0
+
+    :param hash_buckets: int, default `None`.  If set, plain (non-tuple) keys
+    are transparently stored as fields of one of `hash_buckets` hashes, so a
+    whole region gets the memory savings of hash encoding without passing
+    tuple keys.  A key is mapped to a bucket with a stable hash.  Redis only
+    uses its compact hash encoding for small hashes (`hash-max-ziplist-entries`,
+    128 by default), so choose roughly one bucket per 100 keys.  Remember that
+    Redis expires a whole bucket at once; see `redis_expiration_time_hash`.
+    Locks are still made on the plain key.
+     .. versionadded:: 0.5.0
+
+    :param hash_buckets_prefix: string, default `_hb:`.  The prefix of the
+    bucket names, which are `prefix` followed by the bucket number.
+     .. versionadded:: 0.5.0
 
-    def __init__(self, arguments: Dict):
-        arguments = arguments.copy()
-        super(RedisAdvancedHstoreBackend, self).__init__(arguments)
-        self.redis_expiration_time_hash = arguments.pop(
-            "redis_expiration_time_hash", None
-        )  # noqa
-
-    def get_mutex(self, key: str) -> Optional[Any]:
-        if isinstance(key, tuple):
-            # key can be a tuple
-            key = ",".join(key)
-        if self.distributed_lock:
-            # redis.py command: `lock(name, timeout=None, sleep=0.1)`
-            _key = self.lock_prefix.format(key)
-            _mutex = self.client.lock(_key, self.lock_timeout, self.lock_sleep)
-            if self.lock_class:
-                return self.lock_class(_mutex)
-            return _mutex
-        else:
-            return None
+    """
 
     def get(self, key: str) -> Any:
+        if self._hash_bucket is not None:
+            key = self._hash_bucket(key)
         if isinstance(key, tuple):
             # redis.py command: `hget(hashname, key)`
             value = self.client.hget(key[0], key[1])
@@ -291,64 +1426,42 @@ class RedisAdvancedHstoreBackend(RedisAdvancedBackend):
             return NO_VALUE
         return self.loads(value)
 
+    @batched_get_multi
     def get_multi(self, keys: Tuple[str]) -> List[Any]:
         """
-        * figure out which are string keys vs hashes, process 2 queues
-        * for hashes, bucket into multiple requests
-        * reintegrate the values in the right order
-        this is sadly complex as we may have duplicate keys - so can't stash
-        position in a dict.
+        sends the `mget` and every `hmget` in one non-transactional pipeline;
+        see `_HstoreMixin._pipe_get_multi`
         """
-        # scoping
-        _keys_str: List[str] = []
-        _keys_str_idx: List[int] = []
-        _keys_hash: List[str] = []
-        _keys_hash_idx: List[int] = []
-
-        # initialize this list
-        values = [None] * len(keys)
-
-        for _idx, _k in enumerate(keys):
-            if isinstance(_k, tuple):
-                _keys_hash.append(_k)
-                _keys_hash_idx.append(_idx)
-            else:
-                _keys_str.append(_k)
-                _keys_str_idx.append(_idx)
-
-        # batch the keys at once
-        if _keys_str:
-            # redis.py command: `mget(keys, *args)`
-            _values = self.client.mget(_keys_str)
-            # build this back into the results in the right order
-            _values = zip(_keys_str_idx, _values)
-            for _idx, _v in _values:
-                values[_idx] = _v
+        if self._hash_bucket is not None:
+            keys = tuple(map(self._hash_bucket, keys))
+        # redis.py command: `pipeline(transaction=False, shard_hint=None)`
+        pipe = self.client.pipeline(transaction=False)
+        _positions = self._pipe_get_multi(pipe, keys)
+        return self._loads_values(
+            self._merge_get_multi(len(keys), _positions, pipe.execute())
+        )
 
-        # group and batch the hashed as needed
-        if _keys_hash:
-            _hashed: Dict[str, Dict[str, List]] = {}
-            for k in _keys_hash:
-                # k[0] is our bucket
-                if k[0] not in _hashed:
-                    _hashed[k[0]] = {"keys": [], "idx": []}
-            for idx, k in enumerate(_keys_hash):
-                # note that we're using the _keys_hash_idx here
-                _hashed[k[0]]["keys"].append(k[1])
-                _hashed[k[0]]["idx"].append(_keys_hash_idx[idx])
-            for name in _hashed:
-                # redis.py command: `hmget(name, keys, *args)`
-                _values = self.client.hmget(name, _hashed[name]["keys"])
-                # build this back into the results in the right order
-                _values = zip(_hashed[name]["idx"], _values)
-                for _idx, _v in _values:
-                    values[_idx] = _v
-
-        loads = self.loads  # potentially faster on large lists
-        return [loads(v) if v is not None else NO_VALUE for v in values]
+    def _hash_expiry(self) -> str:
+        if self.redis_expiration_time_hash is True:
+            return "always"
+        if self.redis_expiration_time_hash is None:
+            return "new"
+        return "never"
 
     def set(self, key: str, value: Any) -> None:
-        if isinstance(key, tuple):
+        fence = self._lease_fence(key)
+        if fence is not None and self._fenced_set(key, value, fence):
+            return
+        if self._hash_bucket is not None:
+            key = self._hash_bucket(key)
+        if isinstance(key, tuple) and self._hash_script is not None:
+            # redis.py command: `evalsha(sha, numkeys, *keys_and_args)`
+            self._hash_script(
+                *hash_script_args(
+                    {key[0]: {key[1]: self.dumps(value)}}, self.redis_expiration_time
+                )
+            )
+        elif isinstance(key, tuple):
             _set_expiry = None
             if self.redis_expiration_time_hash is True:
                 # unconditionally set
@@ -362,7 +1475,7 @@ class RedisAdvancedHstoreBackend(RedisAdvancedBackend):
 
             # redis.py command: `hset(name, key, value)`
             self.client.hset(key[0], key[1], self.dumps(value))
-            if _set_expiry:
+            if _set_expiry and self.redis_expiration_time:
                 # redis.py command: `expire(name, time)`
                 self.client.expire(key[0], self.redis_expiration_time)
         else:
@@ -373,33 +1486,432 @@ class RedisAdvancedHstoreBackend(RedisAdvancedBackend):
                 # redis.py command: `set(name, value)`
                 self.client.set(key, self.dumps(value))
 
+    @batched_set_multi
     def set_multi(self, mapping: Dict) -> None:
         """
         we'll always use a pipeline for this class
         """
+        mapping = self._fenced_set_multi(mapping)
+        if not mapping:
+            return
+        if self._hash_bucket is not None:
+            mapping = {self._hash_bucket(k): v for k, v in mapping.items()}
         # encode
-        dumps = self.dumps  # potentially faster on large lists
-        mapping = dict((k, dumps(v)) for k, v in mapping.items())
+        _mapping_str, _hashed = self._split_mapping(self._dumps_mapping(mapping))
+
+        # redis.py command: `pipeline(transaction=True, shard_hint=None)`
+        pipe = self.client.pipeline()
+
+        # the script's position in the pipeline and its arguments, if used
+        _script_calls: Dict[int, Tuple[List, List]] = {}
+
+        # whether or not we have a redis_expiration_time, we set via hmset
+        if _hashed and self._hash_script is not None:
+            # every bucket is written in one atomic call
+            _script_calls = self._pipe_hash_script(pipe, _hashed)
+        else:
+            for name, fields in _hashed.items():
+                _exists = None
+                if self.redis_expiration_time_hash is None:
+                    # redis.py command: `exists(key)`
+                    _exists = self.client.exists(name)
+                self._pipe_hmset(pipe, name, fields, _exists)
+        self._pipe_set_str(pipe, _mapping_str)
+
+        # run the pipeline
+        if not _script_calls:
+            pipe.execute()
+        else:
+            _results = pipe.execute(raise_on_error=False)
+            self._check_script_results(_results, _script_calls)
+
+    def _check_script_results(
+        self, results: List, script_calls: Dict[int, Tuple[List, List]]
+    ) -> None:
+        """see `_HstoreMixin._rerun_script_calls`"""
+        for _script_args in self._rerun_script_calls(results, script_calls):
+            # redis.py command: `script_load(script)`, `evalsha(...)`
+            self._hash_script(*_script_args)  # type: ignore[misc]
 
-        # derive key types
-        _keys_str = []
-        _keys_hash = []
-        _hash_bucketed: Optional[Dict] = None
-        for _k in mapping.keys():
+    def delete(self, key: str) -> None:
+        if self._hash_bucket is not None:
+            key = self._hash_bucket(key)
+        if isinstance(key, tuple):
+            # redis.py command: hdel(`name, *keys)`
+            self.client.hdel(key[0], key[1])
+        else:
+            # redis.py command: delete(*names)`
+            self.client.delete(key)
+
+    def delete_multi(self, keys: Tuple[str]) -> None:
+        """
+        In order to handle multiple deletes, we need to inspect the keys and
+        batch them into the appropriate method.  This has a negligible cost.
+        """
+        if self._hash_bucket is not None:
+            keys = tuple(map(self._hash_bucket, keys))
+        _keys, _hashed = self._split_keys(keys)
+        if _keys:
+            # redis.py command: delete(*names)`
+            self.client.delete(*_keys)
+        for name in _hashed:
+            # redis.py command: `hdel(name, *keys)`
+            self.client.hdel(name, *_hashed[name])
+
+
+class RedisAdvancedLocalCacheBackend(RedisAdvancedBackend):
+    """A `RedisAdvancedBackend` with a bounded, process-local LRU in front of
+    Redis.
+
+    The LRU holds values that have already been passed through ``loads``, so a
+    local hit costs neither a network round trip nor deserialization.  Values
+    are shared between callers and must not be mutated.
+
+    Coherence is kept through Redis's server-assisted client-side caching
+    (Redis 6+).  A background thread subscribes to the invalidation channel and
+    enables ``CLIENT TRACKING`` in broadcast mode; every write to a matching key
+    -- from any client -- evicts it from the LRU.  Until tracking is
+    established, or if it is lost, nothing is stored locally.  Writes made
+    through this backend also evict their keys immediately.
+
+    Example configuration::
+
+        from dogpile.cache import make_region
+
+        region = make_region().configure(
+            'dogpile_backend_redis_advanced_local',
+            arguments = {
+                'host': 'localhost',
+                'port': 6379,
+                'db': 0,
+                'redis_expiration_time': 60*60*2,   # 2 hours
+                'local_cache_max_entries': 10000,
+                'local_cache_max_bytes': 32 * 1024 * 1024,
+                'local_cache_prefixes': ['user-', ],
+                }
+        )
+
+    :param local_cache_max_entries: int, default ``10000``.  The maximum number
+     of values held locally.
+
+    :param local_cache_max_bytes: int, default ``64MB``.  The maximum size of
+     the values held locally, measured by the length of their serialized form.
+
+    :param local_cache_prefixes: list of strings, default ``None``.  If
+     provided, Redis will only broadcast invalidations for keys that start with
+     these prefixes.  Keys outside of the prefixes are never cached locally.
+     Without prefixes, writes to every key on the server -- including lock
+     keys -- are broadcast to each process.
+
+     .. versionadded:: 0.5.0
+
+    """
+
+    def __init__(self, arguments: Dict):
+        arguments = arguments.copy()
+        super(RedisAdvancedLocalCacheBackend, self).__init__(arguments)
+        self.local_cache_max_entries = arguments.pop("local_cache_max_entries", 10000)
+        self.local_cache_max_bytes = arguments.pop(
+            "local_cache_max_bytes", 64 * 1024 * 1024
+        )
+        self.local_cache_prefixes = arguments.pop("local_cache_prefixes", None)
+        if self.local_cache_prefixes:
+            self.local_cache_prefixes = tuple(self.local_cache_prefixes)
+        if self.auto_pipeline is not None:
+            # local hits would wait for the batch
+            raise ValueError(
+                "`auto_pipeline` is not supported by the local cache backend"
+            )
+        self.local_cache = LocalCache(
+            self.local_cache_max_entries, self.local_cache_max_bytes
+        )
+        self._listener: Optional[InvalidationListener] = None
+        self._listener_pid: Optional[int] = None
+        self._listener_lock = threading.Lock()
+
+    def _local_cache(self) -> LocalCache:
+        if self._listener_pid != os.getpid():
+            with self._listener_lock:
+                if self._listener_pid != os.getpid():
+                    # first use, or this process was forked from the one that
+                    # started the listener
+                    self.local_cache.clear(enabled=False)
+                    self._listener = InvalidationListener(
+                        self.client, self.local_cache, self.local_cache_prefixes
+                    )
+                    self._listener.start()
+                    self._listener_pid = os.getpid()
+        return self.local_cache
+
+    def _is_tracked(self, key: str) -> bool:
+        if not self.local_cache_prefixes:
+            return True
+        return key.startswith(self.local_cache_prefixes)
+
+    def get(self, key: str) -> Any:
+        local_cache = self._local_cache()
+        if not self._is_tracked(key):
+            return super(RedisAdvancedLocalCacheBackend, self).get(key)
+        value = local_cache.get(key)
+        if value is not NO_VALUE:
+            return value
+        token = local_cache.begin((key,))
+        try:
+            raw = self.client.get(key)
+            if raw is None:
+                return NO_VALUE
+            value = self.loads(raw)
+            local_cache.set(key, value, len(raw), token)
+            return value
+        finally:
+            local_cache.end((key,), token)
+
+    @batched_get_multi
+    def get_multi(self, keys: Tuple[str]) -> List[Any]:
+        if not keys:
+            return []
+        local_cache = self._local_cache()
+        values = [local_cache.get(k) if self._is_tracked(k) else NO_VALUE for k in keys]
+        _missing_idx = [idx for idx, v in enumerate(values) if v is NO_VALUE]
+        if not _missing_idx:
+            return values
+        _missing = [keys[idx] for idx in _missing_idx]
+        _tracked = [k for k in _missing if self._is_tracked(k)]
+        token = local_cache.begin(_tracked)
+        try:
+            _raw = self.client.mget(_missing)
+            _loaded = self._loads_values(_raw)
+            for idx, raw, value in zip(_missing_idx, _raw, _loaded):
+                if raw is not None:
+                    values[idx] = value
+                    local_cache.set(keys[idx], value, len(raw), token)
+        finally:
+            local_cache.end(_tracked, token)
+        return values
+
+    def set(self, key: str, value: Any) -> None:
+        super(RedisAdvancedLocalCacheBackend, self).set(key, value)
+        self.local_cache.invalidate((key,))
+
+    def set_multi(self, mapping: Dict) -> None:
+        super(RedisAdvancedLocalCacheBackend, self).set_multi(mapping)
+        self.local_cache.invalidate(mapping.keys())
+
+    def delete(self, key: str) -> None:
+        super(RedisAdvancedLocalCacheBackend, self).delete(key)
+        self.local_cache.invalidate((key,))
+
+    def delete_multi(self, keys: Tuple[str]) -> None:
+        super(RedisAdvancedLocalCacheBackend, self).delete_multi(keys)
+        self.local_cache.invalidate(keys)
+
+
+class RedisAdvancedClusterBackend(RedisAdvancedHstoreBackend):
+    """A `RedisAdvancedHstoreBackend` for
+    `Redis Cluster <https://redis.io/docs/management/scaling/>`_, using the
+    ``redis.cluster.RedisCluster`` client that ships with redis-py 4.1+.
+
+    Multi-key commands must stay within one hash slot on a cluster, so the
+    `get_multi`, `set_multi` and `delete_multi` operations group string keys by
+    hash slot and issue one `MGET`/`MSET`/`DEL` per slot.  Tuple keys are
+    routed by their bucket name, so every field of a bucket lives on one node
+    and is read with a single `HMGET`.  All of the grouped commands are sent
+    through one cluster pipeline, which writes the commands to every node
+    before reading any replies -- so the nodes work in parallel -- and the
+    results are merged back in request order.
+
+    With ``redis_expiration_time_hash_script``, the script is sent once per
+    hash slot instead of once per batch.
+
+    Example configuration::
+
+        from dogpile.cache import make_region
+
+        region = make_region().configure(
+            'dogpile_backend_redis_advanced_cluster',
+            arguments = {
+                'startup_nodes': [('10.0.0.1', 6379), ('10.0.0.2', 6379)],
+                'redis_expiration_time': 60*60*2,   # 2 hours
+                }
+        )
+
+    :param startup_nodes: list of ``(host, port)`` pairs used to discover the
+     cluster.  If omitted, ``host`` and ``port`` (or ``url``) are used.
+
+    ``db`` and ``connection_pool`` are not supported by Redis Cluster and are
+    ignored.
+
+     .. versionadded:: 0.5.0
+
+    """
+
+    def __init__(self, arguments: Dict):
+        arguments = arguments.copy()
+        self.startup_nodes = arguments.pop("startup_nodes", None)
+        super(RedisAdvancedClusterBackend, self).__init__(arguments)
+
+    def _imports(self):
+        # defer imports until backend is used
+        super(RedisAdvancedClusterBackend, self)._imports()
+        global redis_cluster
+        import redis.cluster as redis_cluster  # noqa
+
+    def _create_client(self):
+        args: Dict[str, Any] = {}
+        if self.socket_timeout:
+            args["socket_timeout"] = self.socket_timeout
+        if self.password:
+            args["password"] = self.password
+
+        if self.url is not None:
+            return redis_cluster.RedisCluster.from_url(self.url, **args)
+        if self.startup_nodes:
+            args["startup_nodes"] = [
+                redis_cluster.ClusterNode(host, port)
+                for (host, port) in self.startup_nodes
+            ]
+        else:
+            args.update(host=self.host, port=self.port)
+        return redis_cluster.RedisCluster(**args)
+
+    def _group_keys(
+        self, keys: Iterable
+    ) -> Tuple[Dict[int, Dict[str, List]], Dict[str, Dict[str, List]]]:
+        """
+        groups string keys by hash slot, and tuple keys by bucket, tracking the
+        position of every key in `keys`.
+        """
+        _slotted: Dict[int, Dict[str, List]] = {}
+        _hashed: Dict[str, Dict[str, List]] = {}
+        keyslot = self.client.keyslot
+        for _idx, _k in enumerate(keys):
             if isinstance(_k, tuple):
-                _keys_hash.append(_k)
+                # k[0] is our bucket
+                _group = _hashed.get(_k[0])
+                if _group is None:
+                    _group = _hashed[_k[0]] = {"keys": [], "idx": []}
+                _group["keys"].append(_k[1])
             else:
-                _keys_str.append(_k)
+                _slot = keyslot(_k)
+                _group = _slotted.get(_slot)
+                if _group is None:
+                    _group = _slotted[_slot] = {"keys": [], "idx": []}
+                _group["keys"].append(_k)
+            _group["idx"].append(_idx)
+        return _slotted, _hashed
+
+    def _multi_lock(self, keys: Iterable) -> Any:
+        keys = list(keys)
+        return MultiLock(
+            self.client,
+            keys,
+            [self._lock_name(key) for key in keys],
+            self.lock_timeout,
+            notify=self.lock_notify,
+            keyslot=self.client.keyslot,
+        )
+
+    def _fenced_set(self, key: str, value: Any, fence: int) -> bool:
+        """
+        see `RedisAdvancedBackend._fenced_set`.  The check is only atomic when
+        the value and its lock hash to the same slot; otherwise the fencing
+        counter is read first, and the caller writes the value.
+        """
+        name, _field = self._value_location(key)
+        _fence_key = fence_key(self._lock_name(key))
+        keyslot = self.client.keyslot
+        if keyslot(name) == keyslot(_fence_key):
+            return super(RedisAdvancedClusterBackend, self)._fenced_set(
+                key, value, fence
+            )
+        if int(self.client.get(_fence_key) or 0) > fence:
+            self.lease_rejected += 1
+            return True
+        return False
+
+    def get_or_lock(self, key: str) -> Tuple[Any, Optional[Any]]:
+        """
+        see `RedisAdvancedBackend.get_or_lock`.  The script can only be used
+        when the value and its lock hash to the same slot -- e.g. string keys
+        with a hash tag, like ``"{user:1}:profile"``; otherwise this falls
+        back to a `get` and a non-blocking acquire of `get_mutex`.
+        """
+        script, keys, args = self._get_or_lock_args(key)
+        keyslot = self.client.keyslot
+        if keyslot(keys[0]) == keyslot(keys[1]):
+            result = script(keys=keys, args=args)
+            return self._get_or_lock_result(key, args[2], result)
+        value = self.get(key)
+        if value is not NO_VALUE:
+            return value, None
+        _mutex = self.get_mutex(key)
+        if _mutex is not None and _mutex.acquire(False):
+            return NO_VALUE, _mutex
+        return NO_VALUE, None
+
+    @batched_get_multi
+    def get_multi(self, keys: Tuple[str]) -> List[Any]:
+        if self._hash_bucket is not None:
+            keys = tuple(map(self._hash_bucket, keys))
+        if not keys:
+            return []
+        _slotted, _hashed = self._group_keys(keys)
+
+        # the order of the pipeline's commands is the order of the results
+        _positions: List[List[int]] = []
+        pipe = self.client.pipeline()
+        for _slot in _slotted:
+            # redis command: `MGET key [key ...]`, within one slot
+            pipe.execute_command("MGET", *_slotted[_slot]["keys"])
+            _positions.append(_slotted[_slot]["idx"])
+        for name in _hashed:
+            # redis.py command: `hmget(name, keys, *args)`
+            pipe.hmget(name, _hashed[name]["keys"])
+            _positions.append(_hashed[name]["idx"])
+
+        # build this back into the results in the right order
+        values = [None] * len(keys)
+        for _idxs, _values in zip(_positions, pipe.execute()):
+            for _idx, _v in zip(_idxs, _values):
+                values[_idx] = _v
+
+        return self._loads_values(values)
+
+    @batched_set_multi
+    def set_multi(self, mapping: Dict) -> None:
+        mapping = self._fenced_set_multi(mapping)
+        if self._hash_bucket is not None:
+            mapping = {self._hash_bucket(k): v for k, v in mapping.items()}
+        if not mapping:
+            return
+        # encode
+        mapping = self._dumps_mapping(mapping)
+        _slotted, _hashed = self._group_keys(mapping.keys())
 
-        # redis.py command: `pipeline(transaction=True, shard_hint=None)`
         pipe = self.client.pipeline()
 
-        # whether or not we have a redis_expiration_time, we set via hmset
-        if _keys_hash:
-            _hash_bucketed = defaultdict(dict)
-            for k in _keys_hash:
-                _hash_bucketed[k[0]][k[1]] = mapping[k]
-            for name in _hash_bucketed.keys():
+        # the script's positions in the pipeline and their arguments, if used
+        _script_calls: Dict[int, Tuple[List, List]] = {}
+
+        if self._hash_script is not None:
+            # a script may only touch one slot, so batch the buckets per slot
+            _hash_slotted: Dict[int, Dict[str, Dict]] = defaultdict(dict)
+            for name in _hashed:
+                _hash_slotted[self.client.keyslot(name)][name] = {
+                    _field: mapping[(name, _field)] for _field in _hashed[name]["keys"]
+                }
+            for _buckets in _hash_slotted.values():
+                _script_args = hash_script_args(_buckets, self.redis_expiration_time)
+                _script_calls[len(pipe)] = _script_args
+                # redis.py command: `evalsha(sha, numkeys, *keys_and_args)`
+                pipe.evalsha(
+                    self._hash_script.sha,
+                    len(_script_args[0]),
+                    *_script_args[0],
+                    *_script_args[1],
+                )
+        else:
+            for name in _hashed:
                 _set_expiry = None
                 if self.redis_expiration_time_hash is True:
                     # unconditionally set
@@ -407,61 +1919,310 @@ class RedisAdvancedHstoreBackend(RedisAdvancedBackend):
                 elif self.redis_expiration_time_hash is None:
                     # conditionally set
                     # redis.py command: `exists(key)`
-                    _hash_exists = self.client.exists(name)
-                    if not _hash_exists:
-                        _set_expiry = True
-
-                # redis.py command: `hmset(name, mapping)`
-                pipe.hmset(name, _hash_bucketed[name])
-
-                if _set_expiry:
+                    _set_expiry = not self.client.exists(name)
+
+                # redis.py command: `hset(name, mapping=mapping)`; `hmset` is
+                # deprecated
+                pipe.hset(
+                    name,
+                    mapping={
+                        _field: mapping[(name, _field)]
+                        for _field in _hashed[name]["keys"]
+                    },
+                )
+                if _set_expiry and self.redis_expiration_time:
                     # redis.py command: `expire(name, time)`
                     pipe.expire(name, self.redis_expiration_time)
 
-        if not self.redis_expiration_time:
-            # redis.py command: `mset(mapping)`
-            if _keys_str:
-                _mapping_str = {k: mapping[k] for k in _keys_str}
-                # redis.py command: `mset(mapping)`
-                pipe.mset(_mapping_str)
-            # bucketed hash was set above
-        else:
-            if _keys_str:
-                for key in _keys_str:
+        for _slot in _slotted:
+            if not self.redis_expiration_time:
+                _args: List = []
+                for key in _slotted[_slot]["keys"]:
+                    _args.append(key)
+                    _args.append(mapping[key])
+                # redis command: `MSET key value [key value ...]`, within one slot
+                pipe.execute_command("MSET", *_args)
+            else:
+                for key in _slotted[_slot]["keys"]:
                     # redis.py command: `setex(name, time, value)`
                     pipe.setex(key, self.redis_expiration_time, mapping[key])
-            # bucketed hash was set above
 
         # run the pipeline
+        if not _script_calls:
+            pipe.execute()
+        else:
+            _results = pipe.execute(raise_on_error=False)
+            self._check_script_results(_results, _script_calls)
+
+    def delete_multi(self, keys: Tuple[str]) -> None:
+        if self._hash_bucket is not None:
+            keys = tuple(map(self._hash_bucket, keys))
+        if not keys:
+            return
+        _slotted, _hashed = self._group_keys(keys)
+        pipe = self.client.pipeline()
+        for _slot in _slotted:
+            # redis command: `DEL key [key ...]`, within one slot
+            pipe.execute_command("DEL", *_slotted[_slot]["keys"])
+        for name in _hashed:
+            # redis.py command: `hdel(name, *keys)`
+            pipe.hdel(name, *_hashed[name]["keys"])
         pipe.execute()
 
-    def delete(self, key: str) -> None:
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+class RedisAdvancedAsyncBackend(RedisAdvancedBackend):
+    """An asyncio variant of `RedisAdvancedBackend`, using the
+    `redis.asyncio` client that ships with
+    `redis-py <http://pypi.python.org/pypi/redis/>`_ 4.2+.
+
+    This accepts the same arguments as `RedisAdvancedBackend` -- including
+    ``loads``, ``dumps``, ``lock_class`` and ``lock_prefix`` -- but the
+    `get`, `get_multi`, `set`, `set_multi`, `delete` and `delete_multi`
+    methods are coroutines and must be awaited.
+
+    `dogpile.cache` regions are synchronous, so this backend is intended to be
+    used directly::
+
+        region = make_region().configure(
+            'dogpile_backend_redis_advanced_asyncio',
+            arguments = {
+                'host': 'localhost',
+                'port': 6379,
+                'db': 0,
+                'redis_expiration_time': 60*60*2,   # 2 hours
+                }
+        )
+        backend = region.backend
+        values = await backend.get_multi(keys)
+
+    If a ``connection_pool`` is provided, it must be a
+    ``redis.asyncio.ConnectionPool``.
+
+    `get_mutex` does not perform any I/O, so it is a regular method; the
+    returned ``redis.asyncio.lock.Lock`` has coroutine ``acquire`` and
+    ``release`` methods, so a ``lock_class`` proxy must await them.  The same
+    goes for the `locks.AsyncMultiLock` of `get_mutex_multi`.
+
+     .. versionadded:: 0.5.0
+
+    """
+
+    def _imports(self):
+        # defer imports until backend is used
+        super(RedisAdvancedAsyncBackend, self)._imports()
+        global redis_asyncio, AsyncMultiLock
+        import redis.asyncio as redis_asyncio  # noqa
+        from ..locks import AsyncMultiLock  # noqa
+
+    def _create_client(self):
+        if self.connection_pool is not None:
+            # the connection pool already has all other connection
+            # options present within, so here we disregard socket_timeout
+            # and others.
+            return redis_asyncio.StrictRedis(connection_pool=self.connection_pool)
+
+        args: Dict[str, Any] = {}
+        if self.socket_timeout:
+            args["socket_timeout"] = self.socket_timeout
+
+        if self.url is not None:
+            args.update(url=self.url)
+            return redis_asyncio.StrictRedis.from_url(**args)
+        else:
+            args.update(
+                host=self.host,
+                password=self.password,
+                port=self.port,
+                db=self.db,
+            )
+            return redis_asyncio.StrictRedis(**args)
+
+    async def get(self, key: str) -> Any:  # type: ignore[override]
+        value = await self.client.get(key)
+        if value is None:
+            return NO_VALUE
+        return self.loads(value)
+
+    @batched_get_multi
+    async def get_multi(self, keys: Tuple[str]) -> List[Any]:  # type: ignore[override]
+        if not keys:
+            return []
+        values = await self.client.mget(keys)
+        return self._loads_values(values)
+
+    async def set(self, key: str, value: Any) -> None:  # type: ignore[override]
+        if self.redis_expiration_time:
+            await self.client.setex(key, self.redis_expiration_time, self.dumps(value))
+        else:
+            await self.client.set(key, self.dumps(value))
+
+    @batched_set_multi
+    async def set_multi(self, mapping: Dict) -> None:  # type: ignore[override]
+        mapping = self._dumps_mapping(mapping)
+        if not self.redis_expiration_time:
+            await self.client.mset(mapping)
+        else:
+            pipe = self.client.pipeline()
+            for key, value in mapping.items():
+                pipe.setex(key, self.redis_expiration_time, value)
+            await pipe.execute()
+
+    async def delete(self, key: str) -> None:  # type: ignore[override]
+        await self.client.delete(key)
+
+    async def delete_multi(self, keys: Tuple[str]) -> None:  # type: ignore[override]
+        await self.client.delete(*keys)
+
+    def _multi_lock(self, keys: Iterable) -> Any:
+        keys = list(keys)
+        return AsyncMultiLock(
+            self.client,
+            keys,
+            [self._lock_name(key) for key in keys],
+            self.lock_timeout,
+        )
+
+    async def get_or_lock(  # type: ignore[override]
+        self, key: str
+    ) -> Tuple[Any, Optional[Any]]:
+        """
+        see `RedisAdvancedBackend.get_or_lock`; the mutex is a
+        ``redis.asyncio.lock.Lock``.
+        """
+        script, keys, args = self._get_or_lock_args(key)
+        result = await script(keys=keys, args=args)
+        return self._get_or_lock_result(key, args[2], result)
+
+
+class RedisAdvancedHstoreAsyncBackend(_HstoreMixin, RedisAdvancedAsyncBackend):
+    """An asyncio variant of `RedisAdvancedHstoreBackend`.
+
+    Tuple keys are handled as hash operations exactly as they are in
+    `RedisAdvancedHstoreBackend`, and ``redis_expiration_time_hash``,
+    ``redis_expiration_time_hash_script`` and ``hash_buckets`` have the same
+    meaning.  See
+    `RedisAdvancedAsyncBackend` for notes on using an asyncio backend.
+
+     .. versionadded:: 0.5.0
+
+    """
+
+    async def get(self, key: str) -> Any:  # type: ignore[override]
+        if self._hash_bucket is not None:
+            key = self._hash_bucket(key)
+        if isinstance(key, tuple):
+            # redis.py command: `hget(hashname, key)`
+            value = await self.client.hget(key[0], key[1])
+        else:
+            # redis.py command: `get(name)`
+            value = await self.client.get(key)
+        if value is None:
+            return NO_VALUE
+        return self.loads(value)
+
+    @batched_get_multi
+    async def get_multi(self, keys: Tuple[str]) -> List[Any]:  # type: ignore[override]
+        """
+        see `RedisAdvancedHstoreBackend.get_multi`
+        """
+        if self._hash_bucket is not None:
+            keys = tuple(map(self._hash_bucket, keys))
+        # redis.py command: `pipeline(transaction=False, shard_hint=None)`
+        pipe = self.client.pipeline(transaction=False)
+        _positions = self._pipe_get_multi(pipe, keys)
+        return self._loads_values(
+            self._merge_get_multi(len(keys), _positions, await pipe.execute())
+        )
+
+    async def set(self, key: str, value: Any) -> None:  # type: ignore[override]
+        if self._hash_bucket is not None:
+            key = self._hash_bucket(key)
+        if isinstance(key, tuple) and self._hash_script is not None:
+            # redis.py command: `evalsha(sha, numkeys, *keys_and_args)`
+            await self._hash_script(
+                *hash_script_args(
+                    {key[0]: {key[1]: self.dumps(value)}}, self.redis_expiration_time
+                )
+            )
+        elif isinstance(key, tuple):
+            _set_expiry = None
+            if self.redis_expiration_time_hash is True:
+                # unconditionally set
+                _set_expiry = True
+            elif self.redis_expiration_time_hash is None:
+                # conditionally set
+                # redis.py command: `exists(key)`
+                _hash_exists = await self.client.exists(key[0])
+                if not _hash_exists:
+                    _set_expiry = True
+
+            # redis.py command: `hset(name, key, value)`
+            await self.client.hset(key[0], key[1], self.dumps(value))
+            if _set_expiry and self.redis_expiration_time:
+                # redis.py command: `expire(name, time)`
+                await self.client.expire(key[0], self.redis_expiration_time)
+        else:
+            await super(RedisAdvancedHstoreAsyncBackend, self).set(key, value)
+
+    @batched_set_multi
+    async def set_multi(self, mapping: Dict) -> None:  # type: ignore[override]
+        """
+        see `RedisAdvancedHstoreBackend.set_multi`
+        """
+        if self._hash_bucket is not None:
+            mapping = {self._hash_bucket(k): v for k, v in mapping.items()}
+        # encode
+        _mapping_str, _hashed = self._split_mapping(self._dumps_mapping(mapping))
+
+        # redis.py command: `pipeline(transaction=True, shard_hint=None)`
+        pipe = self.client.pipeline()
+
+        # the script's position in the pipeline and its arguments, if used
+        _script_calls: Dict[int, Tuple[List, List]] = {}
+        if _hashed and self._hash_script is not None:
+            # every bucket is written in one atomic call
+            _script_calls = self._pipe_hash_script(pipe, _hashed)
+        else:
+            for name, fields in _hashed.items():
+                _exists = None
+                if self.redis_expiration_time_hash is None:
+                    # redis.py command: `exists(key)`
+                    _exists = await self.client.exists(name)
+                self._pipe_hmset(pipe, name, fields, _exists)
+        self._pipe_set_str(pipe, _mapping_str)
+
+        # run the pipeline
+        if not _script_calls:
+            await pipe.execute()
+            return
+        _results = await pipe.execute(raise_on_error=False)
+        for _script_args in self._rerun_script_calls(_results, _script_calls):
+            # redis.py command: `script_load(script)`, `evalsha(...)`
+            await self._hash_script(*_script_args)  # type: ignore[misc]
+
+    async def delete(self, key: str) -> None:  # type: ignore[override]
+        if self._hash_bucket is not None:
+            key = self._hash_bucket(key)
         if isinstance(key, tuple):
             # redis.py command: hdel(`name, *keys)`
-            self.client.hdel(key[0], key[1])
+            await self.client.hdel(key[0], key[1])
         else:
             # redis.py command: delete(*names)`
-            self.client.delete(key)
+            await self.client.delete(key)
 
-    def delete_multi(self, keys: Tuple[str]) -> None:
+    async def delete_multi(self, keys: Tuple[str]) -> None:  # type: ignore[override]
         """
-        In order to handle multiple deletes, we need to inspect the keys and
-        batch them into the appropriate method.  This has a negligible cost.
+        see `RedisAdvancedHstoreBackend.delete_multi`
         """
-        _keys: List = []
-        _keys_hash: List = []
-        for k in keys:
-            if isinstance(k, tuple):
-                _keys_hash.append(k)
-            else:
-                _keys.append(k)
+        if self._hash_bucket is not None:
+            keys = tuple(map(self._hash_bucket, keys))
+        _keys, _hashed = self._split_keys(keys)
         if _keys:
             # redis.py command: delete(*names)`
-            self.client.delete(*_keys)
-        if _keys_hash:
-            _hashed: Dict[str, List] = {k[0]: [] for k in _keys_hash}
-            for k in _keys_hash:
-                _hashed[k[0]].append(k[1])
-            for name in _hashed:
-                # redis.py command: `hdel(name, *keys)`
-                self.client.hdel(name, *_hashed[name])
+            await self.client.delete(*_keys)
+        for name in _hashed:
+            # redis.py command: `hdel(name, *keys)`
+            await self.client.hdel(name, *_hashed[name])
@@ -0,0 +1,421 @@
+"""
+Compression
+-----------
+
+Transparent, threshold-based compression of serialized values.
+
+A `Compressor` wraps a backend's `dumps` and `loads`.  Every value it writes
+starts with a two-byte header -- a magic byte, then a tag naming the format of
+the rest of the value -- so compressed and uncompressed values, and values
+compressed with different codecs, can live side by side.  Values without a
+header (e.g. written before compression was enabled) are passed to `loads` as
+they are.
+
+Small values with a lot of shared structure barely compress on their own; the
+``"zdict"`` codec compresses them against a preset dictionary, which can be
+trained from a sample of the values in a live region with
+`dictionary_from_scan`.
+
+"""
+# stdlib
+from collections import Counter
+import functools
+import lzma
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+import zlib
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+__all__ = ("Compressor", "train_dictionary", "dictionary_from_scan")
+
+# the first byte of a header.  no pickle, msgpack or UTF-8 value starts with
+# `\xc1`: it is not a pickle opcode, msgpack never uses it, and it is never
+# valid in UTF-8.  the `envelope` serializers start with their version byte.
+MAGIC = 0xC1
+
+# the second byte of a header
+TAG_RAW = 0x00
+TAG_ZLIB = 0x01
+TAG_LZMA = 0x02
+# followed by the id of the dictionary
+TAG_ZDICT = 0x03
+
+_MAGIC = bytes((MAGIC,))
+_RAW = bytes((MAGIC, TAG_RAW))
+
+_CODECS: Dict[str, int] = {
+    "zlib": TAG_ZLIB,
+    "lzma": TAG_LZMA,
+    "zdict": TAG_ZDICT,
+}
+
+# the default `threshold` of each codec
+_THRESHOLDS: Dict[str, int] = {"zlib": 1024, "lzma": 1024, "zdict": 64}
+
+# a deflate stream can only refer back 32KB, so a larger dictionary is wasted
+ZDICT_MAX_SIZE = 32768
+
+
+def _zlib_compress(level: Optional[int]) -> Callable:
+    _level = -1 if level is None else level
+
+    def compress(data: bytes) -> bytes:
+        return zlib.compress(data, _level)
+
+    return compress
+
+
+def _zdict_compress(level: Optional[int], zdict: bytes) -> Callable:
+    _level = -1 if level is None else level
+    _compressobj = zlib.compressobj
+
+    def compress(data: bytes) -> bytes:
+        # a raw deflate stream; the header byte already names the dictionary,
+        # so zlib's own header and checksum would only add 10 bytes
+        _c = _compressobj(
+            _level,
+            zlib.DEFLATED,
+            -zlib.MAX_WBITS,
+            zlib.DEF_MEM_LEVEL,
+            zlib.Z_DEFAULT_STRATEGY,
+            zdict,
+        )
+        return _c.compress(data) + _c.flush()
+
+    return compress
+
+
+def _lzma_compress(level: Optional[int]) -> Callable:
+    _preset = level
+
+    def compress(data: bytes) -> bytes:
+        return lzma.compress(data, preset=_preset)
+
+    return compress
+
+
+def _compressed_loads(
+    decompress: Callable,
+    loads: Callable,
+    value: bytes,
+) -> Any:
+    return loads(decompress(value))
+
+
+def _compressed_dumps_multi(
+    compress: Callable, dumps_multi: Callable, values: List[Any]
+) -> List[bytes]:
+    return [compress(v) for v in dumps_multi(values)]
+
+
+def _compressed_loads_multi(
+    decompress: Callable, loads_multi: Callable, values: List[bytes]
+) -> List[Any]:
+    return loads_multi([decompress(v) for v in values])
+
+
+def _skip_tag(decompress: Callable) -> Callable:
+    def decompress_tagged(data: bytes) -> bytes:
+        return decompress(data[2:])
+
+    return decompress_tagged
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+class Compressor(object):
+    """Compresses serialized values that are at least ``threshold`` bytes long
+    with ``codec`` (``"zlib"``, ``"lzma"`` or ``"zdict"``), at ``level``.
+
+    If compressing does not make a value smaller, it is stored uncompressed.
+    Values compressed with any of the codecs can be read, whichever codec is
+    configured.
+
+    ``"zdict"`` is zlib with a preset dictionary.  ``dictionaries`` maps ids
+    (0-255) to dictionaries, and values are written with ``dictionary_id`` (by
+    default, the highest id).  The id is stored after the header, so a new
+    dictionary can be rolled out by adding it under a new id; the old one must
+    be kept for as long as values written with it may be read.  Dictionaries
+    can be given with any codec, to read values written by another
+    configuration.
+
+    The counters are updated without locking, so under heavy concurrency they
+    are approximate.  They are meant for tuning ``threshold``:
+
+    * ``compressed`` / ``skipped`` - values that were or were not compressed
+    * ``bytes_in`` / ``bytes_out`` - sizes of the compressed values, before and
+      after compression
+    * ``compress_time`` / ``decompress_time`` - seconds spent in the codecs
+    * ``decompressed`` - values that were decompressed
+    """
+
+    def __init__(
+        self,
+        codec: str = "zlib",
+        threshold: Optional[int] = None,
+        level: Optional[int] = None,
+        dictionaries: Optional[Dict[int, bytes]] = None,
+        dictionary_id: Optional[int] = None,
+    ):
+        if codec not in _CODECS:
+            raise ValueError(
+                "unknown compression codec %r, expected one of %s"
+                % (codec, ", ".join(sorted(_CODECS)))
+            )
+        self.dictionaries: Dict[int, bytes] = dict(dictionaries or {})
+        for _id in self.dictionaries:
+            if not 0 <= _id <= 255:
+                raise ValueError("compression dictionary ids must be 0-255")
+        self.codec = codec
+        self.threshold = _THRESHOLDS[codec] if threshold is None else threshold
+        self.level = level
+        self.dictionary_id = None
+        if codec == "zdict":
+            if not self.dictionaries:
+                raise ValueError("the `zdict` codec requires `dictionaries`")
+            if dictionary_id is None:
+                dictionary_id = max(self.dictionaries)
+            if dictionary_id not in self.dictionaries:
+                raise ValueError(
+                    "unknown compression dictionary %r" % dictionary_id,
+                )
+            self.dictionary_id = dictionary_id
+            self._tag = bytes((MAGIC, TAG_ZDICT, dictionary_id))
+            _zdict = self.dictionaries[dictionary_id]
+            self._compress = _zdict_compress(level, _zdict)
+        elif codec == "zlib":
+            self._tag = bytes((MAGIC, TAG_ZLIB))
+            self._compress = _zlib_compress(level)
+        else:
+            self._tag = bytes((MAGIC, TAG_LZMA))
+            self._compress = _lzma_compress(level)
+        self._decompressors: Dict[int, Callable] = {
+            TAG_ZLIB: _skip_tag(zlib.decompress),
+            TAG_LZMA: _skip_tag(lzma.decompress),
+            TAG_ZDICT: self._zdict_decompress,
+        }
+        self.reset_stats()
+
+    def __reduce__(self):
+        # e.g. to load values on a process pool; the counters are not copied
+        return (
+            Compressor,
+            (
+                self.codec,
+                self.threshold,
+                self.level,
+                self.dictionaries,
+                self.dictionary_id,
+            ),
+        )
+
+    def reset_stats(self) -> None:
+        self.compressed = 0
+        self.skipped = 0
+        self.decompressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_time = 0.0
+        self.decompress_time = 0.0
+
+    @property
+    def ratio(self) -> float:
+        """the overall ratio of compressed to uncompressed size"""
+        if not self.bytes_in:
+            return 1.0
+        return self.bytes_out / self.bytes_in
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "compressed": self.compressed,
+            "skipped": self.skipped,
+            "decompressed": self.decompressed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": self.ratio,
+            "compress_time": self.compress_time,
+            "decompress_time": self.decompress_time,
+        }
+
+    def compress(self, data: bytes) -> bytes:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if len(data) < self.threshold:
+            self.skipped += 1
+            return _RAW + data
+        _start = time.perf_counter()
+        _compressed = self._compress(data)
+        self.compress_time += time.perf_counter() - _start
+        if len(_compressed) >= len(data):
+            self.skipped += 1
+            return _RAW + data
+        self.compressed += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(_compressed)
+        return self._tag + _compressed
+
+    def decompress(self, data: bytes) -> bytes:
+        if data[:1] != _MAGIC or len(data) < 2:
+            # no header; this was written without compression
+            return data
+        _tag = data[1]
+        if _tag == TAG_RAW:
+            return data[2:]
+        _decompress = self._decompressors.get(_tag)
+        if _decompress is None:
+            raise ValueError("value has an unknown compression tag %r" % _tag)
+        _start = time.perf_counter()
+        data = _decompress(data)
+        self.decompress_time += time.perf_counter() - _start
+        self.decompressed += 1
+        return data
+
+    def check_dumps(self, dumps: Callable, values: Iterable[Any]) -> None:
+        """
+        raises a `ValueError` if `dumps` serializes any of `values` to bytes
+        that start with the magic byte, as those would be read back as a
+        header.
+        """
+        for value in values:
+            try:
+                data = dumps(value)
+            except Exception:
+                # e.g. a custom `dumps` that only takes some types
+                continue
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            if data[:1] == _MAGIC:
+                raise ValueError(
+                    "`compression` can not be used with a `dumps` whose "
+                    "values can start with 0x%02x" % MAGIC
+                )
+
+    def _zdict_decompress(self, data: bytes) -> bytes:
+        zdict = self.dictionaries.get(data[2])
+        if zdict is None:
+            raise ValueError(
+                "value was compressed with unknown dictionary %r" % data[2]
+            )
+        _d = zlib.decompressobj(-zlib.MAX_WBITS, zdict)
+        return _d.decompress(data[3:]) + _d.flush()
+
+    def wrap_dumps(self, dumps: Callable) -> Callable:
+        compress = self.compress
+
+        def compressed_dumps(value):
+            return compress(dumps(value))
+
+        return compressed_dumps
+
+    def wrap_loads(self, loads: Callable) -> Callable:
+        # picklable if `loads` is
+        return functools.partial(_compressed_loads, self.decompress, loads)
+
+    def wrap_dumps_multi(self, dumps_multi: Callable) -> Callable:
+        return functools.partial(
+            _compressed_dumps_multi,
+            self.compress,
+            dumps_multi,
+        )
+
+    def wrap_loads_multi(self, loads_multi: Callable) -> Callable:
+        return functools.partial(
+            _compressed_loads_multi,
+            self.decompress,
+            loads_multi,
+        )
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+def train_dictionary(
+    samples: Iterable[bytes], size: int = 16384, ngram: int = 8
+) -> bytes:
+    """
+    builds a zlib preset dictionary of at most `size` bytes from `samples`.
+
+    every sample is scored by how common its `ngram`-byte substrings are
+    across all samples.  the best-scoring samples are added until the
+    dictionary is full, skipping samples that add little that is not already
+    covered.  the best samples go last, as deflate encodes the nearest matches
+    most cheaply.
+    """
+    size = min(size, ZDICT_MAX_SIZE)
+    _samples = [s for s in samples if len(s) >= ngram]
+    _grams: List[set] = [
+        {s[i : i + ngram] for i in range(len(s) - ngram + 1)} for s in _samples
+    ]
+    # in how many samples each substring appears
+    _frequency: Counter = Counter()
+    for g in _grams:
+        _frequency.update(g)
+    _scored = sorted(
+        range(len(_samples)),
+        key=lambda i: sum(_frequency[g] for g in _grams[i]) / len(_samples[i]),
+        reverse=True,
+    )
+    _covered: set = set()
+    _chosen: List[bytes] = []
+    _length = 0
+    for i in _scored:
+        if _length >= size:
+            break
+        g = _grams[i]
+        # substrings that only appear in this sample are no use to others
+        _shared = {_g for _g in g if _frequency[_g] > 1}
+        if not _shared or len(_shared - _covered) < len(_shared) / 4:
+            continue
+        _covered |= _shared
+        _chosen.append(_samples[i])
+        _length += len(_samples[i])
+    return b"".join(reversed(_chosen))[-size:]
+
+
+def dictionary_from_scan(
+    client: Any,
+    match: Optional[str] = None,
+    samples: int = 1000,
+    size: int = 16384,
+    compressor: Optional[Compressor] = None,
+) -> bytes:
+    """
+    builds a zlib preset dictionary from a sample of the string values in
+    Redis, found with `SCAN` over the keys matching `match`.
+
+    `client` is a `redis.StrictRedis`, e.g. ``region.backend.client``.  If the
+    values were written through a `Compressor`, pass it as `compressor` so the
+    samples are decompressed first.
+    """
+    _values: List[bytes] = []
+    _keys: List = []
+
+    def _fetch():
+        # redis.py command: `mget(keys, *args)`
+        for _v in client.mget(_keys):
+            # `None` for missing keys, and for keys that are not strings
+            if _v:
+                if compressor is not None:
+                    _v = compressor.decompress(_v)
+                _values.append(_v)
+        del _keys[:]
+
+    # redis.py command: `scan_iter(match=None, count=None)`
+    for _key in client.scan_iter(match=match, count=1000):
+        _keys.append(_key)
+        if len(_keys) == 100:
+            _fetch()
+            if len(_values) >= samples:
+                break
+    if _keys and len(_values) < samples:
+        _fetch()
+    return train_dictionary(_values[:samples], size=size)
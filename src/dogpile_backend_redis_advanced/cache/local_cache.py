@@ -0,0 +1,216 @@
+"""
+Local Cache
+-----------
+
+A bounded, process-local LRU that holds already-deserialized values in front
+of Redis, and a listener that keeps it coherent through Redis's server-assisted
+client-side caching (`CLIENT TRACKING`).
+
+"""
+# stdlib
+from collections import OrderedDict
+import logging
+import threading
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+
+# pypi
+from dogpile.cache.api import NO_VALUE
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+__all__ = ("LocalCache", "InvalidationListener")
+
+log = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "__redis__:invalidate"
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+class LocalCache(object):
+    """A thread-safe LRU bounded by entry count and by bytes.
+
+    The size of each entry is supplied by the caller; the backend uses the
+    length of the serialized value, which is a reasonable proxy for the
+    memory the deserialized value occupies.
+
+    Fills are guarded against racing invalidations: a reader calls `begin`
+    before fetching from Redis, and passes the returned token to `set`.  If the
+    key was invalidated in the meantime, the value may already be stale and is
+    discarded.  `end` releases whatever the reader did not fill.
+
+    Values are disabled until an `InvalidationListener` has established
+    tracking, and are disabled and cleared again if tracking is lost.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = False
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Any, Tuple[Any, int]]" = OrderedDict()
+        self._pending: Dict[Any, object] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return NO_VALUE
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value[0]
+
+    def begin(self, keys: Iterable[Any]) -> object:
+        token = object()
+        with self._lock:
+            if self.enabled:
+                for key in keys:
+                    self._pending[key] = token
+        return token
+
+    def end(self, keys: Iterable[Any], token: object) -> None:
+        with self._lock:
+            for key in keys:
+                if self._pending.get(key) is token:
+                    del self._pending[key]
+
+    def set(self, key: Any, value: Any, size: int, token: object) -> None:
+        with self._lock:
+            if self._pending.get(key) is not token:
+                return
+            del self._pending[key]
+            if size > self.max_bytes:
+                return
+            existing = self._data.pop(key, None)
+            if existing is not None:
+                self.nbytes -= existing[1]
+            self._data[key] = (value, size)
+            self.nbytes += size
+            max_entries, max_bytes = self.max_entries, self.max_bytes
+            while len(self._data) > max_entries or self.nbytes > max_bytes:
+                _, (_, _size) = self._data.popitem(last=False)
+                self.nbytes -= _size
+
+    def invalidate(self, keys: Iterable[Any]) -> None:
+        with self._lock:
+            for key in keys:
+                self._pending.pop(key, None)
+                existing = self._data.pop(key, None)
+                if existing is not None:
+                    self.nbytes -= existing[1]
+
+    def clear(self, enabled: Optional[bool] = None) -> None:
+        with self._lock:
+            self._data.clear()
+            self._pending.clear()
+            self.nbytes = 0
+            if enabled is not None:
+                self.enabled = enabled
+
+
+class InvalidationListener(threading.Thread):
+    """Subscribes to Redis's invalidation channel and applies the messages to a
+    `LocalCache`.
+
+    Two dedicated connections are made from the client's pool settings: one is
+    subscribed to ``__redis__:invalidate``, and the other enables
+    ``CLIENT TRACKING ... REDIRECT <id> BCAST`` towards it.  Broadcast mode is
+    used so the pool's own connections do not need tracking enabled; every
+    write to a key that matches ``prefixes`` (or to any key, if there are none)
+    is reported.
+
+    The tracking connection is pinged every ``interval`` seconds.  If either
+    connection fails, the local cache is cleared and disabled until tracking is
+    re-established.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        local_cache: LocalCache,
+        prefixes: Optional[Iterable[str]] = None,
+        interval: float = 1.0,
+    ):
+        super(InvalidationListener, self).__init__(
+            name="dogpile_backend_redis_advanced-invalidation", daemon=True
+        )
+        self.client = client
+        self.local_cache = local_cache
+        self.prefixes = list(prefixes or ())
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _connect(self) -> Tuple[Any, Any]:
+        pool = self.client.connection_pool
+        kwargs: Dict = pool.connection_kwargs
+        listener = pool.connection_class(**kwargs)
+        # redis command: `CLIENT ID`
+        listener.send_command("CLIENT", "ID")
+        client_id = listener.read_response()
+        # redis command: `SUBSCRIBE channel`
+        listener.send_command("SUBSCRIBE", INVALIDATION_CHANNEL)
+        listener.read_response()
+        tracker = pool.connection_class(**kwargs)
+        args = ["CLIENT", "TRACKING", "ON", "REDIRECT", client_id, "BCAST"]
+        for prefix in self.prefixes:
+            args.extend(("PREFIX", prefix))
+        # redis command: `CLIENT TRACKING ON REDIRECT id BCAST [PREFIX p ...]`
+        tracker.send_command(*args)
+        tracker.read_response()
+        return listener, tracker
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            listener = tracker = None
+            try:
+                listener, tracker = self._connect()
+                self.local_cache.clear(enabled=True)
+                while not self._stopped.is_set():
+                    if listener.can_read(timeout=self.interval):
+                        self._handle(listener.read_response())
+                    else:
+                        tracker.send_command("PING")
+                        tracker.read_response()
+            except Exception as exc:
+                log.debug("local cache invalidation listener failed: %r", exc)
+                self._stopped.wait(self.interval)
+            finally:
+                self.local_cache.clear(enabled=False)
+                for conn in (listener, tracker):
+                    if conn is not None:
+                        conn.disconnect()
+
+    def _handle(self, message: Any) -> None:
+        # `[b"message", b"__redis__:invalidate", [key, ...] or None]`, or
+        # `str`s with `decode_responses`
+        if not isinstance(message, list) or message[0] not in (
+            b"message",
+            "message",
+        ):
+            return
+        keys = message[2]
+        if keys is None:
+            # the server was flushed
+            self.local_cache.clear()
+        else:
+            self.local_cache.invalidate(
+                k.decode("utf-8") if isinstance(k, bytes) else k for k in keys
+            )
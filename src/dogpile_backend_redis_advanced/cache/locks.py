@@ -0,0 +1,757 @@
+"""
+Locks
+-----
+
+Distributed locks for the backends' ``get_mutex``.
+
+`NotifyLock` is a `redis.lock.Lock` whose waiters do not poll.  Releasing the
+lock pushes a wake-up token onto a list next to it, and a waiter blocks on
+that list with ``BLPOP`` until the token arrives -- or until the lock would
+expire on its own -- so it wakes as soon as the lock is free.
+
+`MultiLock` acquires the locks of many keys with a single script call, and
+reports which of them it got; `AsyncMultiLock` does the same on a
+``redis.asyncio`` client.
+
+`LeaseLock` is a `redis.lock.Lock` that a background watchdog keeps extending
+for as long as it is held, so a slow creator does not lose it.  Each
+acquisition also gets a fencing token -- a number that grows with every
+acquisition of the lock -- which a backend checks before it writes, so a
+holder that lost the lock anyway can not overwrite a newer value.
+
+`Semaphore` is a counting semaphore kept in a sorted set, and
+`SemaphoreMutex` is a lock that also takes one of its slots, so the number of
+regenerations running at once can be capped across every process.
+
+This module imports `redis`, so the backends only import it once they are
+used.
+"""
+# stdlib
+import heapq
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Set
+from typing import Tuple
+import uuid
+
+# pypi
+from redis.exceptions import LockError
+from redis.exceptions import LockNotOwnedError
+from redis.lock import Lock
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+__all__ = (
+    "AsyncMultiLock",
+    "LeaseLock",
+    "MultiLock",
+    "NotifyLock",
+    "Semaphore",
+    "SemaphoreMutex",
+    "fence_key",
+    "held_fence",
+    "signal_key",
+)
+
+# how long a wake-up token is kept when nobody is waiting for it
+SIGNAL_TTL_MS = 60000
+
+# how long a lock's fencing counter outlives its last acquisition
+FENCE_TTL_MS = 86400000
+
+
+def _registered(script: Optional[Callable]) -> Callable:
+    # the class attributes are `None` until `register_scripts` has run
+    if script is None:
+        raise RuntimeError("the lock's scripts have not been registered")
+    return script
+
+
+def _tagged(name: str, suffix: str) -> str:
+    # a key next to `name`, in the same cluster slot
+    _start = name.find("{")
+    if _start != -1 and name.find("}", _start + 1) > _start + 1:
+        # `name` has a hash tag already
+        return "%s:%s" % (name, suffix)
+    return "{%s}:%s" % (name, suffix)
+
+
+def signal_key(name: str) -> str:
+    """
+    the list a lock's wake-up token is pushed onto.  it hashes to the same
+    cluster slot as `name`, so both can be used in one script.
+    """
+    return _tagged(name, "signal")
+
+
+def fence_key(name: str) -> str:
+    """the counter a lock's fencing tokens are drawn from"""
+    return _tagged(name, "fence")
+
+
+class NotifyLock(Lock):
+    """A `redis.lock.Lock` that wakes its waiters when it is released, instead
+    of having them retry every ``sleep`` seconds.
+
+    A waiter that can not acquire the lock blocks on the lock's `signal_key`
+    with ``BLPOP``.  Releasing the lock pushes a single token there, so one
+    waiter wakes and tries again; when it releases the lock in turn, the next
+    one wakes.  If the lock has a ``timeout``, a waiter wakes no later than
+    when the lock would expire, so a holder that dies does not leave waiters
+    blocked.  Each blocked waiter holds a connection for as long as it waits.
+
+    ``sleep`` is not used, but is accepted so this can be passed as the
+    ``lock_class`` of ``client.lock``.  Requires Redis 6.0 or later, for
+    sub-second ``BLPOP`` timeouts.
+    """
+
+    lua_notify_acquire: Optional[Callable] = None
+    lua_notify_release: Optional[Callable] = None
+
+    # KEYS[1]: the lock
+    # ARGV[1]: the token; ARGV[2]: the timeout in milliseconds, or 0
+    # returns -3 if the lock was acquired, or else its ttl in milliseconds, or
+    # -1 if it has none
+    LUA_NOTIFY_ACQUIRE_SCRIPT = """
+        local acquired
+        if ARGV[2] ~= '0' then
+            acquired = redis.call('set', KEYS[1], ARGV[1], 'nx', 'px', ARGV[2])
+        else
+            acquired = redis.call('set', KEYS[1], ARGV[1], 'nx')
+        end
+        if acquired then
+            return -3
+        end
+        return redis.call('pttl', KEYS[1])
+    """
+
+    # KEYS[1]: the lock; KEYS[2]: its signal list
+    # ARGV[1]: the token; ARGV[2]: how long to keep the wake-up token
+    LUA_NOTIFY_RELEASE_SCRIPT = """
+        if redis.call('get', KEYS[1]) ~= ARGV[1] then
+            return 0
+        end
+        redis.call('del', KEYS[1], KEYS[2])
+        redis.call('rpush', KEYS[2], 1)
+        redis.call('pexpire', KEYS[2], ARGV[2])
+        return 1
+    """
+
+    def __init__(self, redis: Any, name: str, *args: Any, **kwargs: Any):
+        super(NotifyLock, self).__init__(redis, name, *args, **kwargs)
+        self.signal = signal_key(name)
+        # a `BLPOP` must return before the socket times out
+        self._socket_timeout: Optional[float] = getattr(
+            getattr(redis, "connection_pool", None), "connection_kwargs", {}
+        ).get("socket_timeout")
+
+    def register_scripts(self) -> None:
+        super(NotifyLock, self).register_scripts()
+        cls = self.__class__
+        if cls.lua_notify_acquire is None:
+            cls.lua_notify_acquire = self.redis.register_script(
+                cls.LUA_NOTIFY_ACQUIRE_SCRIPT
+            )
+        if cls.lua_notify_release is None:
+            cls.lua_notify_release = self.redis.register_script(
+                cls.LUA_NOTIFY_RELEASE_SCRIPT
+            )
+
+    def acquire(
+        self,
+        blocking: Optional[bool] = None,
+        blocking_timeout: Optional[float] = None,
+        token: Optional[Any] = None,
+    ) -> bool:
+        if token is None:
+            token = uuid.uuid1().hex.encode()
+        else:
+            token = self.redis.get_encoder().encode(token)
+        if blocking is None:
+            blocking = self.blocking
+        if blocking_timeout is None:
+            blocking_timeout = self.blocking_timeout
+        stop_trying_at = None
+        if blocking_timeout is not None:
+            stop_trying_at = time.monotonic() + blocking_timeout
+        _timeout = int(self.timeout * 1000) if self.timeout else 0
+        while True:
+            ttl = _registered(self.lua_notify_acquire)(
+                keys=[self.name], args=[token, _timeout], client=self.redis
+            )
+            if ttl == -3:
+                self.local.token = token
+                return True
+            if not blocking:
+                return False
+            # in seconds, the soonest of: the lock expiring, giving up, and
+            # the socket timing out.  0 blocks until the token arrives
+            _limits = [ttl / 1000.0] if ttl > 0 else []
+            if stop_trying_at is not None:
+                _remaining = stop_trying_at - time.monotonic()
+                if _remaining <= 0:
+                    return False
+                _limits.append(_remaining)
+            if self._socket_timeout:
+                _limits.append(self._socket_timeout / 2)
+            wait = max(min(_limits), 0.001) if _limits else 0
+            # redis.py command: `blpop(keys, timeout=0)`
+            self.redis.blpop([self.signal], timeout=wait)
+
+    def do_release(self, expected_token: bytes) -> None:
+        released = _registered(self.lua_notify_release)(
+            keys=[self.name, self.signal],
+            args=[expected_token, SIGNAL_TTL_MS],
+            client=self.redis,
+        )
+        if not released:
+            raise LockNotOwnedError(
+                "Cannot release a lock that's no longer owned",
+            )
+
+
+class MultiLock(object):
+    """The locks of many keys, acquired and released together without
+    blocking, in one script call each.
+
+    `acquire` takes every lock in ``names`` that is free and returns the
+    ``keys`` it got; the others are held elsewhere.  `release` frees the
+    locks that were acquired.  The locks are plain `redis.lock.Lock` locks,
+    so they exclude -- and are excluded by -- the locks of `get_mutex`.  With
+    ``notify``, `release` also wakes the `NotifyLock` waiters of each lock.
+
+    On a cluster, pass the client's ``keyslot``: the script is then run once
+    per hash slot of ``names``.
+    """
+
+    lua_acquire: Optional[Callable] = None
+    lua_release: Optional[Callable] = None
+
+    # KEYS: the locks
+    # ARGV[1]: the token; ARGV[2]: the timeout in milliseconds, or 0
+    # returns the (1-based) indexes of the locks that were acquired
+    LUA_ACQUIRE_SCRIPT = """
+        local acquired = {}
+        for i, name in ipairs(KEYS) do
+            local ok
+            if ARGV[2] ~= '0' then
+                ok = redis.call('set', name, ARGV[1], 'nx', 'px', ARGV[2])
+            else
+                ok = redis.call('set', name, ARGV[1], 'nx')
+            end
+            if ok then
+                acquired[#acquired + 1] = i
+            end
+        end
+        return acquired
+    """
+
+    # KEYS: the locks, followed by their signal lists if ARGV[2] is '1'
+    # ARGV[1]: the token; ARGV[3]: how long to keep a wake-up token
+    # returns the number of locks that were still held with the token
+    LUA_RELEASE_SCRIPT = """
+        local n = ARGV[2] == '1' and #KEYS / 2 or #KEYS
+        local released = 0
+        for i = 1, n do
+            if redis.call('get', KEYS[i]) == ARGV[1] then
+                redis.call('del', KEYS[i])
+                released = released + 1
+                if ARGV[2] == '1' then
+                    redis.call('del', KEYS[n + i])
+                    redis.call('rpush', KEYS[n + i], 1)
+                    redis.call('pexpire', KEYS[n + i], ARGV[3])
+                end
+            end
+        end
+        return released
+    """
+
+    def __init__(
+        self,
+        redis: Any,
+        keys: Sequence[Any],
+        names: Sequence[str],
+        timeout: Optional[float] = None,
+        notify: bool = False,
+        keyslot: Optional[Callable[[str], int]] = None,
+    ):
+        self.redis = redis
+        # the lock of each key, without duplicates
+        self.names: Dict[Any, str] = dict(zip(keys, names))
+        self.timeout = timeout
+        self.notify = notify
+        self.keyslot = keyslot
+        self.token: Optional[bytes] = None
+        self.owned: List[Any] = []
+        self.register_scripts()
+
+    def register_scripts(self) -> None:
+        cls = self.__class__
+        _register = self.redis.register_script
+        if cls.lua_acquire is None:
+            cls.lua_acquire = _register(cls.LUA_ACQUIRE_SCRIPT)
+        if cls.lua_release is None:
+            cls.lua_release = _register(cls.LUA_RELEASE_SCRIPT)
+
+    def _groups(self, keys: Sequence[Any]) -> List[List[Any]]:
+        """`keys`, split into the groups a single script call can use"""
+        if self.keyslot is None:
+            return [list(keys)] if keys else []
+        _slotted: Dict[int, List[Any]] = {}
+        for key in keys:
+            _slotted.setdefault(self.keyslot(self.names[key]), []).append(key)
+        return list(_slotted.values())
+
+    def _acquire_calls(self) -> List[Tuple[List[Any], List[str], List]]:
+        """the keys to acquire, and the keys and args of their script calls"""
+        if self.token is None:
+            self.token = uuid.uuid1().hex.encode()
+        _timeout = int(self.timeout * 1000) if self.timeout else 0
+        _owned = set(self.owned)
+        _wanted = [k for k in self.names if k not in _owned]
+        return [
+            (group, [self.names[k] for k in group], [self.token, _timeout])
+            for group in self._groups(_wanted)
+        ]
+
+    def _release_calls(
+        self,
+        owned: List[Any],
+    ) -> List[Tuple[List[str], List]]:
+        """the keys and args of the script calls that release `owned`"""
+        calls = []
+        _notify = "1" if self.notify else "0"
+        for group in self._groups(owned):
+            _names = [self.names[k] for k in group]
+            if self.notify:
+                _names.extend([signal_key(name) for name in _names])
+            calls.append((_names, [self.token, _notify, SIGNAL_TTL_MS]))
+        return calls
+
+    def _check_released(self, owned: List[Any], released: int) -> None:
+        if released < len(owned):
+            raise LockNotOwnedError(
+                "Cannot release %s locks that are no longer owned"
+                % (len(owned) - released)
+            )
+
+    def acquire(self) -> List[Any]:
+        """
+        acquires every free lock, and returns the keys whose locks are now
+        owned -- by this call or an earlier one.
+        """
+        lua_acquire = _registered(self.lua_acquire)
+        for group, keys, args in self._acquire_calls():
+            acquired = lua_acquire(keys=keys, args=args, client=self.redis)
+            self.owned.extend(group[i - 1] for i in acquired)
+        return list(self.owned)
+
+    def release(self) -> None:
+        """
+        releases the owned locks.  raises a `LockNotOwnedError` if any of
+        them had expired, once the others are released.
+        """
+        lua_release = _registered(self.lua_release)
+        owned, self.owned = self.owned, []
+        released = 0
+        for keys, args in self._release_calls(owned):
+            released += lua_release(keys=keys, args=args, client=self.redis)
+        self._check_released(owned, released)
+
+
+class AsyncMultiLock(MultiLock):
+    """A `MultiLock` for a ``redis.asyncio`` client, whose `acquire` and
+    `release` are coroutines.
+    """
+
+    # registered with an asyncio client
+    lua_acquire: Optional[Callable] = None
+    lua_release: Optional[Callable] = None
+
+    async def acquire(self) -> List[Any]:  # type: ignore[override]
+        lua_acquire = _registered(self.lua_acquire)
+        client = self.redis
+        for group, keys, args in self._acquire_calls():
+            acquired = await lua_acquire(keys=keys, args=args, client=client)
+            self.owned.extend(group[i - 1] for i in acquired)
+        return list(self.owned)
+
+    async def release(self) -> None:  # type: ignore[override]
+        lua_release = _registered(self.lua_release)
+        client = self.redis
+        owned, self.owned = self.owned, []
+        released = 0
+        for keys, args in self._release_calls(owned):
+            released += await lua_release(keys=keys, args=args, client=client)
+        self._check_released(owned, released)
+
+
+# the leases acquired by each thread, by lock name: `(fence, lease)`
+_held = threading.local()
+
+
+def held_fence(name: str) -> Optional[int]:
+    """the fencing token of the lease on `name` held by this thread, if any"""
+    fences = getattr(_held, "fences", None)
+    if not fences or name not in fences:
+        return None
+    fence, lease = fences[name]
+    if lease.fence != fence:
+        # released since, possibly by another thread
+        del fences[name]
+        return None
+    return fence
+
+
+class _Watchdog(object):
+    """extends the leases that are held, from a single daemon thread"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        # (due, seq, lease, token)
+        self._heap: List[Tuple[float, int, "LeaseLock", bytes]] = []
+        # (id(lease), token) of the leases being extended
+        self._watched: Set[Tuple[int, bytes]] = set()
+        self._seq = 0
+        self._thread: Optional[threading.Thread] = None
+        self.extended = 0
+        self.lost = 0
+
+    def watch(self, lease: "LeaseLock", token: bytes) -> None:
+        with self._cond:
+            self._watched.add((id(lease), token))
+            self._push(lease, token)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="dogpile-lease-watchdog",
+                    daemon=True,
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def unwatch(self, lease: "LeaseLock", token: bytes) -> None:
+        with self._cond:
+            # its heap entry is dropped when it comes due
+            self._watched.discard((id(lease), token))
+
+    def _push(self, lease: "LeaseLock", token: bytes) -> None:
+        self._seq += 1
+        _due = time.monotonic() + lease.interval
+        heapq.heappush(self._heap, (_due, self._seq, lease, token))
+
+    def _is_watched(self, lease: "LeaseLock", token: bytes) -> bool:
+        return (id(lease), token) in self._watched
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    _wait = None
+                    if self._heap:
+                        _wait = self._heap[0][0] - time.monotonic()
+                    self._cond.wait(_wait)
+                _due, _seq, lease, token = heapq.heappop(self._heap)
+                if not self._is_watched(lease, token):
+                    continue
+            try:
+                extended = lease.do_renew(token)
+            except Exception:
+                # e.g. a connection error; the next attempt may succeed
+                extended = True
+            with self._cond:
+                if not self._is_watched(lease, token):
+                    continue
+                if extended:
+                    self.extended += 1
+                    self._push(lease, token)
+                else:
+                    self.lost += 1
+                    self._watched.discard((id(lease), token))
+
+
+_watchdog = _Watchdog()
+
+
+class LeaseLock(Lock):
+    """A `redis.lock.Lock` that is extended in the background while it is
+    held, and has a fencing token.
+
+    Every ``interval`` seconds -- a third of ``timeout`` by default -- a
+    shared watchdog thread resets the lock's ttl to ``timeout``, until the
+    lock is released.  A holder that stops responding altogether still loses
+    the lock once ``timeout`` passes, as the watchdog dies with it.
+
+    Acquiring the lock increments a counter next to it (see `fence_key`);
+    the new value is the acquisition's ``fence``, and is kept for the
+    acquiring thread in `held_fence` until the lock is released.  A write
+    made while holding the lock can be rejected if the counter has moved past
+    its ``fence``, as someone else has acquired the lock since.  Requires a
+    ``timeout``.
+    """
+
+    lua_lease_acquire: Optional[Callable] = None
+
+    # KEYS[1]: the lock; KEYS[2]: its fencing counter
+    # ARGV[1]: the token; ARGV[2]: the timeout in milliseconds
+    # ARGV[3]: how long to keep the counter
+    # returns the fencing token, or 0 if the lock is held
+    LUA_LEASE_ACQUIRE_SCRIPT = """
+        if not redis.call('set', KEYS[1], ARGV[1], 'nx', 'px', ARGV[2]) then
+            return 0
+        end
+        local fence = redis.call('incr', KEYS[2])
+        redis.call('pexpire', KEYS[2], ARGV[3])
+        return fence
+    """
+
+    def __init__(
+        self,
+        redis: Any,
+        name: str,
+        timeout: Optional[float] = None,
+        *args: Any,
+        interval: Optional[float] = None,
+        **kwargs: Any,
+    ):
+        if not timeout:
+            raise ValueError("a `LeaseLock` requires a `timeout`")
+        super(LeaseLock, self).__init__(redis, name, timeout, *args, **kwargs)
+        self.fence_key = fence_key(name)
+        self.interval = interval or timeout / 3.0
+
+    def register_scripts(self) -> None:
+        super(LeaseLock, self).register_scripts()
+        cls = self.__class__
+        if cls.lua_lease_acquire is None:
+            cls.lua_lease_acquire = self.redis.register_script(
+                cls.LUA_LEASE_ACQUIRE_SCRIPT
+            )
+
+    @property
+    def fence(self) -> Optional[int]:
+        """the fencing token of the current acquisition, in this thread"""
+        return getattr(self.local, "fence", None)
+
+    def do_acquire(self, token: bytes) -> bool:
+        fence = _registered(self.lua_lease_acquire)(
+            keys=[self.name, self.fence_key],
+            args=[token, int(self.timeout * 1000), FENCE_TTL_MS],
+            client=self.redis,
+        )
+        if not fence:
+            return False
+        self.local.fence = fence
+        return True
+
+    def acquire(self, *args: Any, **kwargs: Any) -> bool:
+        if not super(LeaseLock, self).acquire(*args, **kwargs):
+            return False
+        if not hasattr(_held, "fences"):
+            _held.fences = {}
+        _held.fences[self.name] = (self.local.fence, self)
+        _watchdog.watch(self, self.local.token)
+        return True
+
+    def do_renew(self, token: bytes) -> bool:
+        """resets the ttl, if the lock is still held with `token`"""
+        return bool(
+            self.lua_extend(
+                keys=[self.name],
+                args=[token, int(self.timeout * 1000), "1"],
+                client=self.redis,
+            )
+        )
+
+    def do_release(self, expected_token: bytes) -> None:
+        _watchdog.unwatch(self, expected_token)
+        # this thread's `held_fence` forgets it now; another's on next use
+        fences = getattr(_held, "fences", {})
+        if fences.get(self.name, (None,))[0] == self.fence:
+            del fences[self.name]
+        self.local.fence = None
+        super(LeaseLock, self).do_release(expected_token)
+
+
+class Semaphore(object):
+    """A semaphore with ``limit`` slots, shared by every process that uses the
+    sorted set ``name``.
+
+    Each member of the set is a slot holder's token, scored by when the slot
+    expires on Redis' clock; expired slots are dropped before every attempt,
+    so a holder that dies frees its slot after ``timeout`` seconds.
+    """
+
+    lua_acquire: Optional[Callable] = None
+    lua_release: Optional[Callable] = None
+
+    # KEYS[1]: the sorted set
+    # ARGV[1]: the token; ARGV[2]: the limit; ARGV[3]: the timeout in
+    # milliseconds
+    # returns 1 if a slot was taken, else 0
+    LUA_ACQUIRE_SCRIPT = """
+        local time = redis.call('time')
+        local now = tonumber(time[1]) * 1000
+            + math.floor(tonumber(time[2]) / 1000)
+        redis.call('zremrangebyscore', KEYS[1], '-inf', now)
+        if redis.call('zcard', KEYS[1]) >= tonumber(ARGV[2]) then
+            return 0
+        end
+        redis.call('zadd', KEYS[1], now + tonumber(ARGV[3]), ARGV[1])
+        redis.call('pexpire', KEYS[1], ARGV[3])
+        return 1
+    """
+
+    # KEYS[1]: the sorted set
+    # ARGV[1]: the token
+    LUA_RELEASE_SCRIPT = """
+        return redis.call('zrem', KEYS[1], ARGV[1])
+    """
+
+    def __init__(
+        self,
+        redis: Any,
+        name: str,
+        limit: int,
+        timeout: float,
+        sleep: float = 0.1,
+    ):
+        if limit < 1:
+            raise ValueError("a `Semaphore` requires a `limit` of at least 1")
+        self.redis = redis
+        self.name = name
+        self.limit = limit
+        self.timeout = timeout
+        self.sleep = sleep
+        self.register_scripts()
+
+    def register_scripts(self) -> None:
+        cls = self.__class__
+        _register = self.redis.register_script
+        if cls.lua_acquire is None:
+            cls.lua_acquire = _register(cls.LUA_ACQUIRE_SCRIPT)
+        if cls.lua_release is None:
+            cls.lua_release = _register(cls.LUA_RELEASE_SCRIPT)
+
+    def acquire(
+        self, blocking: bool = True, blocking_timeout: Optional[float] = None
+    ) -> Optional[bytes]:
+        """
+        takes a slot, retrying every ``sleep`` seconds if `blocking`.
+        returns the slot's token, or `None` if no slot was taken.
+        """
+        token = uuid.uuid1().hex.encode()
+        stop_trying_at = None
+        if blocking_timeout is not None:
+            stop_trying_at = time.monotonic() + blocking_timeout
+        lua_acquire = _registered(self.lua_acquire)
+        while True:
+            if lua_acquire(
+                keys=[self.name],
+                args=[token, self.limit, int(self.timeout * 1000)],
+                client=self.redis,
+            ):
+                return token
+            if not blocking:
+                return None
+            if (
+                stop_trying_at is not None
+                and time.monotonic() + self.sleep > stop_trying_at
+            ):
+                return None
+            time.sleep(self.sleep)
+
+    def release(self, token: bytes) -> bool:
+        """frees the slot of `token`; `False` if it had expired"""
+        released = _registered(self.lua_release)(
+            keys=[self.name], args=[token], client=self.redis
+        )
+        return bool(released)
+
+    def holders(self) -> int:
+        """the number of slots taken, including any that have expired"""
+        return self.redis.zcard(self.name)
+
+
+class SemaphoreMutex(object):
+    """A key's ``mutex`` that must also take a slot of ``semaphore``.
+
+    The mutex is acquired first, so only one waiter per key competes for a
+    slot.  A non-blocking `acquire` that gets the mutex but no slot releases
+    the mutex and returns `False`, as if the mutex had been held -- dogpile
+    then serves the stale value, if there is one.  A blocking `acquire` waits
+    for a slot while holding the mutex.  Like a `redis.lock.Lock`, an
+    instance may be shared between threads.
+    """
+
+    def __init__(self, mutex: Any, semaphore: Semaphore):
+        self.mutex = mutex
+        self.semaphore = semaphore
+        # shared between threads when the mutex's token is, so a lock
+        # released by another thread frees its slot too
+        self.local: Any = (
+            threading.local()
+            if getattr(mutex, "thread_local", True)
+            else SimpleNamespace()
+        )
+
+    def acquire(
+        self,
+        blocking: Optional[bool] = None,
+        blocking_timeout: Optional[float] = None,
+    ) -> bool:
+        if blocking is None:
+            blocking = True
+        stop_trying_at = None
+        if blocking_timeout is not None:
+            stop_trying_at = time.monotonic() + blocking_timeout
+        while True:
+            if not self.mutex.acquire(
+                blocking=blocking, blocking_timeout=blocking_timeout
+            ):
+                return False
+            if stop_trying_at is not None:
+                blocking_timeout = max(stop_trying_at - time.monotonic(), 0)
+            try:
+                token = self.semaphore.acquire(blocking, blocking_timeout)
+            except BaseException:
+                self.mutex.release()
+                raise
+            if token is None:
+                self.mutex.release()
+                return False
+            if not getattr(self.mutex, "timeout", None):
+                break
+            # the mutex may have expired while waiting for the slot
+            try:
+                self.mutex.reacquire()
+                break
+            except LockError:
+                self.semaphore.release(token)
+                try:
+                    # forgets the token
+                    self.mutex.release()
+                except LockError:
+                    pass
+            if not blocking:
+                return False
+        self.local.token = token
+        return True
+
+    def release(self) -> None:
+        token = getattr(self.local, "token", None)
+        self.local.token = None
+        try:
+            if token is not None:
+                self.semaphore.release(token)
+        finally:
+            self.mutex.release()
@@ -0,0 +1,159 @@
+"""
+Parallel Loading
+----------------
+
+Deserializes large `get_multi` batches on a shared pool.
+
+A `ParallelLoader` splits a batch into one slice per worker and maps `loads`
+over each slice on a thread pool or a process pool; the results are joined
+back in order.  Batches smaller than the loader's ``threshold`` are loaded in
+the calling thread, as handing them to a pool costs more than it saves.
+
+A thread pool only helps when `loads` spends most of its time in code that
+releases the GIL, such as `zlib` or `lzma` decompression of large values.  A
+process pool works for pure-Python serializers too, but every value is sent
+to a worker and every result is pickled back, so it only wins on large
+batches of values that are expensive to load -- if at all: on the one host
+it has been benchmarked on, which had a single CPU, it was 2-4x slower than
+loading in the calling thread.  The default ``threshold`` of 10000 is not a
+measured crossover; see ``experiments/parallel_loads_bench.py``.
+
+The pools are created on first use and shared by every loader with the same
+kind and number of workers.
+"""
+# stdlib
+from concurrent.futures import Executor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import os
+import pickle
+import threading
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+__all__ = ("ParallelLoader", "shutdown_pools")
+
+_EXECUTORS: Dict[str, Callable] = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor,
+}
+
+_pools: Dict[Tuple[str, int], Executor] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(executor: str, workers: int) -> Executor:
+    _key = (executor, workers)
+    pool = _pools.get(_key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(_key)
+            if pool is None:
+                pool = _pools[_key] = _EXECUTORS[executor](max_workers=workers)
+    return pool
+
+
+def shutdown_pools(wait: bool = True) -> None:
+    """shuts down the shared pools; they are recreated on next use"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=wait)
+
+
+def _loads_slice(loads: Callable, values: Sequence[bytes]) -> List[Any]:
+    # module-level, so a process pool can pickle it
+    return [loads(v) for v in values]
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+class ParallelLoader(object):
+    """Maps `loads` over batches of at least ``threshold`` values on a shared
+    ``"thread"`` or ``"process"`` pool of ``workers`` workers (by default, one
+    per CPU).
+
+    With a process pool, `loads` and the loaded values must be picklable; the
+    built-in serializers and `compression.Compressor` are, but any counters
+    they keep are only updated in the worker processes.
+
+    The counters are updated without locking, so under heavy concurrency they
+    are approximate:
+
+    * ``parallel`` / ``serial`` - batches that were or were not loaded on the
+      pool
+    """
+
+    def __init__(
+        self,
+        executor: str = "thread",
+        threshold: int = 10000,
+        workers: Optional[int] = None,
+    ):
+        if executor not in _EXECUTORS:
+            raise ValueError(
+                "unknown executor %r, expected one of %s"
+                % (executor, ", ".join(sorted(_EXECUTORS)))
+            )
+        self.executor = executor
+        self.threshold = threshold
+        self.workers = workers or os.cpu_count() or 1
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.parallel = 0
+        self.serial = 0
+
+    def check_loads(self, loads: Callable) -> None:
+        """raises a `ValueError` if `loads` can not be used with the pool"""
+        if self.executor != "process":
+            return
+        try:
+            pickle.dumps(loads)
+        except Exception as exc:
+            raise ValueError(
+                "the `process` executor requires a picklable `loads`: %s" % exc
+            )
+
+    def map(self, loads: Callable, values: Sequence[bytes]) -> List[Any]:
+        """returns ``[loads(v) for v in values]``"""
+        if len(values) < self.threshold or self.workers < 2:
+            self.serial += 1
+            return [loads(v) for v in values]
+        return self._map_slices(functools.partial(_loads_slice, loads), values)
+
+    def map_multi(
+        self,
+        loads_multi: Callable,
+        values: Sequence[bytes],
+    ) -> List[Any]:
+        """returns ``loads_multi(values)``, calling it once per slice"""
+        if len(values) < self.threshold or self.workers < 2:
+            self.serial += 1
+            return loads_multi(values)
+        return self._map_slices(loads_multi, values)
+
+    def _map_slices(self, fn: Callable, values: Sequence[bytes]) -> List[Any]:
+        self.parallel += 1
+        pool = _get_pool(self.executor, self.workers)
+        size = -(-len(values) // self.workers)
+        futures = [
+            pool.submit(fn, values[start : start + size])
+            for start in range(0, len(values), size)
+        ]
+        loaded: List[Any] = []
+        for future in futures:
+            loaded.extend(future.result())
+        return loaded
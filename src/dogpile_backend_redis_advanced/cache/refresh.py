@@ -0,0 +1,146 @@
+"""
+Background Refresh
+------------------
+
+Stale-while-revalidate for dogpile regions.
+
+A region's ``expiration_time`` is a soft ttl: once it passes, the value is
+still in Redis until ``redis_expiration_time`` -- the hard ttl -- removes it.
+When `get_or_create` finds a value between the two, and gets the key's lock,
+it hands the regeneration to the region's ``async_creation_runner`` and
+returns the stale value at once.  `BackgroundRefresher` is such a runner: it
+regenerates values on a bounded thread pool, and lets go of the lock when it
+is done.  Every other caller, in this process or another, fails to get the
+lock and is served the stale value too, so each key is refreshed once across
+the fleet.
+"""
+# stdlib
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Optional
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+__all__ = ("BackgroundRefresher",)
+
+log = logging.getLogger(__name__)
+
+
+class BackgroundRefresher(object):
+    """A dogpile ``async_creation_runner`` that regenerates values on a pool
+    of ``workers`` threads.
+
+    At most ``max_pending`` refreshes are queued or running at once; past
+    that, the key's lock is released without regenerating it, so the stale
+    value is served until a later read schedules the refresh.  A creator
+    that raises is logged, and the stale value is kept.
+
+    The lock is released by a pool thread, so a distributed lock must not be
+    thread-local: set ``thread_local_lock`` to `False`.
+
+    The counters are updated under the lock:
+
+    * ``refreshed`` - values regenerated and written
+    * ``failed`` - refreshes whose creator or write raised
+    * ``dropped`` - refreshes skipped, as ``max_pending`` were in progress or
+      the pool was shut down
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 100):
+        if workers < 1:
+            raise ValueError("`workers` must be at least 1")
+        self.workers = workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.refreshed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    @property
+    def pending(self) -> int:
+        """the refreshes queued or running"""
+        return self._pending
+
+    def __call__(
+        self,
+        cache: Any,
+        key: Any,
+        creator: Callable,
+        mutex: Any,
+    ) -> None:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                pool = None
+            else:
+                self._pending += 1
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix="dogpile-refresh",
+                    )
+                pool = self._pool
+        if pool is None:
+            mutex.release()
+            return
+        try:
+            pool.submit(self._refresh, cache, key, creator, mutex)
+        except RuntimeError:
+            # the pool was shut down after it was taken; the refresh never
+            # ran, so it is skipped like one over `max_pending`
+            with self._lock:
+                self._pending -= 1
+                self.dropped += 1
+            mutex.release()
+
+    def _refresh(
+        self,
+        cache: Any,
+        key: Any,
+        creator: Callable,
+        mutex: Any,
+    ) -> None:
+        error = None
+        try:
+            cache.set(key, creator())
+        except Exception as exc:
+            error = exc
+            log.exception("background refresh of %r failed", key)
+        finally:
+            try:
+                mutex.release()
+            finally:
+                self._done(error)
+
+    def _done(self, error: Optional[BaseException]) -> None:
+        with self._lock:
+            self._pending -= 1
+            if error is None:
+                self.refreshed += 1
+            else:
+                self.failed += 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        """shuts down the pool; it is recreated on next use"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
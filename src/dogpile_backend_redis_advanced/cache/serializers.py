@@ -0,0 +1,567 @@
+"""
+Serializers
+-----------
+
+Serializers that can be selected by name with the ``serializer`` argument of
+the backends, instead of passing ``loads`` and ``dumps`` callables.
+
+* ``"pickle"`` - the default; ``pickle.loads`` and ``pickle.dumps``
+* ``"msgpack"`` - `MsgpackSerializer`, which keeps dogpile's `CachedValue`
+  envelope
+* ``"msgpack_raw"`` - `MsgpackRawSerializer`, which only stores the payload
+  and leaves expiry to Redis
+* ``"msgpack_lazy"`` - `MsgpackLazySerializer`, like ``"msgpack"``, but dicts
+  are loaded as `LazyDeserializer`s that only decode their ``ExtType`` and
+  nested values when they are accessed
+* ``"envelope"`` - `EnvelopeSerializer`, a compact binary `CachedValue`
+  envelope around a pickled payload
+* ``"envelope_msgpack"`` - `EnvelopeSerializer` around a msgpack payload
+* ``"envelope_msgpack_lazy"`` - `EnvelopeSerializer` around a lazily loaded
+  msgpack payload
+
+The msgpack serializers require the ``msgpack`` package.
+
+"""
+# stdlib
+import datetime
+import decimal
+import functools
+import pickle
+import struct
+import threading
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import Tuple
+import uuid
+
+# pypi
+from dogpile.cache.api import CachedValue
+from dogpile.cache.region import value_version
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+__all__ = (
+    "LazyCachedValue",
+    "LazyDeserializer",
+    "MsgpackSerializer",
+    "MsgpackLazySerializer",
+    "MsgpackRawSerializer",
+    "EnvelopeSerializer",
+    "get_serializer",
+)
+
+# the msgpack `ExtType` codes
+EXT_DATETIME = 1
+EXT_DATE = 2
+EXT_TIMEDELTA = 3
+EXT_DECIMAL = 4
+EXT_UUID = 5
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+# seconds and microseconds since the epoch, of the wall-clock time
+_struct_datetime = struct.Struct(">qI")
+# ... followed by the UTC offset in seconds, for aware datetimes
+_struct_datetime_tz = struct.Struct(">qIi")
+# the proleptic Gregorian ordinal
+_struct_date = struct.Struct(">I")
+# days, seconds, microseconds
+_struct_timedelta = struct.Struct(">iII")
+
+# the `EnvelopeSerializer` header: version, created time (seconds), flags
+_struct_envelope = struct.Struct(">BIB")
+ENVELOPE_VERSION = 1
+# the value is not a `CachedValue`; the created time is not used
+ENVELOPE_FLAG_BARE = 0x01
+# the header is followed by the creator's cost
+ENVELOPE_FLAG_COST = 0x02
+# the time the creator took, in milliseconds; the ``"d"`` of the metadata
+_struct_envelope_cost = struct.Struct(">I")
+
+
+def _ext_default(obj: Any) -> Any:
+    """the `default` of the `Packer`: encodes the types msgpack lacks"""
+    if isinstance(obj, datetime.datetime):
+        _offset = obj.utcoffset()
+        _delta = obj.replace(tzinfo=None) - _EPOCH
+        _seconds = _delta.days * 86400 + _delta.seconds
+        if _offset is None:
+            return msgpack.ExtType(
+                EXT_DATETIME,
+                _struct_datetime.pack(_seconds, _delta.microseconds),
+            )
+        return msgpack.ExtType(
+            EXT_DATETIME,
+            _struct_datetime_tz.pack(
+                _seconds,
+                _delta.microseconds,
+                _offset.days * 86400 + _offset.seconds,
+            ),
+        )
+    elif isinstance(obj, datetime.date):
+        return msgpack.ExtType(EXT_DATE, _struct_date.pack(obj.toordinal()))
+    elif isinstance(obj, datetime.timedelta):
+        return msgpack.ExtType(
+            EXT_TIMEDELTA,
+            _struct_timedelta.pack(obj.days, obj.seconds, obj.microseconds),
+        )
+    elif isinstance(obj, decimal.Decimal):
+        return msgpack.ExtType(EXT_DECIMAL, str(obj).encode("ascii"))
+    elif isinstance(obj, uuid.UUID):
+        return msgpack.ExtType(EXT_UUID, obj.bytes)
+    elif isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError("can not serialize %r" % (obj,))
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    """the `ext_hook` of `unpackb`; decodes the types `_ext_default` encodes"""
+    if code == EXT_DATETIME:
+        if len(data) == _struct_datetime.size:
+            _seconds, _microseconds = _struct_datetime.unpack(data)
+            return _EPOCH + datetime.timedelta(
+                seconds=_seconds, microseconds=_microseconds
+            )
+        _seconds, _microseconds, _offset = _struct_datetime_tz.unpack(data)
+        _value = _EPOCH + datetime.timedelta(
+            seconds=_seconds, microseconds=_microseconds
+        )
+        _tz = datetime.timezone(datetime.timedelta(seconds=_offset))
+        return _value.replace(tzinfo=_tz)
+    elif code == EXT_DATE:
+        return datetime.date.fromordinal(_struct_date.unpack(data)[0])
+    elif code == EXT_TIMEDELTA:
+        _days, _seconds, _microseconds = _struct_timedelta.unpack(data)
+        return datetime.timedelta(_days, _seconds, _microseconds)
+    elif code == EXT_DECIMAL:
+        return decimal.Decimal(data.decode("ascii"))
+    elif code == EXT_UUID:
+        return uuid.UUID(bytes=data)
+    return msgpack.ExtType(code, data)
+
+
+class DecodedList(list):
+    """a list whose items have been passed through `_decode_lazy`"""
+
+    __slots__ = ()
+
+
+def _decode_lazy(value: Any) -> Any:
+    """
+    decodes a value unpacked by `MsgpackLazySerializer`, one level deep: the
+    deferred ``ExtType``s are decoded, and lists are decoded item by item.
+    dicts are already `LazyDeserializer`s.
+    """
+    _type = type(value)
+    if _type is slice:
+        return _ext_hook(value.start, value.stop)
+    elif _type is list:
+        return DecodedList([_decode_lazy(v) for v in value])
+    return value
+
+
+class LazyDeserializer(dict):
+    """A dict loaded by `MsgpackLazySerializer`, whose values are only decoded
+    when they are accessed.
+
+    ``ExtType`` values are decoded and lists are decoded item by item; the
+    results are stored back, so each value is decoded at most once.  Nested
+    dicts are `LazyDeserializer`s too.  A wide record of which only a few
+    fields are read only pays for those fields.
+
+    Reading through ``[]``, ``get``, ``values``, ``items``, ``pop`` or
+    ``setdefault``, or copying into a `dict`, decodes values; comparing,
+    ``repr`` and pickling decode everything.  Pickling produces a plain dict.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if type(value) in _LAZY_TYPES:
+            value = _decode_lazy(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def pop(self, key, *args):
+        if key in self:
+            value = self[key]
+            dict.__delitem__(self, key)
+            return value
+        return dict.pop(self, key, *args)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        dict.__setitem__(self, key, default)
+        return default
+
+    def __iter__(self):
+        # defined so that `dict(self)` and `{**self}` read through
+        # `__getitem__`, instead of copying the undecoded values
+        return dict.__iter__(self)
+
+    def values(self):
+        return [self[k] for k in dict.keys(self)]
+
+    def items(self):
+        return [(k, self[k]) for k in dict.keys(self)]
+
+    def copy(self):
+        return LazyDeserializer(dict.copy(self))
+
+    def decode(self) -> "LazyDeserializer":
+        """decodes every value, at any depth"""
+        for _k in dict.keys(self):
+            _v = self[_k]
+            if isinstance(_v, LazyDeserializer):
+                _v.decode()
+        return self
+
+    def __eq__(self, other):
+        self.decode()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        self.decode()
+        return dict.__ne__(self, other)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self):
+        self.decode()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        return (dict, (dict(self.items()),))
+
+
+# the types `_decode_lazy` changes; exact types, as `DecodedList` subclasses
+# `list`
+_LAZY_TYPES = (slice, list)
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+class MsgpackSerializer(object):
+    """Serializes with msgpack, keeping dogpile's `CachedValue` envelope.
+
+    ``datetime``, ``date``, ``timedelta``, ``Decimal`` and ``UUID`` values are
+    encoded as compact ``ExtType``s.  Aware datetimes keep their UTC offset,
+    but not the name of their timezone.  Tuples and sets are loaded as lists.
+
+    A `msgpack.Packer` is kept per thread, as a `Packer` is not thread-safe.
+    Loading uses ``msgpack.unpackb`` with its options bound once; a reused
+    streaming `msgpack.Unpacker` was measured to be slower for one-shot values.
+
+    An instance provides the ``loads`` and ``dumps`` callables for a backend.
+    """
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError(
+                "the `msgpack` package is required for the msgpack serializers"
+            )
+        self._local = threading.local()
+        self._unpackb = functools.partial(
+            msgpack.unpackb,
+            ext_hook=_ext_hook,
+            raw=False,
+            strict_map_key=False,
+        )
+
+    def _packer(self) -> Any:
+        try:
+            return self._local.packer
+        except AttributeError:
+            packer = self._local.packer = msgpack.Packer(
+                default=_ext_default, use_bin_type=True, autoreset=True
+            )
+            return packer
+
+    def __reduce__(self):
+        # the per-thread `Packer`s can not be pickled
+        return (type(self), ())
+
+    def pack(self, value: Any) -> bytes:
+        """packs `value` as-is"""
+        return self._packer().pack(value)
+
+    def unpack(self, value: bytes) -> Any:
+        """unpacks `value` as-is"""
+        return self._unpackb(value)
+
+    def dumps(self, value: Any) -> bytes:
+        # a `CachedValue` is a tuple, so is packed as `[payload, metadata]`
+        return self._packer().pack(value)
+
+    def dumps_multi(self, values: List[Any]) -> List[bytes]:
+        """`dumps` for a batch, looking up the thread's `Packer` once"""
+        pack = self._packer().pack
+        return [pack(v) for v in values]
+
+    def loads(self, value: bytes) -> Any:
+        value = self._unpackb(value)
+        if (
+            isinstance(value, list)
+            and len(value) == 2
+            and isinstance(value[1], dict)
+            and "ct" in value[1]
+        ):
+            return CachedValue(value[0], value[1])
+        # not written through a region; e.g. a raw value
+        return value
+
+
+class MsgpackLazySerializer(MsgpackSerializer):
+    """Like `MsgpackSerializer`, but dicts are loaded as `LazyDeserializer`s.
+
+    The containers are unpacked eagerly, but the ``ExtType`` values inside
+    them (datetimes, dates, Decimals...) are only decoded when they are
+    accessed.  A top-level list is decoded eagerly.
+    """
+
+    def __init__(self):
+        super(MsgpackLazySerializer, self).__init__()
+        # `slice` is the cheapest callable msgpack can hand an ext's code and
+        # data to: creating an `ExtType` costs nearly as much as decoding it
+        _unpackb = functools.partial(
+            msgpack.unpackb,
+            raw=False,
+            strict_map_key=False,
+            ext_hook=slice,
+            object_hook=LazyDeserializer,
+        )
+
+        def unpackb(value):
+            return _decode_lazy(_unpackb(value))
+
+        self._unpackb = unpackb
+
+
+class MsgpackRawSerializer(MsgpackSerializer):
+    """Serializes only the payload of dogpile's `CachedValue` with msgpack,
+    like `MsgpackSerializer`.
+
+    When loading, the `CachedValue` is rebuilt with the current time, so
+    dogpile considers every value fresh; expiry must be left to Redis with
+    ``redis_expiration_time``.
+    """
+
+    def dumps(self, value: Any) -> bytes:
+        if isinstance(value, CachedValue):
+            value = value.payload
+        return self._packer().pack(value)
+
+    def loads(self, value: bytes) -> Any:
+        return CachedValue(
+            self._unpackb(value), {"ct": time.time(), "v": value_version}
+        )
+
+    def dumps_multi(self, values: List[Any]) -> List[bytes]:
+        pack = self._packer().pack
+        return [
+            pack(value.payload if isinstance(value, CachedValue) else value)
+            for value in values
+        ]
+
+    def loads_multi(self, values: List[bytes]) -> List[Any]:
+        """`loads` for a batch, which shares a single created time"""
+        unpackb = self._unpackb
+        _now = time.time()
+        return [
+            CachedValue(unpackb(value), {"ct": _now, "v": value_version})
+            for value in values
+        ]
+
+
+class LazyCachedValue(CachedValue):
+    """A `CachedValue` that holds its serialized payload, and only
+    deserializes it on first access.
+
+    The metadata is available without deserializing anything, so dogpile can
+    check the expiry of a value -- and discard it -- without paying for its
+    payload.  The payload is deserialized at most once, unless two threads
+    race to be first.
+    """
+
+    _loads: Callable
+    # set once the payload is deserialized
+    _payload: Any
+
+    def __new__(cls, data: bytes, metadata: Mapping, loads: Callable):
+        self = tuple.__new__(cls, (data, metadata))
+        self._loads = loads
+        return self
+
+    @property
+    def payload(self) -> Any:
+        try:
+            return self._payload
+        except AttributeError:
+            payload = self._payload = self._loads(tuple.__getitem__(self, 0))
+            return payload
+
+    @property
+    def loaded(self) -> bool:
+        """whether the payload has been deserialized"""
+        return "_payload" in self.__dict__
+
+    def with_metadata(self, metadata: Mapping) -> "LazyCachedValue":
+        """a copy with other metadata, sharing the payload if it is loaded"""
+        data: bytes = tuple.__getitem__(self, 0)
+        value = LazyCachedValue(data, metadata, self._loads)
+        if self.loaded:
+            value._payload = self._payload
+        return value
+
+    def __getitem__(self, index):
+        if index == 0:
+            return self.payload
+        return tuple.__getitem__(self, index)
+
+    def __iter__(self):
+        yield self.payload
+        yield self.metadata
+
+
+def _pickle_dumps(value: Any) -> bytes:
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+class EnvelopeSerializer(object):
+    """Stores dogpile's `CachedValue` as a 6-byte binary header followed by
+    the payload, serialized with ``dumps``; by default, pickle.
+
+    The header is a version byte, the created time in whole seconds as a
+    uint32, and a flags byte.  This replaces the pickled ``{"ct": ..., "v":
+    ...}`` metadata dict, which is most of the size of a small value, while
+    dogpile can still expire values on its own.  Created times are truncated
+    to the second, so a value may be considered up to a second older than it
+    is.  If the metadata records the creator's cost -- the ``"d"`` set by the
+    ``xfetch_expiration_time`` option -- it is kept in 4 more bytes, in
+    milliseconds.
+
+    `loads` rebuilds a real `CachedValue`.  Values that are not a
+    `CachedValue` are flagged as bare and returned as they were.  Values that
+    do not start with the version byte -- e.g. written before the envelope was
+    enabled -- are passed to ``loads`` as they are; that works for pickle,
+    but is ambiguous for serializers whose output can start with ``\x01``.
+    The version byte is not the ``\xc1`` that starts a compression header,
+    so enveloped values can be read whether or not compression is enabled.
+    """
+
+    def __init__(
+        self,
+        loads: Callable = pickle.loads,
+        dumps: Callable = _pickle_dumps,
+    ):
+        self._loads = loads
+        self._dumps = dumps
+        self._version = bytes((ENVELOPE_VERSION,))
+        self._header_bare = _struct_envelope.pack(
+            ENVELOPE_VERSION, 0, ENVELOPE_FLAG_BARE
+        )
+
+    def dumps(self, value: Any) -> bytes:
+        if isinstance(value, CachedValue):
+            _cost = value.metadata.get("d")
+            if _cost is None:
+                return _struct_envelope.pack(
+                    ENVELOPE_VERSION, int(value.metadata["ct"]), 0
+                ) + self._dumps(value.payload)
+            _created = int(value.metadata["ct"])
+            _cost_ms = min(int(_cost * 1000), 0xFFFFFFFF)
+            return (
+                _struct_envelope.pack(
+                    ENVELOPE_VERSION,
+                    _created,
+                    ENVELOPE_FLAG_COST,
+                )
+                + _struct_envelope_cost.pack(_cost_ms)
+                + self._dumps(value.payload)
+            )
+        return self._header_bare + self._dumps(value)
+
+    def _unpack_header(self, value: bytes) -> Tuple[int, Dict, int]:
+        """the flags, metadata and payload offset of an enveloped value"""
+        _, _created, _flags = _struct_envelope.unpack_from(value)
+        metadata = {"ct": _created, "v": value_version}
+        _offset = _struct_envelope.size
+        if not _flags & ENVELOPE_FLAG_COST:
+            return _flags, metadata, _offset
+        (_cost,) = _struct_envelope_cost.unpack_from(value, _offset)
+        metadata["d"] = _cost / 1000.0
+        return _flags, metadata, _offset + _struct_envelope_cost.size
+
+    def loads(self, value: bytes) -> Any:
+        if value[:1] != self._version:
+            return self._loads(value)
+        _flags, metadata, _offset = self._unpack_header(value)
+        payload = self._loads(value[_offset:])
+        if _flags & ENVELOPE_FLAG_BARE:
+            return payload
+        return CachedValue(payload, metadata)
+
+    def loads_lazy(self, value: bytes) -> Any:
+        """
+        like `loads`, but only reads the header; the payload of a
+        `CachedValue` is deserialized on first access.
+        """
+        if value[:1] != self._version:
+            return self._loads(value)
+        _flags, metadata, _offset = self._unpack_header(value)
+        if _flags & ENVELOPE_FLAG_BARE:
+            return self._loads(value[_offset:])
+        return LazyCachedValue(value[_offset:], metadata, self._loads)
+
+
+def _envelope_msgpack() -> EnvelopeSerializer:
+    _msgpack = MsgpackSerializer()
+    return EnvelopeSerializer(loads=_msgpack.unpack, dumps=_msgpack.pack)
+
+
+def _envelope_msgpack_lazy() -> EnvelopeSerializer:
+    _msgpack = MsgpackLazySerializer()
+    return EnvelopeSerializer(loads=_msgpack.unpack, dumps=_msgpack.pack)
+
+
+_SERIALIZERS: Dict[str, Callable] = {
+    "msgpack": MsgpackSerializer,
+    "msgpack_raw": MsgpackRawSerializer,
+    "msgpack_lazy": MsgpackLazySerializer,
+    "envelope": EnvelopeSerializer,
+    "envelope_msgpack": _envelope_msgpack,
+    "envelope_msgpack_lazy": _envelope_msgpack_lazy,
+}
+
+
+def get_serializer(name: str) -> Tuple[Callable, Callable]:
+    """returns the `(loads, dumps)` of the serializer called `name`"""
+    if name == "pickle":
+        return pickle.loads, _pickle_dumps
+    try:
+        serializer = _SERIALIZERS[name]()
+    except KeyError:
+        raise ValueError(
+            "unknown serializer %r, expected one of %s"
+            % (name, ", ".join(["pickle"] + sorted(_SERIALIZERS)))
+        )
+    return serializer.loads, serializer.dumps
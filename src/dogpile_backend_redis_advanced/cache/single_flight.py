@@ -0,0 +1,190 @@
+"""
+Single Flight
+-------------
+
+Coalesces concurrent reads of the same key within a process.
+
+When several threads read a key at the same time, only the first -- the
+leader -- sends a request to Redis and deserializes the value; the others wait
+for it and share its result, including any exception it raised.  Reads that
+come in after the leader has finished start a new request, so nothing is
+cached beyond the lifetime of a request.
+
+Every thread that joins a request gets the same loaded object, so a value
+that is mutated after a read is mutated for every thread that shared it.
+"""
+# stdlib
+import functools
+import threading
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+__all__ = ("SingleFlight",)
+
+
+class _Call(object):
+    """a request in flight"""
+
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+    def wait(self) -> Any:
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight(object):
+    """Shares one in-flight request, and its result, between the threads that
+    read the same key at the same time.
+
+    A write must call `forget` for its keys once it is done, so reads that
+    follow it do not join a request that may have started before it.
+
+    The counters are updated under the lock:
+
+    * ``leaders`` - keys that were requested from Redis
+    * ``merged`` - keys that were read by joining another thread's request
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, _Call] = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.leaders = 0
+        self.merged = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"leaders": self.leaders, "merged": self.merged}
+
+    def do(self, key: Any, fn: Callable[[], Any]) -> Any:
+        """returns ``fn()``, or the result of a concurrent call for `key`"""
+        _leader = False
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.merged += 1
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                _leader = True
+        if not _leader:
+            return call.wait()
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            self._done([(key, call)])
+        return call.result
+
+    def do_multi(
+        self, keys: Sequence[Any], fn: Callable[[List[Any]], List[Any]]
+    ) -> List[Any]:
+        """
+        returns the values of `keys`, in order.  `fn` is called with the keys
+        that are not already in flight, and must return their values in
+        order; the others are waited for once `fn` has returned.
+        """
+        _led = []
+        _joined = []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    _led.append((key, call))
+                else:
+                    _joined.append((key, call))
+            self.leaders += len(_led)
+            self.merged += len(_joined)
+        results = {}
+        if _led:
+            try:
+                values = fn([key for key, _call in _led])
+            except BaseException as exc:
+                for _key, call in _led:
+                    call.error = exc
+                raise
+            else:
+                for (key, call), value in zip(_led, values):
+                    call.result = results[key] = value
+            finally:
+                self._done(_led)
+        # the keys led by this thread are released before waiting on others,
+        # so two overlapping batches can not wait on each other
+        for key, call in _joined:
+            results[key] = call.wait()
+        return [results[key] for key in keys]
+
+    def forget(self, keys: Iterable[Any]) -> None:
+        """
+        detaches the requests in flight for `keys`, so later reads start new
+        ones.  the threads already waiting on them still get their results.
+        """
+        with self._lock:
+            for key in keys:
+                self._calls.pop(key, None)
+
+    def _done(self, calls: List) -> None:
+        with self._lock:
+            for key, call in calls:
+                # unless a write has detached it already
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+        for _key, call in calls:
+            call.event.set()
+
+    def wrap_get(self, get: Callable) -> Callable:
+        do = self.do
+
+        @functools.wraps(get)
+        def single_flight_get(key):
+            return do(key, functools.partial(get, key))
+
+        return single_flight_get
+
+    def wrap_get_multi(self, get_multi: Callable) -> Callable:
+        do_multi = self.do_multi
+
+        @functools.wraps(get_multi)
+        def single_flight_get_multi(keys):
+            if not keys:
+                return []
+            return do_multi(keys, get_multi)
+
+        return single_flight_get_multi
+
+    def wrap_write(self, write: Callable, single: bool) -> Callable:
+        """
+        wraps a write, so its keys are forgotten once it is done.  the first
+        argument of `write` is a key if `single`, else a mapping or list of
+        keys.
+        """
+        forget = self.forget
+
+        @functools.wraps(write)
+        def single_flight_write(keys, *args):
+            try:
+                return write(keys, *args)
+            finally:
+                forget((keys,) if single else keys)
+
+        return single_flight_write
@@ -0,0 +1,186 @@
+"""
+XFetch
+------
+
+Probabilistic early recomputation, as in "Optimal Probabilistic Cache
+Stampede Prevention" (Vattani, Chierichetti and Lowenstein).
+
+When a value is written, the time its creator took -- its cost -- is stored in
+the `CachedValue` metadata as ``"d"``.  When a value is read, it is reported
+as expired before it is, with a probability that rises as its expiry nears,
+and rises sooner for values that are expensive to create: a value created at
+``ct`` is expired early if::
+
+    now - cost * beta * log(random()) >= ct + expiration_time
+
+dogpile then treats it as a stale value: the one caller that gets the lock
+regenerates it, and every other caller is served the current value.  So a
+hot, expensive key is refreshed by a single early reader, before the whole
+fleet sees it expire at once.
+
+The cost of a value is measured from the last read of its key that missed or
+found it expired -- which dogpile makes right before it calls the creator --
+to the created time dogpile stamps on the new value.
+"""
+# stdlib
+import functools
+import math
+import random
+import threading
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Mapping
+
+# pypi
+from dogpile.cache.api import CachedValue
+from dogpile.cache.api import NO_VALUE
+
+# local
+from .serializers import LazyCachedValue
+
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+
+__all__ = ("XFetch",)
+
+# the most misses a thread remembers while waiting for their writes
+_MAX_PENDING = 1000
+
+# how long a thread keeps seeing a value it expired early as expired, so the
+# read dogpile makes after acquiring the lock agrees with the first one
+_STICKY_SECONDS = 1.0
+
+
+class XFetch(object):
+    """Records the creator cost of values, and expires them early.
+
+    ``expiration_time`` must be the region's ``expiration_time``.  A larger
+    ``beta`` favors earlier recomputation.
+
+    The counter is updated without locking, so under heavy concurrency it is
+    approximate:
+
+    * ``early`` - values reported as expired before their expiration time
+    """
+
+    def __init__(self, expiration_time: float, beta: float = 1.0):
+        if expiration_time <= 0:
+            raise ValueError("`xfetch_expiration_time` must be positive")
+        self.expiration_time = expiration_time
+        self.beta = beta
+        # the time of each key's last miss, per thread
+        self._local = threading.local()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.early = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"early": self.early}
+
+    def _pending(self) -> Dict[Any, float]:
+        try:
+            return self._local.pending
+        except AttributeError:
+            pending = self._local.pending = {}
+            return pending
+
+    def check(self, key: Any, value: Any, now: float) -> Any:
+        """
+        returns `value`, or a copy that dogpile will see as expired.  a miss
+        is remembered, so the cost of the value written next can be measured.
+        """
+        if not isinstance(value, CachedValue):
+            if value is NO_VALUE:
+                self._miss(key, now)
+            return value
+        metadata = value.metadata
+        expires = metadata["ct"] + self.expiration_time
+        if now >= expires:
+            self._miss(key, now)
+            return value
+        cost = metadata.get("d")
+        if not cost:
+            return value
+        _missed = self._pending().get(key)
+        if (
+            _missed is None
+            or now - _missed > _STICKY_SECONDS
+            or metadata["ct"] > _missed
+        ):
+            # `1.0 - random()` is in (0, 1]
+            _delta = cost * self.beta * math.log(1.0 - random.random())
+            if now - _delta < expires:
+                return value
+            self.early += 1
+        self._miss(key, now)
+        _created = now - self.expiration_time - 1
+        return self._expired(value, dict(metadata, ct=_created))
+
+    def _expired(self, value: CachedValue, metadata: Mapping) -> CachedValue:
+        if isinstance(value, LazyCachedValue):
+            return value.with_metadata(metadata)
+        return CachedValue(value.payload, metadata)
+
+    def _miss(self, key: Any, now: float) -> None:
+        pending = self._pending()
+        if len(pending) >= _MAX_PENDING:
+            # misses that were never followed by a write
+            pending.clear()
+        pending[key] = now
+
+    def stamp(self, key: Any, value: Any) -> None:
+        """
+        records the cost of `value` in its metadata, if this thread missed
+        `key` before creating it.
+        """
+        started = self._pending().pop(key, None)
+        if started is None or not isinstance(value, CachedValue):
+            return
+        created = value.metadata.get("ct")
+        if created is not None and created >= started:
+            value.metadata["d"] = created - started
+
+    def wrap_get(self, get: Callable) -> Callable:
+        check = self.check
+
+        @functools.wraps(get)
+        def xfetch_get(key):
+            return check(key, get(key), time.time())
+
+        return xfetch_get
+
+    def wrap_get_multi(self, get_multi: Callable) -> Callable:
+        check = self.check
+
+        @functools.wraps(get_multi)
+        def xfetch_get_multi(keys):
+            values = get_multi(keys)
+            now = time.time()
+            return [check(k, v, now) for k, v in zip(keys, values)]
+
+        return xfetch_get_multi
+
+    def wrap_set(self, set_: Callable) -> Callable:
+        stamp = self.stamp
+
+        @functools.wraps(set_)
+        def xfetch_set(key, value):
+            stamp(key, value)
+            return set_(key, value)
+
+        return xfetch_set
+
+    def wrap_set_multi(self, set_multi: Callable) -> Callable:
+        stamp = self.stamp
+
+        @functools.wraps(set_multi)
+        def xfetch_set_multi(mapping):
+            for key, value in mapping.items():
+                stamp(key, value)
+            return set_multi(mapping)
+
+        return xfetch_set_multi
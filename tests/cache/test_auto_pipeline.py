@@ -0,0 +1,77 @@
+from dogpile_backend_redis_advanced.cache.auto_pipeline import AutoPipeline
+from . import eq_
+
+from threading import Thread
+import time
+from unittest import TestCase
+
+import pytest
+
+
+class AutoPipelineTest(TestCase):
+    def _pipeline(self, **kwargs):
+        calls = []
+
+        def fetch(keys):
+            calls.append(list(keys))
+            # long enough for every other thread to start reading
+            time.sleep(0.1)
+            return [k.upper() for k in keys]
+
+        return AutoPipeline(fetch, **kwargs), calls
+
+    def _concurrently(self, fn, keys):
+        results = {}
+
+        def read(key):
+            results[key] = fn(key)
+
+        threads = [Thread(target=read, args=(k,)) for k in keys]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_alone(self):
+        pipeline, calls = self._pipeline(max_wait=10)
+        _start = time.time()
+        eq_(pipeline.get("a"), "A")
+        # nobody else was reading, so it did not wait
+        assert time.time() - _start < 1
+        eq_(calls, [["a"]])
+
+    def test_batched(self):
+        pipeline, calls = self._pipeline(max_wait=0.05)
+        _keys = ["k%s" % i for i in range(16)]
+        eq_(self._concurrently(pipeline.get, _keys), {k: k.upper() for k in _keys})
+        eq_(pipeline.reads, 16)
+        eq_(pipeline.batches, len(calls))
+        # the first read went alone, the rest joined a batch behind it
+        assert pipeline.batches < 8
+        eq_(sorted(k for c in calls for k in c), sorted(_keys))
+
+    def test_max_batch(self):
+        pipeline, calls = self._pipeline(max_wait=0.2, max_batch=4)
+        _keys = ["k%s" % i for i in range(9)]
+        eq_(self._concurrently(pipeline.get, _keys), {k: k.upper() for k in _keys})
+        assert all(len(c) <= 4 for c in calls)
+        with pytest.raises(ValueError):
+            AutoPipeline(lambda keys: keys, max_batch=0)
+
+    def test_error(self):
+        def fetch(keys):
+            time.sleep(0.1)
+            raise KeyError(keys)
+
+        pipeline = AutoPipeline(fetch, max_wait=0.05)
+        errors = []
+
+        def get(key):
+            try:
+                pipeline.get(key)
+            except KeyError as exc:
+                errors.append(exc)
+
+        self._concurrently(get, ["k%s" % i for i in range(4)])
+        eq_(len(errors), 4)
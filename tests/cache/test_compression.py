@@ -0,0 +1,143 @@
+from dogpile.cache.api import CachedValue
+from dogpile.cache.region import value_version
+from dogpile_backend_redis_advanced.cache.compression import Compressor
+from dogpile_backend_redis_advanced.cache.compression import train_dictionary
+from dogpile_backend_redis_advanced.cache.serializers import EnvelopeSerializer
+from . import eq_
+
+import pickle
+from unittest import TestCase
+
+import msgpack
+import pytest
+
+
+class CompressorTest(TestCase):
+    value = {"payload": "abcdefghij" * 200}
+
+    def test_unknown_codec(self):
+        with pytest.raises(ValueError):
+            Compressor("snappy")
+
+    def test_threshold(self):
+        compressor = Compressor("zlib", threshold=100)
+        eq_(compressor.compress(b"short"), b"\xc1\x00short")
+        eq_(compressor.decompress(b"\xc1\x00short"), b"short")
+        eq_(compressor.skipped, 1)
+        eq_(compressor.compressed, 0)
+
+    def test_roundtrip(self):
+        for codec in ("zlib", "lzma"):
+            compressor = Compressor(codec, threshold=100)
+            dumps = compressor.wrap_dumps(pickle.dumps)
+            loads = compressor.wrap_loads(pickle.loads)
+            data = dumps(self.value)
+            assert len(data) < len(pickle.dumps(self.value)) / 5
+            eq_(loads(data), self.value)
+            eq_(compressor.compressed, 1)
+            eq_(compressor.decompressed, 1)
+            assert compressor.ratio < 0.2
+            assert compressor.stats()["compress_time"] > 0
+
+    def test_side_by_side(self):
+        zlib_dumps = Compressor("zlib", threshold=0).wrap_dumps(pickle.dumps)
+        lzma_loads = Compressor("lzma").wrap_loads(pickle.loads)
+        # another codec, and values written before compression was enabled
+        eq_(lzma_loads(zlib_dumps(self.value)), self.value)
+        eq_(lzma_loads(pickle.dumps(self.value)), self.value)
+
+    def test_no_header(self):
+        compressor = Compressor("zlib", threshold=0)
+        # values that start with what used to be a one-byte header
+        envelope = EnvelopeSerializer()
+        _value = CachedValue("value", {"ct": 100, "v": value_version})
+        data = envelope.dumps(_value)
+        eq_(data[:1], b"\x01")
+        eq_(compressor.wrap_loads(envelope.loads)(data), _value)
+        eq_(compressor.decompress(msgpack.packb(2)), b"\x02")
+        eq_(compressor.decompress(b"\xc1"), b"\xc1")
+        with pytest.raises(ValueError):
+            compressor.decompress(b"\xc1\x09data")
+
+    def test_check_dumps(self):
+        compressor = Compressor("zlib")
+        compressor.check_dumps(pickle.dumps, [None, 0])
+        compressor.check_dumps(EnvelopeSerializer().dumps, [None, 0])
+        with pytest.raises(ValueError):
+            compressor.check_dumps(lambda v: b"\xc1" + pickle.dumps(v), [None])
+
+    def test_multi(self):
+        compressor = Compressor("zlib", threshold=100)
+        dumps_multi = compressor.wrap_dumps_multi(
+            lambda values: [pickle.dumps(v) for v in values]
+        )
+        loads_multi = compressor.wrap_loads_multi(
+            lambda values: [pickle.loads(v) for v in values]
+        )
+        data = dumps_multi([self.value, "short"])
+        eq_([d[:2] for d in data], [b"\xc1\x01", b"\xc1\x00"])
+        eq_(loads_multi(data), [self.value, "short"])
+
+    def test_incompressible(self):
+        compressor = Compressor("zlib", threshold=0)
+        data = bytes(range(256))
+        eq_(compressor.compress(data), b"\xc1\x00" + data)
+        eq_(compressor.skipped, 1)
+
+
+def _record(i):
+    return pickle.dumps(
+        {
+            "id": i,
+            "email": "user-%s@example.com" % i,
+            "profile": {"is_active": True, "followers": i * 7, "theme": "dark"},
+            "roles": ["reader", "writer"][: i % 3],
+        }
+    )
+
+
+class ZdictTest(TestCase):
+    samples = [_record(i) for i in range(200)]
+
+    def test_requires_dictionaries(self):
+        with pytest.raises(ValueError):
+            Compressor("zdict")
+        with pytest.raises(ValueError):
+            Compressor("zdict", dictionaries={1: b"abc"}, dictionary_id=2)
+        with pytest.raises(ValueError):
+            Compressor("zdict", dictionaries={256: b"abc"})
+
+    def test_train_dictionary(self):
+        zdict = train_dictionary(self.samples, size=512)
+        assert 0 < len(zdict) <= 512
+        eq_(train_dictionary([]), b"")
+
+    def test_small_values(self):
+        zdict = train_dictionary(self.samples)
+        compressor = Compressor("zdict", dictionaries={7: zdict})
+        eq_(compressor.threshold, 64)
+        plain = Compressor("zlib", threshold=0)
+        _record_1000 = _record(1000)
+        data = compressor.compress(_record_1000)
+        eq_(data[:3], b"\xc1\x03\x07")
+        eq_(compressor.decompress(data), _record_1000)
+        # the dictionary does much better than plain zlib on a small record
+        assert len(data) < len(plain.compress(_record_1000)) / 2
+
+    def test_rotation(self):
+        old = Compressor(
+            "zdict", dictionaries={1: train_dictionary(self.samples[:100])}
+        )
+        new = Compressor(
+            "zdict",
+            dictionaries={
+                1: old.dictionaries[1],
+                2: train_dictionary(self.samples[100:]),
+            },
+        )
+        eq_(new.dictionary_id, 2)
+        _value = _record(1000)
+        eq_(new.decompress(old.compress(_value)), _value)
+        eq_(new.compress(_value)[:3], b"\xc1\x03\x02")
+        with pytest.raises(ValueError):
+            old.decompress(new.compress(_value))
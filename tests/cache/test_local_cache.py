@@ -0,0 +1,78 @@
+from dogpile.cache.api import NO_VALUE
+from dogpile_backend_redis_advanced.cache.local_cache import InvalidationListener
+from dogpile_backend_redis_advanced.cache.local_cache import LocalCache
+from . import eq_
+
+from unittest import TestCase
+
+
+class LocalCacheTest(TestCase):
+    def _cache(self, max_entries=3, max_bytes=100):
+        cache = LocalCache(max_entries, max_bytes)
+        cache.clear(enabled=True)
+        return cache
+
+    def _fill(self, cache, key, value, size=1):
+        token = cache.begin([key])
+        cache.set(key, value, size, token)
+
+    def test_disabled(self):
+        cache = LocalCache(3, 100)
+        self._fill(cache, "a", 1)
+        eq_(cache.get("a"), NO_VALUE)
+
+    def test_lru_entries(self):
+        cache = self._cache()
+        for k in "abc":
+            self._fill(cache, k, k, 1)
+        eq_(cache.get("a"), "a")
+        self._fill(cache, "d", "d", 1)
+        eq_(cache.get("b"), NO_VALUE)
+        eq_([cache.get(k) for k in "acd"], ["a", "c", "d"])
+        eq_(len(cache), 3)
+
+    def test_lru_bytes(self):
+        cache = self._cache(max_entries=10, max_bytes=100)
+        self._fill(cache, "a", "a", 60)
+        self._fill(cache, "b", "b", 60)
+        eq_(cache.get("a"), NO_VALUE)
+        eq_(cache.nbytes, 60)
+        self._fill(cache, "c", "c", 101)
+        eq_(cache.get("c"), NO_VALUE)
+        self._fill(cache, "b", "b", 10)
+        eq_(cache.nbytes, 10)
+
+    def test_stale_fill(self):
+        cache = self._cache()
+        token = cache.begin(["a", "b"])
+        cache.invalidate(["a"])
+        cache.set("a", "stale", 1, token)
+        cache.set("b", "b", 1, token)
+        eq_(cache.get("a"), NO_VALUE)
+        eq_(cache.get("b"), "b")
+        cache.end(["a", "b"], token)
+        eq_(cache._pending, {})
+
+    def test_listener_messages(self):
+        cache = self._cache()
+        listener = InvalidationListener(None, cache)
+        self._fill(cache, "a", "a", 1)
+        self._fill(cache, "b", "b", 1)
+        listener._handle([b"message", b"__redis__:invalidate", [b"a"]])
+        eq_(cache.get("a"), NO_VALUE)
+        eq_(cache.get("b"), "b")
+        listener._handle([b"message", b"__redis__:invalidate", None])
+        eq_(len(cache), 0)
+        eq_(cache.nbytes, 0)
+
+    def test_listener_messages_decoded(self):
+        # with `decode_responses`, the messages are `str`s
+        cache = self._cache()
+        listener = InvalidationListener(None, cache)
+        self._fill(cache, "a", "a", 1)
+        self._fill(cache, "b", "b", 1)
+        listener._handle(["message", "__redis__:invalidate", ["a"]])
+        eq_(cache.get("a"), NO_VALUE)
+        eq_(cache.get("b"), "b")
+        listener._handle(["message", "__redis__:invalidate", None])
+        eq_(len(cache), 0)
@@ -0,0 +1,46 @@
+from dogpile_backend_redis_advanced.cache.compression import Compressor
+from dogpile_backend_redis_advanced.cache.parallel import ParallelLoader
+from dogpile_backend_redis_advanced.cache.parallel import shutdown_pools
+from dogpile_backend_redis_advanced.cache.serializers import get_serializer
+from . import eq_
+
+import pickle
+from unittest import TestCase
+
+import pytest
+
+
+class ParallelLoaderTest(TestCase):
+    values = [{"i": i, "s": "x" * i} for i in range(101)]
+
+    def tearDown(self):
+        shutdown_pools()
+
+    def test_unknown_executor(self):
+        with pytest.raises(ValueError):
+            ParallelLoader("fibers")
+
+    def test_threshold(self):
+        loader = ParallelLoader("thread", threshold=200, workers=4)
+        data = [pickle.dumps(v) for v in self.values]
+        eq_(loader.map(pickle.loads, data), self.values)
+        eq_((loader.parallel, loader.serial), (0, 1))
+
+    def test_order(self):
+        compressor = Compressor("zlib", threshold=0)
+        loads = compressor.wrap_loads(pickle.loads)
+        data = [compressor.wrap_dumps(pickle.dumps)(v) for v in self.values]
+        for executor in ("thread", "process"):
+            loader = ParallelLoader(executor, threshold=10, workers=3)
+            eq_(loader.map(loads, data), self.values)
+            eq_((loader.parallel, loader.serial), (1, 0))
+
+    def test_check_loads(self):
+        loader = ParallelLoader("process")
+        for name in ("pickle", "msgpack", "envelope_msgpack_lazy"):
+            loader.check_loads(get_serializer(name)[0])
+        loader.check_loads(Compressor("zlib").wrap_loads(pickle.loads))
+        with pytest.raises(ValueError):
+            loader.check_loads(lambda v: v)
+        # any `loads` will do on a thread pool
+        ParallelLoader("thread").check_loads(lambda v: v)
@@ -6,22 +6,28 @@ from . import eq_, assert_raises_message
 
 from threading import Thread, Lock
 from unittest import TestCase
+import asyncio
 import os
 import pdb
+import pickle
 import time
 import unittest
 import sys
 
 
-from mock import patch, Mock
+from mock import patch, Mock, PropertyMock
 import msgpack
 import pytest
 
 REDIS_HOST = "127.0.0.1"
 REDIS_PORT = int(os.getenv("DOGPILE_REDIS_PORT", "6379"))
+REDIS_CLUSTER_PORT = int(os.getenv("DOGPILE_REDIS_CLUSTER_PORT", "7000"))
 
 # import to register the plugin
 import dogpile_backend_redis_advanced
+from dogpile_backend_redis_advanced.cache.compression import dictionary_from_scan
+from dogpile_backend_redis_advanced.cache.refresh import BackgroundRefresher
+from dogpile_backend_redis_advanced.cache.serializers import LazyCachedValue
 
 """
 ABOUT THESE TESTS
@@ -115,6 +121,628 @@ class RedisAdvancedHstore_Compatibility_DistributedMutexTest(
     backend = "dogpile_backend_redis_advanced_hstore"
 
 
+class RedisAdvancedHstore_Compatibility_NotifyMutexTest(
+    _Compatibility_DistributedMutexTest
+):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_DistributedMutexTest.config_args["arguments"],
+            lock_notify=True,
+        )
+    }
+
+
+class RedisAdvanced_Compatibility_SemaphoreMutexTest(
+    _Compatibility_DistributedMutexTest
+):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_DistributedMutexTest.config_args["arguments"],
+            lock_timeout=5,
+            lock_semaphore=2,
+            lock_semaphore_name="_test_semaphore",
+        )
+    }
+
+
+class RedisAdvancedHstore_Compatibility_SemaphoreMutexTest(
+    RedisAdvanced_Compatibility_SemaphoreMutexTest
+):
+    backend = "dogpile_backend_redis_advanced_hstore"
+
+
+class RedisAdvancedNotifyLockTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "distributed_lock": True,
+            "lock_notify": True,
+            # a polling waiter would not notice the release in time
+            "lock_sleep": 10,
+        }
+    }
+
+    def _wait_for(self, mutex, results):
+        def wait():
+            _start = time.time()
+            results.append(mutex.acquire())
+            results.append(time.time() - _start)
+            mutex.release()
+
+        return Thread(target=wait)
+
+    def test_wake_on_release(self):
+        backend = self._backend()
+        holder = backend.get_mutex("notify")
+        assert holder.acquire()
+        results = []
+        waiter = self._wait_for(backend.get_mutex("notify"), results)
+        waiter.start()
+        time.sleep(0.2)
+        holder.release()
+        waiter.join(5)
+        eq_(results[0], True)
+        assert 0.2 <= results[1] < 1
+        # the wake-up token is next to the lock, in the same cluster slot
+        eq_(backend.client.exists("{_locknotify}:signal"), 1)
+
+    def test_wake_on_expiry(self):
+        backend = self._backend_cls(
+            dict(self.config_args["arguments"], lock_timeout=0.3)
+        )
+        holder = backend.get_mutex("notify")
+        assert holder.acquire()
+        results = []
+        # the holder never releases the lock
+        waiter = self._wait_for(backend.get_mutex("notify"), results)
+        waiter.start()
+        waiter.join(5)
+        eq_(results[0], True)
+        assert results[1] < 1
+
+    def test_blocking(self):
+        backend = self._backend()
+        holder = backend.get_mutex("notify")
+        assert holder.acquire()
+        mutex = backend.get_mutex("notify")
+        assert not mutex.acquire(False)
+        _start = time.time()
+        assert not mutex.acquire(blocking_timeout=0.2)
+        assert 0.2 <= time.time() - _start < 1
+        holder.release()
+        assert mutex.acquire(False)
+        mutex.release()
+
+    def test_async(self):
+        assert_raises_message(
+            ValueError,
+            "`lock_notify` is not supported by the asyncio backends",
+            _backend_loader.load("dogpile_backend_redis_advanced_asyncio"),
+            {"lock_notify": True},
+        )
+
+    @property
+    def _backend_cls(self):
+        return _backend_loader.load(self.backend)
+
+
+class RedisAdvancedGetOrLockTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "distributed_lock": True,
+            "lock_timeout": 5,
+        }
+    }
+    key = "get-or-lock"
+
+    def setUp(self):
+        backend = self._backend()
+        backend.delete(self.key)
+        backend.client.delete(backend._lock_name(self.key))
+
+    def test_get_or_lock(self):
+        backend = self._backend()
+        value, mutex = backend.get_or_lock(self.key)
+        eq_(value, NO_VALUE)
+        # held by this caller, and released through the regular lock
+        assert mutex is not None
+        assert mutex.owned()
+        assert 0 < backend.client.pttl(backend._lock_name(self.key)) <= 5000
+        eq_(backend.get_or_lock(self.key), (NO_VALUE, None))
+        assert not backend.get_mutex(self.key).acquire(False)
+        backend.set(self.key, "value")
+        mutex.release()
+        eq_(backend.get_or_lock(self.key), ("value", None))
+        # a value is returned whether or not the lock is held
+        other = backend.get_mutex(self.key)
+        assert other.acquire(False)
+        eq_(backend.get_or_lock(self.key), ("value", None))
+        other.release()
+
+    def test_lock_class(self):
+        backend = self._backend_cls(
+            dict(
+                self.config_args["arguments"],
+                lock_class=RedisDistributedLockProxySilent,
+            )
+        )
+        _value, mutex = backend.get_or_lock(self.key)
+        assert isinstance(mutex, RedisDistributedLockProxySilent)
+        mutex.release()
+        assert backend.get_mutex(self.key).acquire(False)
+        # the lock is gone, which the proxy silences
+        mutex.release()
+        backend.client.delete(backend._lock_name(self.key))
+
+    def test_requires_distributed_lock(self):
+        backend = self._backend_cls(
+            dict(self.config_args["arguments"], distributed_lock=False)
+        )
+        assert_raises_message(
+            ValueError,
+            "`get_or_lock` requires `distributed_lock`",
+            backend.get_or_lock,
+            self.key,
+        )
+
+    def test_lease_and_semaphore(self):
+        for arguments in ({"lock_lease": True}, {"lock_semaphore": 2}):
+            backend = self._backend_cls(
+                dict(self.config_args["arguments"], **arguments)
+            )
+            assert_raises_message(
+                ValueError,
+                "`get_or_lock` can not be used with `lock_lease` or "
+                "`lock_semaphore`",
+                backend.get_or_lock,
+                self.key,
+            )
+
+    @property
+    def _backend_cls(self):
+        return _backend_loader.load(self.backend)
+
+
+class RedisAdvancedHstoreGetOrLockTest(RedisAdvancedGetOrLockTest):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    key = ("get-or-lock-hash", "field")
+
+    def test_lock_name(self):
+        backend = self._backend()
+        eq_(backend._lock_name(self.key), "_lockget-or-lock-hash,field")
+
+
+class RedisAdvancedMultiLockTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "distributed_lock": True,
+            "lock_timeout": 5,
+        }
+    }
+    keys = ["multi-lock-%s" % i for i in range(20)]
+
+    def test_acquire_release(self):
+        backend = self._backend()
+        held = backend.get_mutex(self.keys[3])
+        assert held.acquire(False)
+        mutex = backend.get_mutex_multi(self.keys + self.keys[:2])
+        owned = mutex.acquire()
+        eq_(owned, self.keys[:3] + self.keys[4:])
+        for key in owned:
+            assert not backend.get_mutex(key).acquire(False)
+        eq_(backend.get_mutex_multi(self.keys).acquire(), [])
+        held.release()
+        # acquiring again takes the locks that were freed since
+        eq_(mutex.acquire()[-1], self.keys[3])
+        mutex.release()
+        other = backend.get_mutex_multi(self.keys)
+        eq_(other.acquire(), self.keys)
+        other.release()
+
+    def test_expired(self):
+        backend = self._backend()
+        mutex = backend.get_mutex_multi(self.keys[:2])
+        eq_(mutex.acquire(), self.keys[:2])
+        backend.client.delete(backend._lock_name(self.keys[0]))
+        from redis.exceptions import LockNotOwnedError
+
+        assert_raises_message(
+            LockNotOwnedError,
+            "Cannot release 1 locks that are no longer owned",
+            mutex.release,
+        )
+        assert backend.get_mutex(self.keys[1]).acquire(False)
+        backend.client.delete(backend._lock_name(self.keys[1]))
+
+    def test_lock_class(self):
+        backend = self._backend_cls(
+            dict(
+                self.config_args["arguments"],
+                lock_class=RedisDistributedLockProxySilent,
+            )
+        )
+        mutex = backend.get_mutex_multi(self.keys)
+        assert isinstance(mutex, RedisDistributedLockProxySilent)
+        eq_(mutex.acquire(), self.keys)
+        backend.client.delete(backend._lock_name(self.keys[0]))
+        # the missing lock is silenced by the proxy
+        mutex.release()
+
+    def test_notify(self):
+        backend = self._backend_cls(
+            dict(self.config_args["arguments"], lock_notify=True, lock_sleep=10)
+        )
+        mutex = backend.get_mutex_multi(self.keys[:2])
+        eq_(mutex.acquire(), self.keys[:2])
+        results = []
+
+        def wait():
+            _start = time.time()
+            waiter = backend.get_mutex(self.keys[1])
+            results.append(waiter.acquire())
+            results.append(time.time() - _start)
+            waiter.release()
+
+        thread = Thread(target=wait)
+        thread.start()
+        time.sleep(0.2)
+        mutex.release()
+        thread.join(5)
+        eq_(results[0], True)
+        assert results[1] < 1
+
+    def test_without_distributed_lock(self):
+        backend = self._backend_cls(
+            dict(self.config_args["arguments"], distributed_lock=False)
+        )
+        eq_(backend.get_mutex_multi(self.keys), None)
+
+    def test_lease(self):
+        backend = self._backend_cls(
+            dict(self.config_args["arguments"], lock_lease=True)
+        )
+        assert_raises_message(
+            ValueError,
+            "`get_mutex_multi` can not be used with `lock_lease` or "
+            "`lock_semaphore`",
+            backend.get_mutex_multi,
+            self.keys,
+        )
+
+    def test_semaphore(self):
+        backend = self._backend_cls(
+            dict(self.config_args["arguments"], lock_semaphore=2)
+        )
+        assert_raises_message(
+            ValueError,
+            "`get_mutex_multi` can not be used with `lock_lease` or "
+            "`lock_semaphore`",
+            backend.get_mutex_multi,
+            self.keys,
+        )
+
+    @property
+    def _backend_cls(self):
+        return _backend_loader.load(self.backend)
+
+
+class RedisAdvancedHstoreMultiLockTest(RedisAdvancedMultiLockTest):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    keys = [("multi-lock", "f%s" % i) for i in range(10)] + [
+        "multi-lock-%s" % i for i in range(10)
+    ]
+
+    def test_lock_names(self):
+        backend = self._backend()
+        mutex = backend.get_mutex_multi(self.keys[:1])
+        eq_(list(mutex.names.values()), ["_lockmulti-lock,f0"])
+
+
+class RedisAdvancedLeaseLockTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "distributed_lock": True,
+            "thread_local_lock": False,
+            "lock_lease": True,
+            "lock_timeout": 0.3,
+            "redis_expiration_time": 10,
+        }
+    }
+    key = "lease"
+    other_key = "lease-other"
+
+    def setUp(self):
+        backend = self._backend()
+        backend.delete(self.key)
+        backend.client.delete(backend._lock_name(self.key))
+
+    def test_extended(self):
+        backend = self._backend()
+        mutex = backend.get_mutex(self.key)
+        assert mutex.acquire()
+        # held well past `lock_timeout`
+        time.sleep(1)
+        assert not backend.get_mutex(self.key).acquire(False)
+        mutex.release()
+        assert backend.client.get(backend._lock_name(self.key)) is None
+        mutex = backend.get_mutex(self.key)
+        assert mutex.acquire()
+        mutex.release()
+
+    def test_fence(self):
+        backend = self._backend()
+        mutex = backend.get_mutex(self.key)
+        assert mutex.acquire()
+        fence = mutex.fence
+        mutex.release()
+        eq_(mutex.fence, None)
+        assert mutex.acquire()
+        eq_(mutex.fence, fence + 1)
+        mutex.release()
+
+    def test_stale_set(self):
+        backend = self._backend()
+        mutex = backend.get_mutex(self.key)
+        assert mutex.acquire()
+        backend.set(self.key, "first")
+        eq_(backend.get(self.key), "first")
+        # the lease is lost, and someone else takes the lock and writes
+        backend.client.delete(backend._lock_name(self.key))
+
+        def regenerate():
+            other = backend.get_mutex(self.key)
+            assert other.acquire(False)
+            backend.set(self.key, "second")
+            other.release()
+
+        thread = Thread(target=regenerate)
+        thread.start()
+        thread.join(5)
+        backend.set(self.key, "stale")
+        eq_(backend.get(self.key), "second")
+        eq_(backend.lease_rejected, 1)
+        from redis.exceptions import LockNotOwnedError
+
+        assert_raises_message(
+            LockNotOwnedError,
+            "Cannot release a lock that's no longer owned",
+            mutex.release,
+        )
+        # outside of a lease, writes are not fenced
+        backend.set(self.key, "third")
+        eq_(backend.get(self.key), "third")
+
+    def test_stale_set_multi(self):
+        backend = self._backend()
+        backend.delete(self.other_key)
+        mutex = backend.get_mutex(self.key)
+        assert mutex.acquire()
+        backend.set_multi({self.key: "first", self.other_key: "first"})
+        eq_(backend.get_multi([self.key, self.other_key]), ["first", "first"])
+        # the lease is lost, and someone else takes the lock and writes
+        backend.client.delete(backend._lock_name(self.key))
+
+        def regenerate():
+            other = backend.get_mutex(self.key)
+            assert other.acquire(False)
+            backend.set_multi({self.key: "second"})
+            other.release()
+
+        thread = Thread(target=regenerate)
+        thread.start()
+        thread.join(5)
+        backend.set_multi({self.key: "stale", self.other_key: "third"})
+        eq_(backend.get_multi([self.key, self.other_key]), ["second", "third"])
+        eq_(backend.lease_rejected, 1)
+        backend.delete(self.other_key)
+
+    def test_slow_creator(self):
+        reg = self._region()
+        calls = []
+
+        def creator():
+            calls.append(1)
+            time.sleep(1)
+            return "value"
+
+        threads = [
+            Thread(target=reg.get_or_create, args=(self.key, creator)) for i in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.1)
+        for thread in threads:
+            thread.join(5)
+        eq_(len(calls), 1)
+        eq_(reg.get(self.key), "value")
+
+    def test_arguments(self):
+        for arguments, msg in (
+            ({"lock_timeout": None}, "`lock_lease` requires a `lock_timeout`"),
+            (
+                {"lock_notify": True},
+                "`lock_lease` can not be used with `lock_notify`",
+            ),
+        ):
+            assert_raises_message(
+                ValueError,
+                msg,
+                self._backend_cls,
+                dict(self.config_args["arguments"], **arguments),
+            )
+        assert_raises_message(
+            ValueError,
+            "`lock_lease` is not supported by the asyncio backends",
+            _backend_loader.load("dogpile_backend_redis_advanced_asyncio"),
+            {"lock_lease": True, "lock_timeout": 1},
+        )
+
+    @property
+    def _backend_cls(self):
+        return _backend_loader.load(self.backend)
+
+
+class RedisAdvancedHstoreLeaseLockTest(RedisAdvancedLeaseLockTest):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    key = ("lease-hash", "field")
+    other_key = ("lease-hash", "other")
+
+    def test_slow_creator(self):
+        # regions mangle keys into strings
+        pass
+
+    def test_hash_expiry(self):
+        backend = self._backend()
+        mutex = backend.get_mutex(self.key)
+        assert mutex.acquire()
+        backend.set(self.key, "value")
+        assert 0 < backend.client.ttl(self.key[0]) <= 10
+        mutex.release()
+
+
+class RedisAdvancedSemaphoreTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "distributed_lock": True,
+            "thread_local_lock": False,
+            "lock_timeout": 5,
+            "lock_sleep": 0.02,
+            "lock_semaphore": 2,
+            "lock_semaphore_name": "_test_semaphore",
+        }
+    }
+
+    def setUp(self):
+        backend = self._backend()
+        backend.client.delete("_test_semaphore")
+
+    def test_limit(self):
+        reg = self._region()
+        _lock = Lock()
+        active = []
+        peak = []
+
+        def creator():
+            with _lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.2)
+            with _lock:
+                active.pop()
+            return "value"
+
+        threads = [
+            Thread(target=reg.get_or_create, args=("semaphore-%s" % i, creator))
+            for i in range(6)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        eq_(len(peak), 6)
+        eq_(max(peak), 2)
+        eq_(reg.backend.semaphore.holders(), 0)
+
+    def test_stale(self):
+        reg = self._region(config_args={"expiration_time": 1})
+        reg.set("semaphore-stale", "stale")
+        time.sleep(1.1)
+        semaphore = reg.backend.semaphore
+        tokens = [semaphore.acquire(), semaphore.acquire()]
+        # every slot is taken, so the stale value is served
+        eq_(reg.get_or_create("semaphore-stale", lambda: "new"), "stale")
+        for token in tokens:
+            assert semaphore.release(token)
+        eq_(reg.get_or_create("semaphore-stale", lambda: "new"), "new")
+
+    def test_mutex(self):
+        backend = self._backend()
+        semaphore = backend.semaphore
+        token = semaphore.acquire()
+        mutex = backend.get_mutex("semaphore-a")
+        assert mutex.acquire(False)
+        assert not backend.get_mutex("semaphore-b").acquire(False)
+        # the key's lock was released along with the failed attempt
+        assert backend.get_mutex("semaphore-b").mutex.acquire(False)
+        assert not backend.get_mutex("semaphore-b").acquire(blocking_timeout=0.1)
+        semaphore.release(token)
+        mutex.release()
+        eq_(semaphore.holders(), 0)
+
+    def test_expired_slot(self):
+        backend = self._backend_cls(
+            dict(self.config_args["arguments"], lock_timeout=0.2)
+        )
+        semaphore = backend.semaphore
+        assert semaphore.acquire(False)
+        assert semaphore.acquire(False)
+        eq_(semaphore.acquire(False), None)
+        time.sleep(0.3)
+        assert semaphore.acquire(False)
+
+    def test_arguments(self):
+        for arguments, msg in (
+            (
+                {"distributed_lock": False},
+                "`lock_semaphore` requires `distributed_lock`",
+            ),
+            ({"lock_timeout": None}, "`lock_semaphore` requires a `lock_timeout`"),
+            (
+                {"lock_lease": True},
+                "`lock_semaphore` can not be used with `lock_lease`",
+            ),
+            ({"lock_semaphore": -1}, "a `Semaphore` requires a `limit` of at least 1"),
+        ):
+            assert_raises_message(
+                ValueError,
+                msg,
+                self._backend_cls,
+                dict(self.config_args["arguments"], **arguments),
+            )
+        assert_raises_message(
+            ValueError,
+            "`lock_semaphore` is not supported by the asyncio backends",
+            _backend_loader.load("dogpile_backend_redis_advanced_asyncio"),
+            {"lock_semaphore": 1, "lock_timeout": 1, "distributed_lock": True},
+        )
+
+    @property
+    def _backend_cls(self):
+        return _backend_loader.load(self.backend)
+
+
+class RedisAdvancedHstoreGetOrLockTest_Buckets(RedisAdvancedGetOrLockTest):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    config_args = {
+        "arguments": dict(
+            RedisAdvancedGetOrLockTest.config_args["arguments"],
+            hash_buckets=8,
+            hash_buckets_prefix="_test_hb:",
+        )
+    }
+
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 
@@ -220,6 +848,85 @@ class RedisAdvancedHstore_SerializedAlternate_Test(_SerializedAlternate_Test):
     backend = "dogpile_backend_redis_advanced_hstore"
 
 
+class _SerializedMsgpack_Test(_TestRedisConn, _GenericBackendTest):
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "serializer": "msgpack",
+        }
+    }
+
+
+class RedisAdvanced_SerializedMsgpack_Test(_SerializedMsgpack_Test):
+    backend = "dogpile_backend_redis_advanced"
+
+
+class RedisAdvancedHstore_SerializedMsgpack_Test(_SerializedMsgpack_Test):
+    backend = "dogpile_backend_redis_advanced_hstore"
+
+
+class RedisAdvanced_SerializedMsgpackLazy_Test(_SerializedMsgpack_Test):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": dict(
+            _SerializedMsgpack_Test.config_args["arguments"], serializer="msgpack_lazy"
+        )
+    }
+
+
+class _SerializedEnvelope_Test(_TestRedisConn, _GenericBackendTest):
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "serializer": "envelope",
+        }
+    }
+
+    @unittest.skip("created times are stored in whole seconds")
+    def test_region_expire(self):
+        pass
+
+
+class RedisAdvanced_SerializedEnvelope_Test(_SerializedEnvelope_Test):
+    backend = "dogpile_backend_redis_advanced"
+
+
+class RedisAdvancedHstore_SerializedEnvelope_Test(_SerializedEnvelope_Test):
+    backend = "dogpile_backend_redis_advanced_hstore"
+
+
+class RedisAdvanced_SerializedEnvelopeLazy_Test(_SerializedEnvelope_Test):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": dict(
+            _SerializedEnvelope_Test.config_args["arguments"], lazy_loads=True
+        )
+    }
+
+
+class RedisAdvancedHstore_SerializedEnvelopeLazy_Test(_SerializedEnvelope_Test):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    config_args = {
+        "arguments": dict(
+            _SerializedEnvelope_Test.config_args["arguments"], lazy_loads=True
+        )
+    }
+
+
+class RedisAdvanced_SerializedEnvelopeMsgpack_Test(_SerializedEnvelope_Test):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": dict(
+            _SerializedEnvelope_Test.config_args["arguments"],
+            serializer="envelope_msgpack",
+        )
+    }
+
+
 # ==============================================================================
 
 
@@ -307,38 +1014,198 @@ class RedisAdvancedHstore_SerializedRaw_Test(_SerializedRaw_Test):
     backend = "dogpile_backend_redis_advanced_hstore"
 
 
-# ==============================================================================
+class _SerializedMsgpackRaw_Test(_SerializedRaw_Test):
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "serializer": "msgpack_raw",
+            "redis_expiration_time": 1,
+        }
+    }
 
-# make this simple
-key_string = "some_key"
-key_hash = ("some_key", "h1")
-cloud_value = "some value"
 
-keys_mixed = [
-    1,
-    2,
-    3,
-    4,
-    5,
-    6,
-    7,
-    8,
-    9,
-    10,
-    ("a", 10),
-    ("a", 30),
-    ("a", 20),
-    ("b", 9),
-    ("c", 8),
-    ("d", 7),
-    ("e", 6),
-    ("f", 5),
-    ("g", 4),
-    ("h", 3),
-    ("i", 2),
-    ("j", 1),
-    11,
-    12,
+class RedisAdvanced_SerializedMsgpackRaw_Test(_SerializedMsgpackRaw_Test):
+    backend = "dogpile_backend_redis_advanced"
+
+
+class RedisAdvancedHstore_SerializedMsgpackRaw_Test(_SerializedMsgpackRaw_Test):
+    backend = "dogpile_backend_redis_advanced_hstore"
+
+
+class _RawMode_Test(_SerializedRaw_Test):
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "raw_mode": True,
+            "redis_expiration_time": 1,
+        }
+    }
+
+
+class RedisAdvanced_RawMode_Test(_RawMode_Test):
+    backend = "dogpile_backend_redis_advanced"
+
+
+class RedisAdvancedHstore_RawMode_Test(_RawMode_Test):
+    backend = "dogpile_backend_redis_advanced_hstore"
+
+
+class RedisAdvanced_RawModeLazy_Test(_RawMode_Test):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": dict(_RawMode_Test.config_args["arguments"], lazy_loads=True)
+    }
+
+
+class RedisAdvancedRawModeTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "raw_mode": True,
+            "redis_expiration_time": 10,
+        }
+    }
+
+    def test_requires_expiration(self):
+        backend_cls = _backend_loader.load(self.backend)
+        assert_raises_message(
+            ValueError,
+            "`raw_mode` requires a `redis_expiration_time`",
+            backend_cls,
+            {"raw_mode": True},
+        )
+        for serializer in (
+            "msgpack_raw",
+            "envelope",
+            "envelope_msgpack",
+            "envelope_msgpack_lazy",
+        ):
+            assert_raises_message(
+                ValueError,
+                "`raw_mode` can not be used with the '%s' serializer" % serializer,
+                backend_cls,
+                {
+                    "raw_mode": True,
+                    "redis_expiration_time": 1,
+                    "serializer": serializer,
+                },
+            )
+
+    def test_shared_metadata(self):
+        backend = self._backend()
+        _keys = ["raw-%s" % i for i in range(5)]
+        backend.set_multi(
+            {k: CachedValue(k, {"ct": 1, "v": value_version}) for k in _keys}
+        )
+        eq_(backend.client.get("raw-0"), pickle.dumps("raw-0", pickle.HIGHEST_PROTOCOL))
+
+        values = backend.get_multi(_keys + ["raw-missing"])
+        eq_([v.payload for v in values[:-1]], _keys)
+        eq_(values[-1], NO_VALUE)
+        assert all(isinstance(v, CachedValue) for v in values[:-1])
+        assert all(v.metadata is values[0].metadata for v in values[:-1])
+        assert values[0].metadata["ct"] > 1
+        eq_(values[0].metadata["v"], value_version)
+        with pytest.raises(TypeError):
+            values[0].metadata["ct"] = 1
+
+        value = backend.get("raw-0")
+        eq_(value.payload, "raw-0")
+        assert value.metadata is not values[0].metadata
+        backend.delete_multi(_keys)
+
+
+class RedisAdvancedLazyLoadsTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "serializer": "envelope",
+            "lazy_loads": True,
+            "compression": "zlib",
+            "compression_threshold": 0,
+        }
+    }
+
+    def test_requires_metadata(self):
+        assert_raises_message(
+            ValueError,
+            "`lazy_loads` requires `raw_mode`",
+            _backend_loader.load(self.backend),
+            {"lazy_loads": True},
+        )
+
+    def test_lazy(self):
+        backend = self._backend()
+        _keys = ["lazy-%s" % i for i in range(5)]
+        backend.set_multi(
+            {k: CachedValue(k, {"ct": time.time(), "v": value_version}) for k in _keys}
+        )
+        backend.set("lazy-bare", "bare")
+        values = backend.get_multi(_keys + ["lazy-bare", "lazy-missing"])
+        assert all(isinstance(v, LazyCachedValue) for v in values[:5])
+        assert not any(v.loaded for v in values[:5])
+        eq_(values[5:], ["bare", NO_VALUE])
+        eq_(values[2].payload, "lazy-2")
+        eq_([v.loaded for v in values[:5]], [False, False, True, False, False])
+
+    def test_region_skips_expired(self):
+        reg = self._region(config_args={"expiration_time": 60})
+        reg.set("lazy-fresh", "fresh")
+        reg.backend.set(
+            "lazy-stale",
+            CachedValue("stale", {"ct": time.time() - 120, "v": value_version}),
+        )
+        with patch(
+            "dogpile_backend_redis_advanced.cache.serializers.LazyCachedValue.payload",
+            new_callable=PropertyMock,
+            return_value="loaded",
+        ) as payload:
+            eq_(reg.get_multi(["lazy-fresh", "lazy-stale"]), ["loaded", NO_VALUE])
+            eq_(payload.call_count, 1)
+
+
+# ==============================================================================
+
+# make this simple
+key_string = "some_key"
+key_hash = ("some_key", "h1")
+cloud_value = "some value"
+
+keys_mixed = [
+    1,
+    2,
+    3,
+    4,
+    5,
+    6,
+    7,
+    8,
+    9,
+    10,
+    ("a", 10),
+    ("a", 30),
+    ("a", 20),
+    ("b", 9),
+    ("c", 8),
+    ("d", 7),
+    ("e", 6),
+    ("f", 5),
+    ("g", 4),
+    ("h", 3),
+    ("i", 2),
+    ("j", 1),
+    11,
+    12,
     13,
     14,
     15,
@@ -430,6 +1297,24 @@ class HstoreTest(_TestRedisConn, _GenericBackendFixture, TestCase):
         for _result in results:
             eq_(_result, NO_VALUE)
 
+    def test_get_multi_duplicates(self):
+        """
+        this tests
+            * get_multi, with duplicate and interleaved keys in one pipeline
+        """
+        backend = self._backend()
+        mixed_mapping = dict(mixed_generated)
+        backend.set_multi(mixed_mapping)
+
+        _keys = [("a", 10), 1, ("b", 9), ("a", 10), 1, ("a", 30), ("zz", 1), 99]
+        _expected = [
+            mixed_mapping[k] if k in mixed_mapping else NO_VALUE for k in _keys
+        ]
+        eq_(backend.get_multi(_keys), _expected)
+        eq_(backend.get_multi([]), [])
+
+        backend.delete_multi(keys_mixed)
+
 
 class HstoreTest_Expires_Hash(HstoreTest):
     redis_expiration_time_hash = None
@@ -543,147 +1428,1216 @@ class HstoreTest_Expires_HashTrue(HstoreTest_Expires_Hash):
             # upload the mapping
             backend.set_multi(mixed_mapping)
 
-            # grab the results
-            results = backend.get_multi(keys_mixed)
+            # grab the results
+            results = backend.get_multi(keys_mixed)
+
+            # enumerate the results, match their order to the ordered array
+            for idx, result in enumerate(results):
+                eq_(result, mixed_generated[idx][1])
+
+                key = keys_mixed[idx]
+                if isinstance(key, tuple):
+                    key = key[0]
+                    ttl = backend.client.ttl(key)
+                    assert ttl >= 9, "ttl should be larger"
+
+            time.sleep(1)
+
+        backend.delete_multi(keys_mixed)
+
+
+class HstoreTest_Expires_HashNone(HstoreTest_Expires_Hash):
+    redis_expiration_time_hash = None
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "redis_expiration_time": 10,
+            "redis_expiration_time_hash": redis_expiration_time_hash,
+        }
+    }
+
+    def test_expires_tracked(self):
+        """
+        When redis_expiration_time_hash is None, we should be setting the
+        expiry only if the key doesn't exist
+
+        to test this, we're just going to loop this a few times
+
+        the loop should reset the expiry to 3 seconds, then sleep 1s, so it will
+        always be about 5
+        """
+        backend = self._backend()
+
+        for i in range(0, 5):
+            backend.set(key_hash, cloud_value)
+            eq_(backend.get(key_hash), cloud_value)
+            time.sleep(1)
+
+        ttl = backend.client.ttl(key_hash[0])
+        assert ttl <= 6, "ttl should be <= 6"
+        assert ttl >= 4, "ttl should be <= 4"
+
+        backend.delete(key_hash)
+        eq_(backend.get(key_hash), NO_VALUE)
+
+    def test_expires_tracked_multi(self):
+        backend = self._backend()
+
+        # set up the mapping
+        mixed_mapping = dict(mixed_generated)
+
+        # loop over this a bit setting and sleeping
+        for i in range(0, 5):
+            # upload the mapping
+            backend.set_multi(mixed_mapping)
+
+            # grab the results
+            results = backend.get_multi(keys_mixed)
+            # enumerate the results, match their order to the ordered array
+            for idx, result in enumerate(results):
+                eq_(result, mixed_generated[idx][1])
+
+            time.sleep(1)
+
+        # check the ttls.  we should not have set them on the subsequent loops
+        for key in keys_mixed:
+            if isinstance(key, tuple):
+                key = key[0]
+                ttl = backend.client.ttl(key)
+                assert ttl <= 6, "ttl should be <= 6"
+                assert ttl >= 4, "ttl should be <= 4"
+
+        backend.delete_multi(keys_mixed)
+
+
+class HstoreTest_Expires_HashNoneScript(HstoreTest_Expires_HashNone):
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "redis_expiration_time": 10,
+            "redis_expiration_time_hash": None,
+            "redis_expiration_time_hash_script": True,
+        }
+    }
+
+    def test_script_flushed(self):
+        """
+        if the server loses the cached script, it must be reloaded
+        """
+        backend = self._backend()
+        assert backend._hash_script is not None
+
+        backend.client.script_flush()
+        backend.set(key_hash, cloud_value)
+        eq_(backend.get(key_hash), cloud_value)
+
+        backend.client.script_flush()
+        backend.set_multi(dict(mixed_generated))
+        results = backend.get_multi(keys_mixed)
+        for idx, result in enumerate(results):
+            eq_(result, mixed_generated[idx][1])
+        for key in keys_mixed:
+            if isinstance(key, tuple):
+                ttl = backend.client.ttl(key[0])
+                assert ttl >= 9, "ttl should be larger"
+
+        backend.delete_multi(keys_mixed)
+        backend.delete(key_hash)
+
+
+class HstoreTest_Expires_HashFalse(HstoreTest_Expires_Hash):
+    redis_expiration_time_hash = False
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "redis_expiration_time": 2,
+            "redis_expiration_time_hash": False,
+        }
+    }
+
+    def test_expires_tracked(self):
+        """
+        When redis_expiration_time_hash is False, we should be ignoring hash
+        expiry so it should always be -1.
+        """
+        backend = self._backend()
+
+        for i in range(0, 3):
+            backend.set(key_hash, cloud_value)
+            eq_(backend.get(key_hash), cloud_value)
+
+            ttl = backend.client.ttl(key_hash[0])
+            assert ttl == -1, "ttl should be -1"
+
+        backend.delete(key_hash)
+        eq_(backend.get(key_hash), NO_VALUE)
+
+    def test_expires_tracked_multi(self):
+        backend = self._backend()
+
+        # set up the mapping
+        mixed_mapping = dict(mixed_generated)
+
+        # loop over this a bit setting and sleeping
+        for i in range(0, 3):
+            # upload the mapping
+            backend.set_multi(mixed_mapping)
+
+            # grab the results
+            results = backend.get_multi(keys_mixed)
+
+            # enumerate the results, match their order to the ordered array
+            for idx, result in enumerate(results):
+                eq_(result, mixed_generated[idx][1])
+
+            # and make sure we did not set the ttl
+            for key in keys_mixed:
+                if isinstance(key, tuple):
+                    key = key[0]
+                    ttl = backend.client.ttl(key)
+                    assert ttl == -1, "ttl should be -1"
+
+            time.sleep(1)
+
+        backend.delete_multi(keys_mixed)
+
+
+class RedisAdvancedHstoreBuckets_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "hash_buckets": 8,
+        }
+    }
+
+
+class HstoreTest_Buckets(HstoreTest):
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "redis_expiration_time": 3,
+            "hash_buckets": 8,
+            "hash_buckets_prefix": "_test_hb:",
+        }
+    }
+
+    def test_bucketed(self):
+        backend = self._backend()
+        backend.set(key_string, cloud_value)
+        eq_(backend.client.exists(key_string), 0)
+
+        bucket = backend._hash_bucket(key_string)
+        assert bucket[0].startswith("_test_hb:")
+        eq_(bucket, backend._hash_bucket(key_string))
+        eq_(bucket[1], key_string)
+        eq_(backend.client.type(bucket[0]), b"hash")
+        assert backend.client.ttl(bucket[0]) > 0
+        eq_(backend.get(key_string), cloud_value)
+        eq_(backend.get(bucket), cloud_value)
+
+        _keys = ["bucketed-%s" % i for i in range(100)]
+        backend.set_multi({k: k for k in _keys})
+        _buckets = {backend._hash_bucket(k)[0] for k in _keys}
+        eq_(len(_buckets), 8)
+        eq_(sum(backend.client.exists(b) for b in _buckets), 8)
+        eq_(backend.get_multi(_keys), _keys)
+        backend.delete_multi(_keys)
+        eq_(backend.get_multi(_keys), [NO_VALUE] * len(_keys))
+
+        backend.delete(key_string)
+        eq_(backend.get(key_string), NO_VALUE)
+
+
+# ==============================================================================
+
+
+class RedisAdvancedBatched_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_Test.config_args["arguments"], multi_batch_size=2
+        )
+    }
+
+
+class RedisAdvancedHstoreBatched_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_Test.config_args["arguments"], multi_batch_size=2
+        )
+    }
+
+
+class HstoreTest_Batched(HstoreTest):
+    config_args = {
+        "arguments": dict(HstoreTest.config_args["arguments"], multi_batch_size=3)
+    }
+
+
+class RedisAdvancedBatchedTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "redis_expiration_time": 3,
+            "multi_batch_size": 4,
+        }
+    }
+
+    def test_batched(self):
+        backend = self._backend()
+        _keys = ["batched-%s" % i for i in range(10)]
+        with patch.object(backend.client, "pipeline", wraps=backend.client.pipeline):
+            backend.set_multi({k: k for k in _keys})
+            eq_(backend.client.pipeline.call_count, 3)
+
+        # duplicates are only fetched once, and in chunks of 4
+        _requested = _keys + _keys[::-1] + ["batched-missing"]
+        with patch.object(backend.client, "mget", wraps=backend.client.mget):
+            eq_(backend.get_multi(_requested), _keys + _keys[::-1] + [NO_VALUE])
+            eq_(
+                [len(c[0][0]) for c in backend.client.mget.call_args_list],
+                [4, 4, 3],
+            )
+        backend.delete_multi(_keys)
+        eq_(backend.get_multi(_keys), [NO_VALUE] * len(_keys))
+
+    def test_unbatched_duplicates(self):
+        backend = self._backend()
+        backend.multi_batch_size = None
+        backend.set_multi({"batched-a": 1, "batched-b": 2})
+        with patch.object(backend.client, "mget", wraps=backend.client.mget):
+            eq_(backend.get_multi(["batched-a", "batched-b", "batched-a"]), [1, 2, 1])
+            eq_(backend.client.mget.call_args[0][0], ["batched-a", "batched-b"])
+        backend.delete_multi(["batched-a", "batched-b"])
+
+
+class RedisAdvancedCompressed_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_Test.config_args["arguments"],
+            compression="zlib",
+            compression_threshold=0,
+        )
+    }
+
+
+class RedisAdvancedHstoreCompressed_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_Test.config_args["arguments"],
+            compression="lzma",
+            compression_threshold=0,
+        )
+    }
+
+
+def _pickle_loads_multi(values):
+    return [pickle.loads(v) for v in values]
+
+
+def _pickle_dumps_multi(values):
+    return [pickle.dumps(v) for v in values]
+
+
+class RedisAdvancedHstoreSerializeMulti_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_Test.config_args["arguments"],
+            loads_multi=_pickle_loads_multi,
+            dumps_multi=_pickle_dumps_multi,
+            compression="zlib",
+            compression_threshold=0,
+        )
+    }
+
+
+class RedisAdvancedSerializeMultiTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "redis_expiration_time": 3,
+        }
+    }
+
+    def test_serialize_multi(self):
+        loads_multi = Mock(wraps=_pickle_loads_multi)
+        dumps_multi = Mock(wraps=_pickle_dumps_multi)
+        backend = self._backend_cls(
+            dict(
+                self.config_args["arguments"],
+                loads_multi=loads_multi,
+                dumps_multi=dumps_multi,
+            )
+        )
+        _keys = ["multi-%s" % i for i in range(5)]
+        backend.set_multi({k: k.upper() for k in _keys})
+        eq_(dumps_multi.call_count, 1)
+        eq_(
+            backend.get_multi(_keys + ["multi-missing"]),
+            [k.upper() for k in _keys] + [NO_VALUE],
+        )
+        # only the hits are passed on
+        eq_(loads_multi.call_count, 1)
+        eq_(len(loads_multi.call_args[0][0]), 5)
+        # single keys still use `loads` and `dumps`
+        backend.set("multi-single", "single")
+        eq_(backend.get("multi-single"), "single")
+        eq_((loads_multi.call_count, dumps_multi.call_count), (1, 1))
+        backend.delete_multi(_keys + ["multi-single"])
+
+    def test_serializer(self):
+        backend = self._backend_cls(
+            dict(
+                self.config_args["arguments"],
+                serializer="msgpack_raw",
+            )
+        )
+        assert backend._dumps_multi is not None
+        assert backend._loads_multi is not None
+        _keys = ["multi-%s" % i for i in range(5)]
+        backend.set_multi(
+            {k: CachedValue(k, {"ct": 0, "v": value_version}) for k in _keys}
+        )
+        values = backend.get_multi(_keys)
+        eq_([v.payload for v in values], _keys)
+        # one created time for the batch
+        eq_(len({v.metadata["ct"] for v in values}), 1)
+        assert values[0].metadata["ct"] > 0
+        backend.delete_multi(_keys)
+
+    @property
+    def _backend_cls(self):
+        return _backend_loader.load(self.backend)
+
+
+class RedisAdvancedHstoreSerializeMultiTest(RedisAdvancedSerializeMultiTest):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    config_args = {
+        "arguments": dict(
+            RedisAdvancedSerializeMultiTest.config_args["arguments"],
+            hash_buckets=8,
+        )
+    }
+
+    def test_serializer(self):
+        # `msgpack_raw` can not be combined with `raw_mode`
+        backend = self._backend_cls(
+            dict(self.config_args["arguments"], serializer="msgpack", raw_mode=True)
+        )
+        _keys = ["multi-%s" % i for i in range(5)]
+        backend.set_multi(
+            {k: CachedValue(k, {"ct": 0, "v": value_version}) for k in _keys}
+        )
+        eq_([v.payload for v in backend.get_multi(_keys)], _keys)
+        backend.delete_multi(_keys)
+
+
+class RedisAdvancedSingleFlight_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_Test.config_args["arguments"], single_flight=True
+        )
+    }
+
+
+class RedisAdvancedHstoreSingleFlight_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_Test.config_args["arguments"], single_flight=True
+        )
+    }
+
+
+class RedisAdvancedSingleFlightTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "redis_expiration_time": 3,
+            "single_flight": True,
+        }
+    }
+
+    def _slow(self, backend, name):
+        # holds every request open long enough for the others to join it
+        _command = getattr(backend.client, name)
+
+        def slow(*args, **kwargs):
+            time.sleep(0.2)
+            return _command(*args, **kwargs)
+
+        return patch.object(backend.client, name, side_effect=slow)
+
+    def _concurrently(self, fn, count):
+        results = []
+        threads = [Thread(target=lambda: results.append(fn())) for i in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_get(self):
+        backend = self._backend()
+        backend.set("flight", "value")
+        with self._slow(backend, "get") as get:
+            results = self._concurrently(lambda: backend.get("flight"), 16)
+            eq_(get.call_count, 1)
+        eq_(results, ["value"] * 16)
+        eq_(backend.single_flight.stats(), {"leaders": 1, "merged": 15})
+        # the request is done, so the next read starts a new one
+        eq_(backend.get("flight"), "value")
+        eq_(backend.single_flight.leaders, 2)
+        backend.delete("flight")
+
+    def test_get_multi(self):
+        backend = self._backend()
+        _keys = ["flight-%s" % i for i in range(4)]
+        backend.set_multi({k: k for k in _keys})
+        with self._slow(backend, "mget") as mget:
+            # the batches overlap on two keys
+            results = self._concurrently(
+                lambda: backend.get_multi(_keys[:3]) + backend.get_multi(_keys[1:]),
+                4,
+            )
+        eq_(results, [_keys[:3] + _keys[1:]] * 4)
+        # every key requested from Redis was requested by a leader
+        eq_(
+            backend.single_flight.leaders,
+            sum(len(c[0][0]) for c in mget.call_args_list),
+        )
+        assert backend.single_flight.merged > 0
+        backend.delete_multi(_keys)
+
+    def test_write(self):
+        backend = self._backend()
+        backend.set("flight", "old")
+        with self._slow(backend, "get"):
+            reader = Thread(target=backend.get, args=("flight",))
+            reader.start()
+            time.sleep(0.05)
+            # the write detaches the request in flight, so this read does not
+            # join it
+            backend.set("flight", "new")
+            eq_(backend.get("flight"), "new")
+            reader.join()
+        eq_(backend.single_flight.merged, 0)
+        backend.delete("flight")
+
+    def test_error(self):
+        backend = self._backend()
+
+        def fail(key):
+            time.sleep(0.2)
+            raise ZeroDivisionError()
+
+        with patch.object(backend.client, "get", side_effect=fail):
+            errors = []
+
+            def get():
+                try:
+                    backend.get("flight")
+                except ZeroDivisionError as exc:
+                    errors.append(exc)
+
+            self._concurrently(get, 4)
+        eq_(len(errors), 4)
+        eq_(backend.single_flight.leaders, 1)
+
+    def test_async(self):
+        assert_raises_message(
+            ValueError,
+            "`single_flight` is not supported by the asyncio backends",
+            _backend_loader.load("dogpile_backend_redis_advanced_asyncio"),
+            {"single_flight": True},
+        )
+
+
+class RedisAdvancedAutoPipeline_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_Test.config_args["arguments"],
+            auto_pipeline=True,
+            single_flight=True,
+        )
+    }
+
+
+class RedisAdvancedHstoreAutoPipeline_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_Test.config_args["arguments"], auto_pipeline=True
+        )
+    }
+
+
+class RedisAdvancedAutoPipelineTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "redis_expiration_time": 3,
+            "auto_pipeline": True,
+            "auto_pipeline_max_wait": 0.05,
+        }
+    }
+
+    def test_auto_pipeline(self):
+        backend = self._backend()
+        _keys = ["pipelined-%s" % i for i in range(8)] + [("pipelined-h", "f")]
+        backend.set_multi({k: str(k) for k in _keys})
+        results = {}
+
+        def read(key):
+            results[key] = backend.get(key)
+
+        _mget = backend.client.mget
+
+        def slow_mget(*args, **kwargs):
+            time.sleep(0.1)
+            return _mget(*args, **kwargs)
+
+        with patch.object(backend.client, "mget", side_effect=slow_mget):
+            threads = [Thread(target=read, args=(k,)) for k in _keys]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        eq_(results, {k: str(k) for k in _keys})
+        eq_(backend.auto_pipeline.reads, len(_keys))
+        assert backend.auto_pipeline.batches < len(_keys)
+        eq_(backend.get("pipelined-missing"), NO_VALUE)
+        backend.delete_multi(_keys)
+
+    def test_unsupported(self):
+        for name in (
+            "dogpile_backend_redis_advanced_local",
+            "dogpile_backend_redis_advanced_asyncio",
+        ):
+            assert_raises_message(
+                ValueError,
+                "`auto_pipeline` is not supported by the",
+                _backend_loader.load(name),
+                {"auto_pipeline": True},
+            )
+
+
+class RedisAdvancedXFetch_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_Test.config_args["arguments"],
+            xfetch_expiration_time=3600,
+        )
+    }
+
+
+class RedisAdvancedHstoreXFetch_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_Test.config_args["arguments"],
+            xfetch_expiration_time=3600,
+        )
+    }
+
+
+class RedisAdvancedXFetchTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "expiration_time": 60,
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "xfetch_expiration_time": 60,
+        },
+    }
+
+    def _creator(self, calls, delay=0.2):
+        def creator():
+            calls.append(1)
+            time.sleep(delay)
+            return len(calls)
+
+        return creator
+
+    def test_cost(self):
+        reg = self._region()
+        reg.delete("xfetch")
+        calls = []
+        eq_(reg.get_or_create("xfetch", self._creator(calls)), 1)
+        cost = reg.backend.get("xfetch").metadata["d"]
+        assert 0.2 <= cost < 1
+        # a write without a miss before it has no cost
+        reg.set("xfetch", "value")
+        assert "d" not in reg.backend.get("xfetch").metadata
+
+    def test_cost_multi(self):
+        reg = self._region()
+        _keys = ["xfetch-%s" % i for i in range(3)]
+        reg.delete_multi(_keys)
+
+        def creator(*keys):
+            time.sleep(0.2)
+            return list(keys)
+
+        eq_(reg.get_or_create_multi(_keys, creator), _keys)
+        for value in reg.backend.get_multi(_keys):
+            assert 0.2 <= value.metadata["d"] < 1
+
+    def test_early(self):
+        reg = self._region(
+            config_args={
+                "arguments": dict(self.config_args["arguments"], xfetch_beta=100)
+            }
+        )
+        reg.delete("xfetch")
+        calls = []
+        creator = self._creator(calls)
+        reg.get_or_create("xfetch", creator)
+        with patch("random.random", return_value=0.0):
+            eq_(reg.get_or_create("xfetch", creator), 1)
+        eq_(reg.backend.xfetch.early, 0)
+        # -log(1e-6) * 100 is 1381 times the cost, far beyond the expiry
+        with patch("random.random", return_value=1 - 1e-6):
+            eq_(reg.get_or_create("xfetch", creator), 2)
+        eq_(reg.backend.xfetch.early, 1)
+        eq_(len(calls), 2)
+
+    def test_early_with_lock_held(self):
+        reg = self._region(
+            config_args={
+                "arguments": dict(
+                    self.config_args["arguments"],
+                    distributed_lock=True,
+                    thread_local_lock=False,
+                    lock_timeout=5,
+                    xfetch_beta=100,
+                )
+            }
+        )
+        reg.delete("xfetch")
+        reg.backend.client.delete(reg.backend._lock_name("xfetch"))
+        calls = []
+        creator = self._creator(calls)
+        reg.get_or_create("xfetch", creator)
+        mutex = reg.backend.get_mutex("xfetch")
+        assert mutex.acquire(False)
+        # someone else is regenerating it, so the current value is served
+        with patch("random.random", return_value=1 - 1e-6):
+            eq_(reg.get_or_create("xfetch", creator), 1)
+        mutex.release()
+        eq_(len(calls), 1)
+
+    def test_arguments(self):
+        for arguments in (
+            {"raw_mode": True, "redis_expiration_time": 60},
+            {"serializer": "msgpack_raw"},
+        ):
+            assert_raises_message(
+                ValueError,
+                "`xfetch_expiration_time` requires values with metadata, "
+                "so can not be used with `raw_mode` or `msgpack_raw`",
+                self._backend_cls,
+                dict(self.config_args["arguments"], **arguments),
+            )
+        assert_raises_message(
+            ValueError,
+            "`xfetch_expiration_time` is not supported by the asyncio backends",
+            _backend_loader.load("dogpile_backend_redis_advanced_asyncio"),
+            {"xfetch_expiration_time": 60},
+        )
+
+    @property
+    def _backend_cls(self):
+        return _backend_loader.load(self.backend)
+
+
+class RedisAdvancedRefreshTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "expiration_time": 1,
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "redis_expiration_time": 10,
+            "distributed_lock": True,
+            "thread_local_lock": False,
+            "lock_timeout": 5,
+        },
+    }
+
+    def setUp(self):
+        self.refresher = BackgroundRefresher(workers=2)
+        self.region_args = {"async_creation_runner": self.refresher}
+
+    def tearDown(self):
+        self.refresher.shutdown()
+        super(RedisAdvancedRefreshTest, self).tearDown()
+
+    def test_stale_while_revalidate(self):
+        reg = self._region()
+        reg.delete("refresh")
+        reg.backend.client.delete(reg.backend._lock_name("refresh"))
+        calls = []
+        gate = Lock()
+
+        def creator():
+            with gate:
+                calls.append(1)
+                return len(calls)
+
+        eq_(reg.get_or_create("refresh", creator), 1)
+        time.sleep(1.1)
+        # past its soft ttl: served at once, and refreshed in the background
+        with gate:
+            eq_(reg.get_or_create("refresh", creator), 1)
+            # the lock is held until the refresh is done, so no other
+            # caller regenerates it
+            eq_(reg.get_or_create("refresh", creator), 1)
+            assert reg.backend.client.exists(reg.backend._lock_name("refresh"))
+        self.refresher.shutdown()
+        eq_(len(calls), 2)
+        eq_(self.refresher.refreshed, 1)
+        eq_(reg.get_or_create("refresh", creator), 2)
+        assert not reg.backend.client.exists(reg.backend._lock_name("refresh"))
+
+    def test_release_from_other_thread(self):
+        backend = self._region().backend
+        backend.client.delete(backend._lock_name("refresh"))
+        mutex = backend.get_mutex("refresh")
+        assert mutex.acquire(False)
+        errors = []
+
+        def release():
+            try:
+                mutex.release()
+            except Exception as exc:
+                errors.append(exc)
+
+        t = Thread(target=release)
+        t.start()
+        t.join()
+        eq_(errors, [])
+        assert not backend.client.exists(backend._lock_name("refresh"))
+
+    def test_thread_local_default(self):
+        arguments = dict(self.config_args["arguments"])
+        del arguments["thread_local_lock"]
+        backend = self._region(config_args={"arguments": arguments}).backend
+        backend.client.delete(backend._lock_name("refresh"))
+        mutex = backend.get_mutex("refresh")
+        assert mutex.acquire(False)
+        errors = []
+
+        def release():
+            try:
+                mutex.release()
+            except Exception as exc:
+                errors.append(exc)
+
+        # the token is thread-local, so another thread can not release it
+        t = Thread(target=release)
+        t.start()
+        t.join()
+        eq_(len(errors), 1)
+        assert backend.client.exists(backend._lock_name("refresh"))
+        mutex.release()
+        assert not backend.client.exists(backend._lock_name("refresh"))
+
+
+class RedisAdvancedParallel_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_Test.config_args["arguments"],
+            compression="zlib",
+            compression_threshold=0,
+            parallel_loads="thread",
+            parallel_loads_threshold=1,
+            parallel_loads_workers=2,
+        )
+    }
+
+
+class RedisAdvancedHstoreParallel_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced_hstore"
+    config_args = {
+        "arguments": dict(
+            _Compatibility_Test.config_args["arguments"],
+            serializer="msgpack",
+            parallel_loads="process",
+            parallel_loads_threshold=1,
+            parallel_loads_workers=2,
+        )
+    }
+
+
+class RedisAdvancedCompressedTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "redis_expiration_time": 3,
+            "compression": "zlib",
+            "compression_threshold": 512,
+        }
+    }
+
+    def test_compressed(self):
+        backend = self._backend()
+        _large = "compressible " * 100
+        backend.set_multi({"compressed-small": "small", "compressed-large": _large})
+        eq_(backend.client.get("compressed-small")[:2], b"\xc1\x00")
+        _raw = backend.client.get("compressed-large")
+        eq_(_raw[:2], b"\xc1\x01")
+        assert len(_raw) < len(_large) / 5
+        eq_(
+            backend.get_multi(["compressed-small", "compressed-large"]),
+            ["small", _large],
+        )
+        stats = backend.compressor.stats()
+        eq_(stats["compressed"], 1)
+        eq_(stats["skipped"], 1)
+        eq_(stats["decompressed"], 1)
+        assert stats["ratio"] < 0.2
+
+        # values written without compression are still read
+        backend.client.set("compressed-legacy", pickle.dumps("legacy"))
+        eq_(backend.get("compressed-legacy"), "legacy")
+        backend.delete_multi(
+            ["compressed-small", "compressed-large", "compressed-legacy"]
+        )
 
-            # enumerate the results, match their order to the ordered array
-            for idx, result in enumerate(results):
-                eq_(result, mixed_generated[idx][1])
+    def test_legacy_envelope(self):
+        _arguments = dict(self.config_args["arguments"], serializer="envelope")
+        _arguments.pop("compression")
+        legacy = _backend_loader.load(self.backend)(_arguments)
+        _value = CachedValue("legacy", {"ct": 100, "v": value_version})
+        legacy.set("compressed-envelope", _value)
+        # the envelope's version byte is `\x01`
+        eq_(legacy.client.get("compressed-envelope")[:1], b"\x01")
+        backend = _backend_loader.load(self.backend)(
+            dict(_arguments, compression="zlib")
+        )
+        eq_(backend.get("compressed-envelope"), _value)
+        backend.delete("compressed-envelope")
+
+    def test_colliding_dumps(self):
+        assert_raises_message(
+            ValueError,
+            "`compression` can not be used with a `dumps` whose values can "
+            "start with 0xc1",
+            _backend_loader.load(self.backend),
+            dict(
+                self.config_args["arguments"],
+                dumps=lambda v: b"\xc1" + pickle.dumps(v),
+            ),
+        )
 
-                key = keys_mixed[idx]
-                if isinstance(key, tuple):
-                    key = key[0]
-                    ttl = backend.client.ttl(key)
-                    assert ttl >= 9, "ttl should be larger"
 
-            time.sleep(1)
+class RedisAdvancedParallelLoadsTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "redis_expiration_time": 10,
+            "raw_mode": True,
+            "compression": "zlib",
+            "parallel_loads": "process",
+            "parallel_loads_threshold": 4,
+            "parallel_loads_workers": 2,
+        }
+    }
 
-        backend.delete_multi(keys_mixed)
+    def test_parallel(self):
+        backend = self._backend()
+        _keys = ["parallel-%s" % i for i in range(5)]
+        backend.set_multi(
+            {k: CachedValue(k * 200, {"ct": 0, "v": value_version}) for k in _keys}
+        )
+        values = backend.get_multi(_keys + ["parallel-missing"])
+        eq_(backend.parallel_loader.parallel, 1)
+        eq_([v.payload for v in values[:5]], [k * 200 for k in _keys])
+        assert values[5] is NO_VALUE
+        # the batch still shares one metadata
+        eq_(len({id(v.metadata) for v in values[:5]}), 1)
+        # below the threshold
+        eq_(backend.get_multi(_keys[:3])[0].payload, _keys[0] * 200)
+        eq_(backend.parallel_loader.parallel, 1)
+        backend.delete_multi(_keys)
+
+    def test_arguments(self):
+        backend_cls = _backend_loader.load(self.backend)
+        assert_raises_message(
+            ValueError,
+            "the `process` executor requires a picklable `loads`",
+            backend_cls,
+            {"parallel_loads": "process", "loads": lambda v: v},
+        )
+        assert_raises_message(
+            ValueError,
+            "`parallel_loads` can not be used with `lazy_loads`",
+            backend_cls,
+            {"parallel_loads": "thread", "serializer": "envelope", "lazy_loads": True},
+        )
+        for backend in (
+            "dogpile_backend_redis_advanced_asyncio",
+            "dogpile_backend_redis_advanced_hstore_asyncio",
+        ):
+            assert_raises_message(
+                ValueError,
+                "`parallel_loads` is not supported by the asyncio backends",
+                _backend_loader.load(backend),
+                {"parallel_loads": "thread"},
+            )
 
 
-class HstoreTest_Expires_HashNone(HstoreTest_Expires_Hash):
-    redis_expiration_time_hash = None
+class RedisAdvancedCompressedZdictTest(
+    _TestRedisConn, _GenericBackendFixture, TestCase
+):
+    backend = "dogpile_backend_redis_advanced"
     config_args = {
         "arguments": {
             "host": REDIS_HOST,
             "port": REDIS_PORT,
             "db": 0,
             "redis_expiration_time": 10,
-            "redis_expiration_time_hash": redis_expiration_time_hash,
+            "compression": "zlib",
+            "compression_threshold": 0,
         }
     }
 
-    def test_expires_tracked(self):
-        """
-        When redis_expiration_time_hash is None, we should be setting the
-        expiry only if the key doesn't exist
+    def test_dictionary_from_scan(self):
+        backend = self._backend()
+        _records = {
+            "zdict-%s" % i: {"id": i, "email": "user-%s@example.com" % i}
+            for i in range(300)
+        }
+        backend.set_multi(_records)
+        zdict = dictionary_from_scan(
+            backend.client, match="zdict-*", samples=200, compressor=backend.compressor
+        )
+        assert zdict
 
-        to test this, we're just going to loop this a few times
+        # the dictionary is used by a region configured with it
+        _args = dict(
+            self.config_args["arguments"],
+            compression="zdict",
+            compression_dictionaries={1: zdict},
+        )
+        zbackend = _backend_loader.load(self.backend)(_args)
+        eq_(zbackend.get("zdict-1"), _records["zdict-1"])
+        zbackend.set("zdict-1", _records["zdict-1"])
+        eq_(zbackend.client.get("zdict-1")[:3], b"\xc1\x03\x01")
+        eq_(
+            zbackend.get_multi(["zdict-1", "zdict-2"]),
+            [_records["zdict-1"], _records["zdict-2"]],
+        )
+        backend.delete_multi(list(_records))
 
-        the loop should reset the expiry to 3 seconds, then sleep 1s, so it will
-        always be about 5
-        """
-        backend = self._backend()
 
-        for i in range(0, 5):
-            backend.set(key_hash, cloud_value)
-            eq_(backend.get(key_hash), cloud_value)
-            time.sleep(1)
+# ==============================================================================
 
-        ttl = backend.client.ttl(key_hash[0])
-        assert ttl <= 6, "ttl should be <= 6"
-        assert ttl >= 4, "ttl should be <= 4"
 
-        backend.delete(key_hash)
-        eq_(backend.get(key_hash), NO_VALUE)
+class _TestRedisClusterConn(_TestRedisConn):
+    """
+    these tests require a Redis Cluster; one node must be listening on
+    `DOGPILE_REDIS_CLUSTER_PORT` (7000)
+    """
 
-    def test_expires_tracked_multi(self):
-        backend = self._backend()
+    @classmethod
+    def setup_class(cls):
+        # the cluster client connects on creation
+        try:
+            super(_TestRedisClusterConn, cls).setup_class()
+        except pytest.skip.Exception:
+            raise
+        except Exception:
+            pytest.skip("redis cluster is not running")
 
-        # set up the mapping
-        mixed_mapping = dict(mixed_generated)
 
-        # loop over this a bit setting and sleeping
-        for i in range(0, 5):
-            # upload the mapping
-            backend.set_multi(mixed_mapping)
+_cluster_arguments = {
+    "host": REDIS_HOST,
+    "port": REDIS_CLUSTER_PORT,
+    "redis_expiration_time": 10,
+}
 
-            # grab the results
-            results = backend.get_multi(keys_mixed)
-            # enumerate the results, match their order to the ordered array
-            for idx, result in enumerate(results):
-                eq_(result, mixed_generated[idx][1])
 
-            time.sleep(1)
+class RedisAdvancedCluster_Compatibility_Test(
+    _TestRedisClusterConn, _Compatibility_Test
+):
+    backend = "dogpile_backend_redis_advanced_cluster"
+    config_args = {"arguments": _cluster_arguments}
 
-        # check the ttls.  we should not have set them on the subsequent loops
-        for key in keys_mixed:
-            if isinstance(key, tuple):
-                key = key[0]
-                ttl = backend.client.ttl(key)
-                assert ttl <= 6, "ttl should be <= 6"
-                assert ttl >= 4, "ttl should be <= 4"
 
-        backend.delete_multi(keys_mixed)
+class RedisAdvancedCluster_Compatibility_DistributedMutexTest(
+    _TestRedisClusterConn, _Compatibility_DistributedMutexTest
+):
+    backend = "dogpile_backend_redis_advanced_cluster"
+    config_args = {
+        "arguments": dict(_cluster_arguments, distributed_lock=True),
+    }
 
 
-class HstoreTest_Expires_HashFalse(HstoreTest_Expires_Hash):
-    redis_expiration_time_hash = False
+class RedisAdvancedCluster_Compatibility_NotifyMutexTest(
+    _TestRedisClusterConn, _Compatibility_DistributedMutexTest
+):
+    backend = "dogpile_backend_redis_advanced_cluster"
     config_args = {
-        "arguments": {
-            "host": REDIS_HOST,
-            "port": REDIS_PORT,
-            "db": 0,
-            "redis_expiration_time": 2,
-            "redis_expiration_time_hash": False,
-        }
+        "arguments": dict(_cluster_arguments, distributed_lock=True, lock_notify=True),
     }
 
-    def test_expires_tracked(self):
-        """
-        When redis_expiration_time_hash is False, we should be ignoring hash
-        expiry so it should always be -1.
-        """
+
+class RedisAdvancedClusterHstoreTest(_TestRedisClusterConn, HstoreTest):
+    backend = "dogpile_backend_redis_advanced_cluster"
+    config_args = {"arguments": _cluster_arguments}
+
+    def test_slot_grouping(self):
+        backend = self._backend()
+        _keys = ["cluster-%s" % i for i in range(50)]
+        _slotted, _hashed = backend._group_keys(_keys + [("a", 1), ("a", 2)])
+        assert len(_slotted) > 1
+        for _slot, _group in _slotted.items():
+            for _k in _group["keys"]:
+                eq_(backend.client.keyslot(_k), _slot)
+        eq_(_hashed, {"a": {"keys": [1, 2], "idx": [50, 51]}})
+
+        backend.set_multi({k: k for k in _keys})
+        eq_(backend.get_multi(_keys[::-1]), _keys[::-1])
+        backend.delete_multi(_keys)
+        eq_(backend.get_multi(_keys), [NO_VALUE] * len(_keys))
+
+
+class RedisAdvancedClusterGetOrLockTest(
+    _TestRedisClusterConn, RedisAdvancedGetOrLockTest
+):
+    backend = "dogpile_backend_redis_advanced_cluster"
+    config_args = {
+        "arguments": dict(_cluster_arguments, distributed_lock=True, lock_timeout=5),
+    }
+    # the value and its lock share a hash tag, so the script is used
+    key = "{get-or-lock}:value"
+
+    def test_other_slot(self):
+        # the lock is in another slot, so `get_or_lock` falls back to a `get`
+        # and a non-blocking acquire
+        self.key = "get-or-lock-other"
+        self.setUp()
         backend = self._backend()
+        _script, _keys, _args = backend._get_or_lock_args(self.key)
+        assert backend.client.keyslot(_keys[0]) != backend.client.keyslot(_keys[1])
+        self.test_get_or_lock()
 
-        for i in range(0, 3):
-            backend.set(key_hash, cloud_value)
-            eq_(backend.get(key_hash), cloud_value)
 
-            ttl = backend.client.ttl(key_hash[0])
-            assert ttl == -1, "ttl should be -1"
+class RedisAdvancedClusterHstoreGetOrLockTest(RedisAdvancedClusterGetOrLockTest):
+    key = ("get-or-lock-hash", "field")
 
-        backend.delete(key_hash)
-        eq_(backend.get(key_hash), NO_VALUE)
+    def test_other_slot(self):
+        pass
 
-    def test_expires_tracked_multi(self):
+
+class RedisAdvancedClusterMultiLockTest(
+    _TestRedisClusterConn, RedisAdvancedHstoreMultiLockTest
+):
+    backend = "dogpile_backend_redis_advanced_cluster"
+    config_args = {
+        "arguments": dict(_cluster_arguments, distributed_lock=True, lock_timeout=5),
+    }
+
+    def test_slots(self):
         backend = self._backend()
+        mutex = backend.get_mutex_multi(self.keys)
+        # one script call per slot
+        assert len(mutex._groups(self.keys)) > 1
 
-        # set up the mapping
-        mixed_mapping = dict(mixed_generated)
 
-        # loop over this a bit setting and sleeping
-        for i in range(0, 3):
-            # upload the mapping
-            backend.set_multi(mixed_mapping)
+class RedisAdvancedClusterLeaseLockTest(
+    _TestRedisClusterConn, RedisAdvancedLeaseLockTest
+):
+    backend = "dogpile_backend_redis_advanced_cluster"
+    config_args = {
+        "arguments": dict(
+            RedisAdvancedLeaseLockTest.config_args["arguments"],
+            port=REDIS_CLUSTER_PORT,
+        ),
+    }
 
-            # grab the results
-            results = backend.get_multi(keys_mixed)
 
-            # enumerate the results, match their order to the ordered array
-            for idx, result in enumerate(results):
-                eq_(result, mixed_generated[idx][1])
+class RedisAdvancedClusterLeaseLockTest_SameSlot(RedisAdvancedClusterLeaseLockTest):
+    # the fencing counter is in the value's slot, so the write is atomic
+    key = "{lease}:value"
 
-            # and make sure we did not set the ttl
-            for key in keys_mixed:
-                if isinstance(key, tuple):
-                    key = key[0]
-                    ttl = backend.client.ttl(key)
-                    assert ttl == -1, "ttl should be -1"
 
-            time.sleep(1)
+class RedisAdvancedClusterHstoreTest_Buckets(_TestRedisClusterConn, HstoreTest_Buckets):
+    backend = "dogpile_backend_redis_advanced_cluster"
+    config_args = {
+        "arguments": dict(
+            _cluster_arguments, hash_buckets=8, hash_buckets_prefix="_test_hb:"
+        ),
+    }
 
-        backend.delete_multi(keys_mixed)
+
+class RedisAdvancedClusterHstoreTest_Batched(_TestRedisClusterConn, HstoreTest):
+    backend = "dogpile_backend_redis_advanced_cluster"
+    config_args = {"arguments": dict(_cluster_arguments, multi_batch_size=3)}
+
+
+class RedisAdvancedClusterHstoreTest_Expires_HashNone(
+    _TestRedisClusterConn, HstoreTest_Expires_HashNone
+):
+    backend = "dogpile_backend_redis_advanced_cluster"
+    config_args = {
+        "arguments": dict(_cluster_arguments, redis_expiration_time_hash=None),
+    }
+
+
+class RedisAdvancedClusterHstoreTest_Expires_HashNoneScript(
+    _TestRedisClusterConn, HstoreTest_Expires_HashNoneScript
+):
+    backend = "dogpile_backend_redis_advanced_cluster"
+    config_args = {
+        "arguments": dict(
+            _cluster_arguments,
+            redis_expiration_time_hash=None,
+            redis_expiration_time_hash_script=True,
+        ),
+    }
 
 
 class RedisDistributedMutexCustomPrefixTest(_TestRedisConn, _GenericMutexTest):
@@ -878,3 +2832,273 @@ class RedisDistributedMutexFatalLockTest(_TestRedisConn, _GenericMutexTest):
             raise ValueError("expected an error!")
         except redis.exceptions.LockError as e:
             pass
+
+
+# ==============================================================================
+
+
+class RedisAdvancedLocalCache_Compatibility_Test(_Compatibility_Test):
+    backend = "dogpile_backend_redis_advanced_local"
+
+
+class RedisAdvancedLocalCacheTest(_TestRedisConn, _GenericBackendFixture, TestCase):
+    backend = "dogpile_backend_redis_advanced_local"
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "redis_expiration_time": 10,
+            "local_cache_max_entries": 5,
+        }
+    }
+
+    def _wait_for(self, fn, timeout=2):
+        _end = time.time() + timeout
+        while time.time() < _end:
+            if fn():
+                return True
+            time.sleep(0.01)
+        return False
+
+    def _backend_tracking(self):
+        backend = self._backend()
+        backend.get(key_string)
+        assert self._wait_for(lambda: backend.local_cache.enabled)
+        return backend
+
+    def _settle(self):
+        # let the broadcast of our own writes arrive before reading
+        time.sleep(0.1)
+
+    def test_local_hits(self):
+        backend = self._backend_tracking()
+        backend.set(key_string, cloud_value)
+        self._settle()
+        eq_(backend.get(key_string), cloud_value)
+        eq_(len(backend.local_cache), 1)
+
+        # a delete from outside the backend is broadcast
+        backend.client.delete(key_string)
+        assert self._wait_for(lambda: not len(backend.local_cache))
+        eq_(backend.get(key_string), NO_VALUE)
+
+    def test_invalidation(self):
+        backend = self._backend_tracking()
+        other = self._backend()
+        backend.set(key_string, cloud_value)
+        self._settle()
+        eq_(backend.get_multi([key_string]), [cloud_value])
+        eq_(len(backend.local_cache), 1)
+
+        # a write from another client is broadcast to the listener
+        other.set(key_string, "other value")
+        assert self._wait_for(lambda: not len(backend.local_cache))
+        eq_(backend.get(key_string), "other value")
+        backend.delete(key_string)
+
+    def test_bounded(self):
+        backend = self._backend_tracking()
+        _keys = ["local-%s" % i for i in range(10)]
+        backend.set_multi({k: k for k in _keys})
+        self._settle()
+        eq_(backend.get_multi(_keys), _keys)
+        eq_(len(backend.local_cache), 5)
+        eq_(backend.get_multi(_keys[5:]), _keys[5:])
+        eq_(backend.local_cache.hits, 5)
+        backend.delete_multi(_keys)
+        eq_(len(backend.local_cache), 0)
+
+
+def _run_async(coro):
+    # `asyncio.run` needs python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class _TestRedisConnAsync(object):
+    @classmethod
+    def _check_backend_available(cls, backend):
+        import redis.exceptions
+
+        async def _check():
+            client = backend._create_client()
+            await client.set("x", "y")
+            assert (await client.get("x")).decode("ascii") == "y"
+            await client.delete("x")
+            await client.connection_pool.disconnect()
+
+        try:
+            _run_async(_check())
+        except redis.exceptions.ConnectionError:
+            pytest.skip(
+                "redis is not running or " "otherwise not functioning correctly"
+            )
+
+
+class _AsyncTest(_TestRedisConnAsync, _GenericBackendFixture, TestCase):
+    config_args = {
+        "arguments": {
+            "host": REDIS_HOST,
+            "port": REDIS_PORT,
+            "db": 0,
+            "redis_expiration_time": 3,
+        }
+    }
+
+    def tearDown(self):
+        pass
+
+    def _run(self, coro_fn):
+        async def _wrapped():
+            backend = self._backend()
+            try:
+                await coro_fn(backend)
+            finally:
+                await backend.client.connection_pool.disconnect()
+
+        _run_async(_wrapped())
+
+    def test_backend_set_get_delete(self):
+        async def _test(backend):
+            eq_(await backend.get(key_string), NO_VALUE)
+            await backend.set(key_string, cloud_value)
+            eq_(await backend.get(key_string), cloud_value)
+            await backend.delete(key_string)
+            eq_(await backend.get(key_string), NO_VALUE)
+
+        self._run(_test)
+
+    def test_backend_multi(self):
+        async def _test(backend):
+            _keys = ["async-%s" % i for i in range(10)]
+            await backend.set_multi({k: k for k in _keys})
+            eq_(await backend.get_multi(_keys + _keys[:2]), _keys + _keys[:2])
+            await backend.delete_multi(_keys)
+            eq_(await backend.get_multi(_keys), [NO_VALUE] * len(_keys))
+            eq_(await backend.get_multi([]), [])
+
+        self._run(_test)
+
+    def test_mutex(self):
+        async def _test(backend):
+            mutex = backend.get_mutex("async-mutex")
+            assert await mutex.acquire()
+            await mutex.release()
+
+        self._run(_test)
+
+    def test_get_or_lock(self):
+        async def _test(backend):
+            await backend.delete("async-get-or-lock")
+            value, mutex = await backend.get_or_lock("async-get-or-lock")
+            eq_(value, NO_VALUE)
+            eq_(await backend.get_or_lock("async-get-or-lock"), (NO_VALUE, None))
+            await backend.set("async-get-or-lock", "value")
+            await mutex.release()
+            eq_(await backend.get_or_lock("async-get-or-lock"), ("value", None))
+            await backend.delete("async-get-or-lock")
+
+        self._run(_test)
+
+    def test_get_mutex_multi(self):
+        async def _test(backend):
+            _keys = ["async-multi-lock-%s" % i for i in range(3)]
+            await backend.client.delete(*[backend._lock_name(k) for k in _keys])
+            other = backend.get_mutex(_keys[0])
+            assert await other.acquire(blocking=False)
+            mutex = backend.get_mutex_multi(_keys)
+            eq_(await mutex.acquire(), _keys[1:])
+            await other.release()
+            eq_(await mutex.acquire(), _keys[1:] + _keys[:1])
+            await mutex.release()
+            eq_(await backend.get_mutex_multi(_keys).acquire(), _keys)
+            await backend.client.delete(*[backend._lock_name(k) for k in _keys])
+
+        self._run(_test)
+
+
+class RedisAdvancedAsyncTest(_AsyncTest):
+    backend = "dogpile_backend_redis_advanced_asyncio"
+    config_args = {
+        "arguments": dict(_AsyncTest.config_args["arguments"], distributed_lock=True)
+    }
+
+
+class RedisAdvancedAsyncBatchedTest(RedisAdvancedAsyncTest):
+    config_args = {
+        "arguments": dict(
+            RedisAdvancedAsyncTest.config_args["arguments"], multi_batch_size=3
+        )
+    }
+
+
+class RedisAdvancedHstoreAsyncTest(_AsyncTest):
+    backend = "dogpile_backend_redis_advanced_hstore_asyncio"
+    config_args = {
+        "arguments": dict(_AsyncTest.config_args["arguments"], distributed_lock=True)
+    }
+
+    def test_mixed_keys(self):
+        async def _test(backend):
+            mixed_mapping = dict(mixed_generated)
+            await backend.set_multi(mixed_mapping)
+            results = await backend.get_multi(keys_mixed)
+            for idx, result in enumerate(results):
+                eq_(result, mixed_generated[idx][1])
+            await backend.delete_multi(keys_mixed)
+            results = await backend.get_multi(keys_mixed)
+            for _result in results:
+                eq_(_result, NO_VALUE)
+
+        self._run(_test)
+
+    def test_hash_mutex(self):
+        async def _test(backend):
+            mutex = backend.get_mutex(key_hash)
+            assert await mutex.acquire()
+            locked = await backend.client.get("_lock" + ",".join(key_hash))
+            assert locked is not None
+            await mutex.release()
+
+        self._run(_test)
+
+
+class RedisAdvancedHstoreAsyncScriptTest(RedisAdvancedHstoreAsyncTest):
+    config_args = {
+        "arguments": dict(
+            RedisAdvancedHstoreAsyncTest.config_args["arguments"],
+            redis_expiration_time_hash_script=True,
+        )
+    }
+
+    def test_script_flushed(self):
+        async def _test(backend):
+            await backend.client.script_flush()
+            await backend.set_multi(dict(mixed_generated))
+            results = await backend.get_multi(keys_mixed)
+            for idx, result in enumerate(results):
+                eq_(result, mixed_generated[idx][1])
+            assert await backend.client.ttl("a") > 0
+            await backend.delete_multi(keys_mixed)
+
+        self._run(_test)
+
+
+class RedisAdvancedHstoreAsyncBucketsTest(RedisAdvancedHstoreAsyncTest):
+    config_args = {
+        "arguments": dict(
+            RedisAdvancedHstoreAsyncTest.config_args["arguments"], hash_buckets=8
+        )
+    }
+
+
+class RedisAdvancedHstoreAsyncBatchedTest(RedisAdvancedHstoreAsyncTest):
+    config_args = {
+        "arguments": dict(
+            RedisAdvancedHstoreAsyncTest.config_args["arguments"], multi_batch_size=3
+        )
+    }
@@ -0,0 +1,112 @@
+from dogpile_backend_redis_advanced.cache.refresh import BackgroundRefresher
+from . import eq_
+
+import threading
+from unittest import TestCase
+
+
+class _Cache(object):
+    def __init__(self):
+        self.values = {}
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+class _Mutex(object):
+    def __init__(self):
+        self.released = threading.Event()
+        self.thread = None
+
+    def release(self):
+        self.thread = threading.current_thread()
+        self.released.set()
+
+
+class BackgroundRefresherTest(TestCase):
+    def setUp(self):
+        self.refresher = BackgroundRefresher(workers=2, max_pending=2)
+        self.cache = _Cache()
+
+    def tearDown(self):
+        self.refresher.shutdown()
+
+    def test_refresh(self):
+        mutex = _Mutex()
+        self.refresher(self.cache, "a", lambda: "value", mutex)
+        assert mutex.released.wait(5)
+        self.refresher.shutdown()
+        eq_(self.cache.values, {"a": "value"})
+        # released by a pool thread
+        assert mutex.thread is not threading.current_thread()
+        eq_(self.refresher.stats(), {"refreshed": 1, "failed": 0, "dropped": 0})
+        eq_(self.refresher.pending, 0)
+
+    def test_failure(self):
+        def creator():
+            raise ValueError("boom")
+
+        mutex = _Mutex()
+        self.refresher(self.cache, "a", creator, mutex)
+        assert mutex.released.wait(5)
+        self.refresher.shutdown()
+        eq_(self.cache.values, {})
+        eq_(self.refresher.stats(), {"refreshed": 0, "failed": 1, "dropped": 0})
+
+    def test_failure_logged(self):
+        def creator():
+            raise ValueError("boom")
+
+        mutex = _Mutex()
+        with self.assertLogs(
+            "dogpile_backend_redis_advanced.cache.refresh", "ERROR"
+        ) as logs:
+            self.refresher(self.cache, "a", creator, mutex)
+            assert mutex.released.wait(5)
+        eq_(logs.records[0].getMessage(), "background refresh of 'a' failed")
+        # with the creator's traceback
+        eq_(logs.records[0].exc_info[0], ValueError)
+
+    def test_dropped(self):
+        gate = threading.Event()
+
+        def creator():
+            gate.wait(5)
+            return "value"
+
+        mutexes = [_Mutex() for _ in range(3)]
+        for i, mutex in enumerate(mutexes):
+            self.refresher(self.cache, i, creator, mutex)
+        # the third is over `max_pending`, and released at once
+        assert mutexes[2].released.is_set()
+        assert mutexes[2].thread is threading.current_thread()
+        eq_(self.refresher.pending, 2)
+        gate.set()
+        self.refresher.shutdown()
+        eq_(self.cache.values, {0: "value", 1: "value"})
+        eq_(self.refresher.stats(), {"refreshed": 2, "failed": 0, "dropped": 1})
+
+    def test_shutdown_in_progress(self):
+        mutex = _Mutex()
+        self.refresher(self.cache, "a", lambda: "value", mutex)
+        assert mutex.released.wait(5)
+        # a submit racing `shutdown`, which has not yet let go of the pool
+        self.refresher._pool.shutdown()
+        mutex = _Mutex()
+        self.refresher(self.cache, "b", lambda: "value", mutex)
+        assert mutex.released.is_set()
+        assert mutex.thread is threading.current_thread()
+        eq_(self.cache.values, {"a": "value"})
+        eq_(self.refresher.stats(), {"refreshed": 1, "failed": 0, "dropped": 1})
+        eq_(self.refresher.pending, 0)
+
+    def test_reset_stats(self):
+        mutex = _Mutex()
+        self.refresher(self.cache, "a", lambda: "value", mutex)
+        self.refresher.shutdown()
+        self.refresher.reset_stats()
+        eq_(self.refresher.stats(), {"refreshed": 0, "failed": 0, "dropped": 0})
+
+    def test_workers(self):
+        with self.assertRaises(ValueError):
+            BackgroundRefresher(workers=0)
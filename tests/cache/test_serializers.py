@@ -0,0 +1,221 @@
+from dogpile.cache.api import CachedValue
+from dogpile.cache.region import value_version
+from dogpile_backend_redis_advanced.cache.serializers import EnvelopeSerializer
+from dogpile_backend_redis_advanced.cache.serializers import get_serializer
+from dogpile_backend_redis_advanced.cache.serializers import LazyCachedValue
+from dogpile_backend_redis_advanced.cache.serializers import LazyDeserializer
+from dogpile_backend_redis_advanced.cache.serializers import MsgpackLazySerializer
+from dogpile_backend_redis_advanced.cache.serializers import MsgpackRawSerializer
+from dogpile_backend_redis_advanced.cache.serializers import MsgpackSerializer
+from . import eq_
+
+import datetime
+import decimal
+import pickle
+from threading import Thread
+from unittest import TestCase
+import uuid
+
+import pytest
+
+
+class MsgpackSerializerTest(TestCase):
+    payload = {
+        "string": "foo",
+        "bytes": b"\x00\xff",
+        "int": 100,
+        "list": [1, 2, 3],
+        "dict": {"a": 1, 1: "a"},
+        "datetime": datetime.datetime(2020, 2, 29, 23, 59, 59, 123456),
+        "datetime_tz": datetime.datetime(
+            1960, 1, 1, 6, tzinfo=datetime.timezone(datetime.timedelta(hours=-5))
+        ),
+        "date": datetime.date(1, 1, 1),
+        "timedelta": datetime.timedelta(days=-3, seconds=5, microseconds=7),
+        "decimal": decimal.Decimal("-12.3400"),
+        "uuid": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+    }
+
+    def test_ext_types(self):
+        serializer = MsgpackSerializer()
+        eq_(serializer.loads(serializer.dumps(self.payload)), self.payload)
+        eq_(serializer.loads(serializer.dumps({1, 2})), [1, 2])
+        with pytest.raises(TypeError):
+            serializer.dumps(object())
+        # compact: smaller than pickle
+        assert len(serializer.dumps(self.payload)) < len(pickle.dumps(self.payload))
+
+    def test_envelope(self):
+        serializer = MsgpackSerializer()
+        value = CachedValue(self.payload, {"ct": 1.5, "v": value_version})
+        loaded = serializer.loads(serializer.dumps(value))
+        assert isinstance(loaded, CachedValue)
+        eq_(loaded.payload, self.payload)
+        eq_(loaded.metadata, value.metadata)
+        # values that were not written through a region are returned as-is
+        eq_(serializer.loads(serializer.dumps("raw")), "raw")
+        eq_(serializer.loads(serializer.dumps([1, 2])), [1, 2])
+
+    def test_raw(self):
+        serializer = MsgpackRawSerializer()
+        value = CachedValue(self.payload, {"ct": 1.5, "v": value_version})
+        data = serializer.dumps(value)
+        eq_(data, MsgpackSerializer().dumps(self.payload))
+        loaded = serializer.loads(data)
+        assert isinstance(loaded, CachedValue)
+        eq_(loaded.payload, self.payload)
+        assert loaded.metadata["ct"] > 1.5
+        loaded = serializer.loads_multi(serializer.dumps_multi([value, "bare"]))
+        eq_([v.payload for v in loaded], [self.payload, "bare"])
+        eq_(loaded[0].metadata["ct"], loaded[1].metadata["ct"])
+
+    def test_threads(self):
+        serializer = MsgpackSerializer()
+        errors = []
+
+        def f(i):
+            try:
+                for j in range(500):
+                    value = {"i": i, "j": j, "s": "x" * j}
+                    eq_(serializer.loads(serializer.dumps(value)), value)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [Thread(target=f, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        eq_(errors, [])
+
+    def test_get_serializer(self):
+        loads, dumps = get_serializer("pickle")
+        eq_(loads(dumps(self.payload)), self.payload)
+        loads, dumps = get_serializer("msgpack")
+        eq_(loads(dumps(self.payload)), self.payload)
+        with pytest.raises(ValueError):
+            get_serializer("json")
+
+    def test_backend_argument(self):
+        from dogpile_backend_redis_advanced.cache.backends.redis_advanced import (
+            RedisAdvancedBackend,
+        )
+
+        backend = RedisAdvancedBackend({"serializer": "msgpack"})
+        eq_(backend.loads(backend.dumps(self.payload)), self.payload)
+        with pytest.raises(ValueError):
+            RedisAdvancedBackend({"serializer": "msgpack", "loads": pickle.loads})
+
+
+class LazyDeserializerTest(TestCase):
+    payload = dict(
+        MsgpackSerializerTest.payload,
+        nested={"date": datetime.date(2020, 1, 1), "list": [decimal.Decimal("1")]},
+        dates=[datetime.date(2020, 1, 2), {"date": datetime.date(2020, 1, 3)}],
+    )
+
+    def _loads(self, value):
+        serializer = MsgpackLazySerializer()
+        return serializer.loads(serializer.dumps(value))
+
+    def test_lazy(self):
+        loaded = self._loads(self.payload)
+        assert isinstance(loaded, LazyDeserializer)
+        # nothing is decoded until it is accessed
+        assert isinstance(dict.__getitem__(loaded, "date"), slice)
+        eq_(loaded["date"], datetime.date(1, 1, 1))
+        eq_(dict.__getitem__(loaded, "date"), datetime.date(1, 1, 1))
+        nested = loaded["nested"]
+        assert isinstance(nested, LazyDeserializer)
+        assert nested is loaded["nested"]
+        eq_(nested.get("list"), [decimal.Decimal("1")])
+        eq_(nested.get("missing", 1), 1)
+        eq_(loaded["dates"][1]["date"], datetime.date(2020, 1, 3))
+
+    def test_equal(self):
+        eq_(self._loads(self.payload), self.payload)
+        eq_(dict(self._loads(self.payload)), self.payload)
+        eq_(dict(self._loads(self.payload).items()), self.payload)
+        eq_(self._loads(self.payload).decode(), self.payload)
+        eq_(self._loads([self.payload]), [self.payload])
+        eq_(self._loads(datetime.date(2020, 1, 1)), datetime.date(2020, 1, 1))
+
+    def test_pickle(self):
+        loaded = pickle.loads(pickle.dumps(self._loads(self.payload)))
+        eq_(type(loaded), dict)
+        eq_(loaded, self.payload)
+
+    def test_envelope(self):
+        value = CachedValue(datetime.date(2020, 1, 1), {"ct": 1.5, "v": 1})
+        eq_(self._loads(value), value)
+        for name in ("msgpack_lazy", "envelope_msgpack_lazy"):
+            loads, dumps = get_serializer(name)
+            value = CachedValue(self.payload, {"ct": 1.0, "v": value_version})
+            eq_(loads(dumps(value)).payload, self.payload)
+
+
+class EnvelopeSerializerTest(TestCase):
+    value = CachedValue("a", {"ct": 1600000000.75, "v": value_version})
+
+    def test_roundtrip(self):
+        serializer = EnvelopeSerializer()
+        data = serializer.dumps(self.value)
+        eq_(len(data), 6 + len(pickle.dumps("a", pickle.HIGHEST_PROTOCOL)))
+        # less than half of the pickled `CachedValue`
+        assert len(data) < len(pickle.dumps(self.value)) / 2
+        loaded = serializer.loads(data)
+        assert isinstance(loaded, CachedValue)
+        eq_(loaded.payload, "a")
+        eq_(loaded.metadata, {"ct": 1600000000, "v": value_version})
+
+    def test_cost(self):
+        serializer = EnvelopeSerializer()
+        value = CachedValue("a", dict(self.value.metadata, d=1.2345))
+        data = serializer.dumps(value)
+        eq_(len(data), len(serializer.dumps(self.value)) + 4)
+        eq_(serializer.loads(data).metadata["d"], 1.234)
+        eq_(serializer.loads(data).payload, "a")
+        lazy = serializer.loads_lazy(data)
+        eq_(lazy.metadata["d"], 1.234)
+        eq_(lazy.payload, "a")
+
+    def test_bare(self):
+        serializer = EnvelopeSerializer()
+        eq_(serializer.loads(serializer.dumps("raw")), "raw")
+        eq_(serializer.loads(serializer.dumps(None)), None)
+
+    def test_legacy(self):
+        serializer = EnvelopeSerializer()
+        loaded = serializer.loads(pickle.dumps(self.value))
+        eq_(loaded, self.value)
+
+    def test_inner(self):
+        loads, dumps = get_serializer("envelope_msgpack")
+        value = CachedValue({"d": datetime.date(2020, 1, 1)}, self.value.metadata)
+        data = dumps(value)
+        eq_(data[6:], MsgpackSerializer().pack(value.payload))
+        eq_(loads(data).payload, value.payload)
+
+    def test_loads_lazy(self):
+        _calls = []
+
+        def loads(value):
+            _calls.append(value)
+            return pickle.loads(value)
+
+        serializer = EnvelopeSerializer(loads=loads)
+        value = serializer.loads_lazy(serializer.dumps(self.value))
+        assert isinstance(value, LazyCachedValue)
+        assert isinstance(value, CachedValue)
+        eq_(value.metadata["ct"], 1600000000)
+        eq_(_calls, [])
+        assert not value.loaded
+        eq_(value.payload, "a")
+        eq_(value[0], "a")
+        eq_(tuple(value), ("a", value.metadata))
+        eq_(len(_calls), 1)
+        assert value.loaded
+        eq_(pickle.loads(pickle.dumps(value)), ("a", value.metadata))
+
+        # bare values are not wrapped
+        eq_(serializer.loads_lazy(serializer.dumps("raw")), "raw")
@@ -0,0 +1,102 @@
+from dogpile.cache.api import CachedValue
+from dogpile.cache.api import NO_VALUE
+from dogpile.cache.region import value_version
+from dogpile_backend_redis_advanced.cache.serializers import LazyCachedValue
+from dogpile_backend_redis_advanced.cache.xfetch import XFetch
+from . import eq_
+
+import pickle
+import time
+from unittest import TestCase
+
+from mock import patch
+import pytest
+
+
+class XFetchTest(TestCase):
+    def _value(self, created, cost=None):
+        metadata = {"ct": created, "v": value_version}
+        if cost is not None:
+            metadata["d"] = cost
+        return CachedValue("value", metadata)
+
+    def test_stamp(self):
+        xfetch = XFetch(60)
+        eq_(xfetch.check("a", NO_VALUE, 100.0), NO_VALUE)
+        value = self._value(102.5)
+        xfetch.stamp("a", value)
+        eq_(value.metadata["d"], 2.5)
+        # only the first write after a miss is stamped
+        value = self._value(110.0)
+        xfetch.stamp("a", value)
+        assert "d" not in value.metadata
+
+    def test_stamp_expired(self):
+        xfetch = XFetch(60)
+        value = self._value(100.0)
+        assert xfetch.check("a", value, 170.0) is value
+        value = self._value(171.0)
+        xfetch.stamp("a", value)
+        eq_(value.metadata["d"], 1.0)
+
+    def test_no_cost(self):
+        xfetch = XFetch(60)
+        value = self._value(100.0)
+        with patch("random.random", return_value=0.999999):
+            assert xfetch.check("a", value, 159.0) is value
+        eq_(xfetch.early, 0)
+
+    def test_early(self):
+        xfetch = XFetch(60)
+        value = self._value(100.0, cost=2.0)
+        # log(1.0) is 0, so nothing is ever early
+        with patch("random.random", return_value=0.0):
+            assert xfetch.check("a", value, 159.9) is value
+        # -2 * log(0.1) is 4.6 seconds
+        with patch("random.random", return_value=0.9):
+            assert xfetch.check("a", value, 155.0) is value
+            early = xfetch.check("a", value, 156.0)
+        eq_(xfetch.early, 1)
+        eq_(early.payload, "value")
+        # dogpile sees it as expired
+        assert time.time() - early.metadata["ct"] > 60
+        eq_(value.metadata["ct"], 100.0)
+        # and keeps seeing it as expired, until it is replaced
+        with patch("random.random", return_value=0.0):
+            assert xfetch.check("a", value, 156.1) is not value
+            eq_(xfetch.early, 1)
+            assert (
+                xfetch.check("a", self._value(156.5, 2.0), 156.6).metadata["ct"]
+                == 156.5
+            )
+
+    def test_beta(self):
+        value = self._value(100.0, cost=2.0)
+        with patch("random.random", return_value=0.9):
+            assert XFetch(60, beta=0.5).check("a", value, 156.0) is value
+            assert XFetch(60, beta=2).check("a", value, 152.0) is not value
+
+    def test_lazy(self):
+        xfetch = XFetch(60)
+        value = LazyCachedValue(
+            pickle.dumps("value"), {"ct": 100.0, "d": 2.0}, pickle.loads
+        )
+        with patch("random.random", return_value=0.9):
+            early = xfetch.check("a", value, 156.0)
+        assert isinstance(early, LazyCachedValue)
+        assert not early.loaded
+        eq_(early.payload, "value")
+
+    def test_wrap(self):
+        xfetch = XFetch(60)
+        _written = {}
+        get_multi = xfetch.wrap_get_multi(lambda keys: [NO_VALUE for k in keys])
+        set_multi = xfetch.wrap_set_multi(_written.update)
+        eq_(get_multi(["a", "b"]), [NO_VALUE, NO_VALUE])
+        value = self._value(time.time() + 1)
+        set_multi({"a": value})
+        assert 0 < value.metadata["d"] <= 2
+
+    def test_expiration_time(self):
+        with pytest.raises(ValueError):
+            XFetch(0)